@@ -0,0 +1,75 @@
+"""
+Micro-benchmark comparing the cost of resolving a relative path passed to
+``read_version()`` at various call stack depths:
+
+- ``inspect.stack()``: the lookup used by read_version 0.3.x and earlier
+- ``caller frame``: the current lookup, which only touches the caller's frame
+- ``base_dir``: passing ``base_dir=``, which skips frame inspection entirely
+
+Only the resolution of the path is timed, not reading or parsing the file.
+
+Run with ``python benchmarks/caller_resolution.py``.
+"""
+
+from functools import partial
+import inspect
+import os.path
+import sys
+import timeit
+from read_version import _join_path
+
+DATA_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), os.pardir, "test", "data"
+)
+DEPTHS = [10, 100, 1000]
+NUMBER = 50
+
+
+def at_depth(depth, func):
+    if depth <= 1:
+        return func()
+    else:
+        return at_depth(depth - 1, func)
+
+
+def old_join_path(*fpath):
+    # Stands in for read_version() 0.3.x, which resolved relative paths itself
+    fpath = os.path.join(*fpath)
+    if not os.path.isabs(fpath):
+        caller_file = inspect.stack()[1][0].f_globals["__file__"]
+        fpath = os.path.join(os.path.dirname(caller_file), fpath)
+    return fpath
+
+
+def join_path(*fpath, base_dir=None):
+    # Stands in for the public function that calls `_join_path()`
+    return _join_path(fpath, base_dir, "read_version")
+
+
+def old_lookup():
+    return old_join_path("..", "test", "data", "valid", "simple.py")
+
+
+def caller_frame():
+    return join_path("..", "test", "data", "valid", "simple.py")
+
+
+def base_dir():
+    return join_path("valid", "simple.py", base_dir=DATA_DIR)
+
+
+def main():
+    sys.setrecursionlimit(max(DEPTHS) + 100)
+    print(
+        f"{'depth':>6}  {'inspect.stack()':>16}  {'caller frame':>16}  {'base_dir':>16}"
+    )
+    for depth in DEPTHS:
+        times = [
+            timeit.timeit(partial(at_depth, depth, f), number=NUMBER) / NUMBER
+            for f in (old_lookup, caller_frame, base_dir)
+        ]
+        print(f"{depth:>6}  " + "  ".join(f"{t * 1e6:>13.1f} µs" for t in times))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import py_compile
+import time
+import pytest
+
+#: Approximate sizes in bytes of the generated modules
+MODULE_SIZES = {"1KB": 1_000, "100KB": 100_000, "10MB": 10_000_000}
+
+CHUNK = '''
+
+def function_{i}(x, y={i}):
+    """Docstring for function {i}."""
+    result = [x * n for n in range(y)]
+    return {{"key_{i}": result, "nested": (x, y, "{i}")}}
+
+
+CONSTANT_{i} = ("a", {i}, [1, 2, 3])
+'''
+
+
+def generate_module(size):
+    """
+    Return the source of a module of roughly ``size`` bytes that starts with a
+    docstring, ends with assignments to ``__version__`` and (via a tuple
+    target) ``__version_info__``, and is filled with functions & constants in
+    between
+    """
+    parts = ['"""Generated module for benchmarking"""\n\nimport os\n']
+    total = len(parts[0])
+    i = 0
+    while total < size:
+        chunk = CHUNK.format(i=i)
+        parts.append(chunk)
+        total += len(chunk)
+        i += 1
+    parts.append('\n__version__ = "1.2.3"\n')
+    parts.append('__author__, __version_info__ = "Benchmark", (1, 2, 3)\n')
+    return "".join(parts)
+
+
+def write_module(path, size):
+    """
+    Write a generated module of roughly ``size`` bytes to ``path`` and compile
+    it to ``__pycache__`` for the ``"pyc"`` engine
+    """
+    path.write_text(generate_module(size))
+    py_compile.compile(str(path), doraise=True)
+
+
+@pytest.fixture(scope="session", params=list(MODULE_SIZES))
+def module_path(request, tmp_path_factory):
+    path = tmp_path_factory.mktemp("modules") / f"module_{request.param}.py"
+    write_module(path, MODULE_SIZES[request.param])
+    return str(path)
+
+
+@pytest.fixture(scope="session")
+def medium_module_path(tmp_path_factory):
+    path = tmp_path_factory.mktemp("modules") / "module_medium.py"
+    write_module(path, MODULE_SIZES["100KB"])
+    return str(path)
+
+
+@pytest.fixture
+def measure(benchmark):
+    """
+    Return a function that benchmarks ``func(*args, **kwargs)`` and returns
+    its result, limiting the number of rounds for calls that take longer than
+    a tenth of a second
+    """
+
+    def run(func, *args, **kwargs):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        if time.perf_counter() - start > 0.1:
+            benchmark.pedantic(func, args=args, kwargs=kwargs, rounds=3, iterations=1)
+        else:
+            benchmark(func, *args, **kwargs)
+        return result
+
+    return run
@@ -0,0 +1,73 @@
+"""
+Benchmarks for extracting variables from files.  Run with ``tox -e
+benchmark`` or ``pytest --no-cov benchmarks``.
+"""
+
+import sys
+import pytest
+from read_version import ENGINES, read_variables, read_version
+
+DEPTHS = [10, 100, 1000]
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_read_version(measure, module_path, engine):
+    assert measure(read_version, module_path, engine=engine) == "1.2.3"
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_read_version_first(measure, module_path, engine):
+    assert (
+        measure(read_version, module_path, engine=engine, occurrence="first") == "1.2.3"
+    )
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_tuple_target(measure, medium_module_path, engine):
+    assert measure(
+        read_version, medium_module_path, variable="__version_info__", engine=engine
+    ) == (1, 2, 3)
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_docstring(measure, medium_module_path, engine):
+    assert (
+        measure(read_version, medium_module_path, variable="__doc__", engine=engine)
+        == "Generated module for benchmarking"
+    )
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_read_variables(measure, medium_module_path, engine):
+    assert measure(
+        read_variables,
+        medium_module_path,
+        variables=["__version__", "__version_info__", "__author__", "__doc__"],
+        engine=engine,
+    ) == {
+        "__version__": "1.2.3",
+        "__version_info__": (1, 2, 3),
+        "__author__": "Benchmark",
+        "__doc__": "Generated module for benchmarking",
+    }
+
+
+def at_depth(depth, func):
+    if depth <= 1:
+        return func()
+    else:
+        return at_depth(depth - 1, func)
+
+
+def read_relative():
+    return read_version("..", "test", "data", "valid", "simple.py")
+
+
+@pytest.mark.parametrize("depth", DEPTHS)
+def test_caller_depth(measure, depth):
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(limit + depth)
+    try:
+        assert measure(at_depth, depth, read_relative) == "1.2.3"
+    finally:
+        sys.setrecursionlimit(limit)
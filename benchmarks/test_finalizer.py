@@ -0,0 +1,40 @@
+"""
+Benchmarks for the setuptools plugin.  Run with ``tox -e benchmark`` or
+``pytest --no-cov benchmarks``.
+"""
+
+import os
+from os.path import dirname, join
+from types import SimpleNamespace
+import pytest
+import read_version
+from read_version import setuptools_finalizer
+
+PROJECT_DIR = join(dirname(__file__), os.pardir, "test", "data", "projects")
+
+PROJECTS = sorted(p for p in os.listdir(PROJECT_DIR) if p.startswith("all-attribs"))
+
+pytestmark = pytest.mark.requires_toml
+
+
+def finalize():
+    dist = SimpleNamespace(metadata=SimpleNamespace())
+    setuptools_finalizer(dist)
+    return dist.metadata
+
+
+@pytest.mark.parametrize("project", PROJECTS)
+def test_finalizer(benchmark, monkeypatch, project):
+    monkeypatch.chdir(join(PROJECT_DIR, project))
+    metadata = finalize()
+    assert metadata.author in ("Joe Q. Author", "Auctor Huius")
+    # Discard the values memoized by the previous call before each round in
+    # order to measure a fresh build.
+    benchmark.pedantic(finalize, setup=read_version._finalizer_memo.clear, rounds=100)
+
+
+@pytest.mark.parametrize("project", PROJECTS)
+def test_finalizer_memoized(benchmark, monkeypatch, project):
+    monkeypatch.chdir(join(PROJECT_DIR, project))
+    finalize()
+    benchmark(finalize)
@@ -0,0 +1,21 @@
+from importlib.util import find_spec
+import pytest
+
+#: Whether a TOML parser that read_version can use is installed
+HAS_TOML = any(find_spec(modname) for modname in ("tomllib", "tomli", "toml"))
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers", "requires_toml: skip the test if no TOML parser is installed"
+    )
+    config.addinivalue_line(
+        "markers", "requires_no_toml: skip the test if a TOML parser is installed"
+    )
+
+
+def pytest_runtest_setup(item):
+    if not HAS_TOML and item.get_closest_marker("requires_toml") is not None:
+        pytest.skip("Requires toml package")
+    if HAS_TOML and item.get_closest_marker("requires_no_toml") is not None:
+        pytest.skip("Requires toml package not installed")
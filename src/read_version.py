@@ -36,20 +36,97 @@ __author_email__ = "read-version@varonathe.org"
 __license__ = "MIT"
 __url__ = "https://github.com/jwodder/read_version"
 
-import ast
-import inspect
+# Only lightweight modules are imported at the top level; everything else
+# (most notably setuptools, which takes hundreds of milliseconds to import) is
+# imported in the functions that need it.
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
 import os
 import os.path
 import sys
+from threading import Lock, local
 
-# Starting in v49.2.0, setuptools warns if distutils is imported before it.  We
-# thus need to import setuptools before distutils so that any users of this
-# library that import it before setuptools don't get a warning.
-import setuptools  # noqa: F401
+__all__ = [
+    "CacheInfo",
+    "aread_many",
+    "aread_version",
+    "cache_clear",
+    "cache_info",
+    "disable_cache",
+    "enable_cache",
+    "read_many",
+    "read_variables",
+    "read_version",
+    "read_version_revs",
+    "set_profile_hook",
+    "watch_versions",
+    "write_version",
+    "write_versions",
+]
 
-from distutils import log  # noqa
+ENGINES = ("ast", "scan", "mmap", "pyc")
 
-__all__ = ["read_version"]
+OCCURRENCES = ("first", "last")
+
+#: The number of files or projects sent to a worker process at a time by the
+#: ``read-version`` command
+CLI_CHUNKSIZE = 8
+
+#: Sentinel for keyword arguments with no default value
+_NOTHING = object()
+
+#: The default maximum number of entries in a persistent cache directory
+DISK_CACHE_MAX_ENTRIES = 10000
+
+#: Regular expression for the lightweight lexer used by the "scan" engine
+#: (compiled on first use).  It only recognizes the constructs needed to locate
+#: the starts of top-level statements: strings & comments (which are skipped
+#: over whole), brackets, backslash continuations, and lines beginning with a
+#: non-blank character in column 0.  Lines beginning with a clause keyword that
+#: continues a compound statement are not treated as statement starts.
+_LEXER_PATTERN = r"""
+    (?P<str>
+        \'\'\'[^'\\]*(?:(?:\\.|'(?!''))[^'\\]*)*\'\'\'
+      | \"\"\"[^"\\]*(?:(?:\\.|"(?!""))[^"\\]*)*\"\"\"
+      | '[^'\\\n]*(?:\\.[^'\\\n]*)*'
+      | "[^"\\\n]*(?:\\.[^"\\\n]*)*"
+    )
+    | (?P<badquote>['"])
+    | \#[^\n]*
+    | \(\) | \[\] | \{\}
+    | (?P<open>[(\[{])
+    | (?P<close>[)\]}])
+    | (?P<cont>\\\n)
+    | ^(?P<start>(?!(?:else|elif|except|finally)\b)[^\s#'"()\[\]{}\\])
+"""
+
+_lexer = None
+
+_bytes_lexer = None
+
+
+def _get_lexer():
+    global _lexer
+    if _lexer is None:
+        import re
+
+        _lexer = re.compile(_LEXER_PATTERN, flags=re.M | re.S | re.X)
+    return _lexer
+
+
+def _get_bytes_lexer():
+    """
+    Return the lexer compiled for `bytes`-like input, as used by the ``"mmap"``
+    engine
+    """
+    global _bytes_lexer
+    if _bytes_lexer is None:
+        import re
+
+        _bytes_lexer = re.compile(
+            _LEXER_PATTERN.encode("ascii"), flags=re.M | re.S | re.X
+        )
+    return _bytes_lexer
 
 
 def read_version(*fpath, **kwargs):
@@ -63,55 +140,3005 @@ def read_version(*fpath, **kwargs):
     and searches through the parse tree for any assignments to a variable named
     ``__version__``, returning the last value assigned.
 
-    The ``variable`` keyword argument can be set to the name of a variable
-    other than ``__version__`` to search for assignments to a different
-    variable instead.  Setting it to ``"__doc__"`` causes the function to
-    return the module docstring.
+    The ``variable`` keyword argument can be set to the name of a variable
+    other than ``__version__`` to search for assignments to a different
+    variable instead.  Setting it to ``"__doc__"`` causes the function to
+    return the module docstring.
+
+    If no assignments to the variable are found, a ``ValueError`` is raised.
+    To instead return a default value when this happens, set the ``default``
+    keyword argument.
+
+    The ``engine`` keyword argument selects how the file is analyzed.  The
+    default, ``"ast"``, parses the entire file with the `ast` module.
+    ``"scan"`` instead uses a lightweight lexer to locate the top-level
+    statements that mention the variable and only parses those, falling back
+    to ``"ast"`` whenever the file's structure is too unusual for the lexer.
+
+    If the ``base_dir`` keyword argument is set, relative paths are resolved
+    against it instead of against the directory containing the calling
+    script.
+
+    If the ``cache_dir`` keyword argument or the ``READ_VERSION_CACHE_DIR``
+    environment variable is set, extracted values are stored in a persistent
+    cache in the given directory, and later lookups in the same unchanged file
+    (in this or any other process) are answered from the cache without
+    parsing the file.
+
+    Setting the ``occurrence`` keyword argument to ``"first"`` causes the
+    first value assigned to the variable to be returned instead of the last.
+    In this mode, the file is read & tokenized incrementally, and reading
+    stops as soon as the first assignment is found; only the statements that
+    mention the variable are parsed.  The persistent cache is not used in
+    this mode.
+
+    A file inside a zip or tar archive (such as a wheel or sdist) can be read
+    without extracting it by passing a path of the form
+    ``ARCHIVE!/MEMBER``, e.g., ``"dist/foo-1.0.tar.gz!/foo-1.0/foo.py"``.
+    Instead of a path, the source can also be given as a single `bytes`
+    object or a file object opened in binary mode, in which case the caches
+    are not used.
+
+    If the ``rev`` keyword argument is set to a git revision (a commit hash,
+    branch, tag, etc.), the file is read as of that revision from the object
+    store of the git repository containing it, without touching the working
+    tree.  The caches are not used in this case.
+
+    The ``"mmap"`` engine reads files in bounded memory: the file is
+    memory-mapped and scanned like with ``"scan"``, but only the statements
+    that mention the variable are ever copied out of the map & parsed, and
+    reading stops as soon as the value is settled.  With this engine, the
+    ``max_bytes`` and ``max_nodes`` keyword arguments can be set to limit the
+    total size of the parsed statements and the total number of AST nodes
+    built; a ``ValueError`` is raised if a limit would be exceeded.
+
+    The ``"pyc"`` engine locates the assignment via the module's up-to-date
+    cached bytecode instead of parsing the source.  It requires Python 3.11
+    or later; on earlier versions (or without usable bytecode), it is the
+    same as ``"ast"``.
+
+    If the ``fold_constants`` keyword argument is true, an assigned value that
+    is not a literal is evaluated (without importing or executing anything)
+    as a constant expression over the literals assigned before it at the top
+    level of the file, so that values like ``".".join(map(str, VERSION_INFO))``,
+    ``"%d.%d" % (MAJOR, MINOR)``, and ``f"{MAJOR}.{MINOR}"`` can be read.
+    """
+
+    with _profile_session("read_version"):
+        fpath = _join_path(fpath, kwargs.get("base_dir"), "read_version")
+        variable = kwargs.get("variable", "__version__")
+        if "default" in kwargs:
+            defaults = {variable: kwargs["default"]}
+        else:
+            defaults = {}
+        if kwargs.get("rev") is not None:
+            fpath = _read_git_blobs(fpath, [kwargs["rev"]])[0]
+        values = _read_variables(
+            fpath,
+            [variable],
+            engine=kwargs.get("engine", "ast"),
+            cache_dir=kwargs.get("cache_dir"),
+            occurrence=kwargs.get("occurrence", "last"),
+            max_bytes=kwargs.get("max_bytes"),
+            max_nodes=kwargs.get("max_nodes"),
+            fold_constants=kwargs.get("fold_constants", False),
+        )
+        return _get_value(values, variable, defaults)
+
+
+def read_variables(
+    *fpath,
+    variables,
+    defaults=None,
+    engine="ast",
+    base_dir=None,
+    cache_dir=None,
+    occurrence="last",
+    rev=None,
+    max_bytes=None,
+    max_nodes=None,
+    fold_constants=False,
+):
+    """
+    ``read_variables()`` is like ``read_version()``, except that it reads the
+    values of multiple variables from the file at once, parsing the file only
+    a single time.  ``variables`` must be an iterable of variable names
+    (``"__doc__"`` included), and the return value is a `dict` mapping each of
+    the variable names to the last value assigned to it.
+
+    If no assignments to a variable are found, a ``ValueError`` is raised.  To
+    instead use a default value for a variable when this happens, pass a
+    `dict` mapping variable names to default values as the ``defaults``
+    keyword argument.
+
+    The ``engine``, ``base_dir``, ``cache_dir``, ``occurrence``, ``rev``,
+    ``max_bytes``, ``max_nodes``, and ``fold_constants`` keyword arguments
+    have the same meanings as for ``read_version()``.  When
+    ``occurrence`` is ``"first"``, reading stops once all of the variables
+    have been found.  Paths into archives, `bytes` objects, and binary file
+    objects are accepted as for ``read_version()``.
+    """
+
+    with _profile_session("read_variables"):
+        fpath = _join_path(fpath, base_dir, "read_variables")
+        variables = list(variables)
+        if defaults is None:
+            defaults = {}
+        if rev is not None:
+            fpath = _read_git_blobs(fpath, [rev])[0]
+        values = _read_variables(
+            fpath,
+            variables,
+            engine=engine,
+            cache_dir=cache_dir,
+            occurrence=occurrence,
+            max_bytes=max_bytes,
+            max_nodes=max_nodes,
+            fold_constants=fold_constants,
+        )
+        return {var: _get_value(values, var, defaults) for var in variables}
+
+
+def read_version_revs(
+    *fpath,
+    revs,
+    variable="__version__",
+    default=_NOTHING,
+    engine="ast",
+    base_dir=None,
+    occurrence="last",
+    fold_constants=False,
+):
+    """
+    ``read_version_revs()`` is like ``read_version()`` with the ``rev``
+    keyword argument, except that it reads the variable as of each of the git
+    revisions in the iterable ``revs``, retrieving the file at all of them
+    with a single git subprocess.  The return value is a `dict` mapping each
+    revision to the value of the variable at that revision.
+    """
+
+    with _profile_session("read_version_revs"):
+        fpath = _join_path(fpath, base_dir, "read_version_revs")
+        revs = list(revs)
+        if default is _NOTHING:
+            defaults = {}
+        else:
+            defaults = {variable: default}
+        result = {}
+        for rev, blob in zip(revs, _read_git_blobs(fpath, revs)):
+            values = _read_variables(
+                blob,
+                [variable],
+                engine,
+                occurrence=occurrence,
+                fold_constants=fold_constants,
+            )
+            result[rev] = _get_value(values, variable, defaults)
+        return result
+
+
+def read_many(paths, *, executor=None, return_exceptions=False, **kwargs):
+    """
+    ``read_many()`` is a thread-safe, synchronous counterpart to
+    ``aread_many()``: it reads a variable from each of the files in ``paths``
+    and returns a list of the values, in order.  The keyword arguments of
+    ``read_version()`` are applied to every file.  If ``executor`` (a
+    `concurrent.futures.Executor`, such as a bounded ``ThreadPoolExecutor`` or
+    ``ProcessPoolExecutor``) is given, the files are read & parsed in it
+    concurrently; otherwise, they are read one at a time in the calling
+    thread.
+
+    Requests for the same variable from the same unchanged file (as
+    determined by its path, modification time, and size) that are in flight
+    at the same time, whether made by one call or by calls in different
+    threads, share a single read & parse.
+
+    If ``return_exceptions`` is true, exceptions are returned in the list in
+    place of the values of the files that raised them; otherwise, the
+    exception for the first such file is raised once all of the files before
+    it have been read.
+    """
+
+    with _profile_session("read_many"):
+        base_dir = kwargs.get("base_dir")
+        fpaths = []
+        for p in paths:
+            fpaths.append(_join_path((p,), base_dir, "read_many"))
+        variable = kwargs.get("variable", "__version__")
+        if "default" in kwargs:
+            defaults = {variable: kwargs["default"]}
+        else:
+            defaults = {}
+        options = {
+            "engine": kwargs.get("engine", "ast"),
+            "cache_dir": kwargs.get("cache_dir"),
+            "occurrence": kwargs.get("occurrence", "last"),
+            "max_bytes": kwargs.get("max_bytes"),
+            "max_nodes": kwargs.get("max_nodes"),
+            "fold_constants": kwargs.get("fold_constants", False),
+        }
+        _check_options(
+            options["engine"],
+            options["occurrence"],
+            options["max_bytes"],
+            options["max_nodes"],
+            options["fold_constants"],
+        )
+        rev = kwargs.get("rev")
+        if rev is None:
+            # The reads may happen in other threads.
+            for fp in fpaths:
+                _record_read(fp)
+        # Mapping from keys to the futures used for them in this call, so that
+        # files listed more than once are only read once even if their first
+        # read has already finished
+        submitted = {}
+        futures = [
+            _read_shared(fp, [variable], rev, options, executor, submitted)
+            for fp in fpaths
+        ]
+        results = []
+        for future in futures:
+            try:
+                results.append(_get_value(future.result(), variable, defaults))
+            except Exception as e:
+                if not return_exceptions:
+                    raise
+                results.append(e)
+        return results
+
+
+#: Mapping from keys identifying reads (see `_read_shared()`) to the futures
+#: of the reads of them currently in flight
+_inflight = {}
+
+_inflight_lock = Lock()
+
+
+def _read_shared(fpath, variables, rev, options, executor, submitted):
+    """
+    Return a `concurrent.futures.Future` for the result of calling
+    `_read_variables()` on ``fpath``, ``variables``, and ``options`` (as of
+    the git revision ``rev``, if not `None`).  If a future for the same
+    unchanged file, variables, & options is in ``submitted`` or in flight in
+    any thread, it is returned; otherwise, the read is started in
+    ``executor`` (or run in the calling thread if ``executor`` is `None`) and
+    recorded in both.
+    """
+    from concurrent.futures import Future
+
+    if isinstance(fpath, str) and rev is None:
+        path = os.path.abspath(fpath)
+        # Keying by the signature means that a read started before the file
+        # was modified is not shared with requests made after.
+        key = (
+            path,
+            _stat_signature(path),
+            tuple(variables),
+            tuple(sorted(options.items())),
+        )
+    else:
+        # In-memory sources and git revisions are read without sharing.
+        key = None
+    if key is not None:
+        future = submitted.get(key)
+        if future is None:
+            with _inflight_lock:
+                future = _inflight.get(key)
+                owner = future is None
+                if owner:
+                    future = _inflight[key] = Future()
+        else:
+            owner = False
+        submitted[key] = future
+        if not owner:
+            _count("inflight_hits")
+            return future
+    else:
+        future = Future()
+    if rev is None:
+        func, args = _read_variables, (fpath, variables)
+    else:
+        func, args = _read_rev_variables, (fpath, rev, variables)
+    if executor is None:
+        try:
+            result = func(*args, **options)
+        except BaseException as e:
+            _settle(key, future, exception=e)
+            if not isinstance(e, Exception):
+                raise
+        else:
+            _settle(key, future, result=result)
+    else:
+        from functools import partial
+
+        try:
+            inner = executor.submit(func, *args, **options)
+        except BaseException as e:
+            _settle(key, future, exception=e)
+            raise
+        inner.add_done_callback(partial(_settle_from, key, future))
+    return future
+
+
+def _settle(key, future, result=None, exception=None):
+    """
+    Stop sharing the read identified by ``key`` (if not `None`), and then set
+    the result or exception of its future ``future``
+    """
+    if key is not None:
+        with _inflight_lock:
+            if _inflight.get(key) is future:
+                del _inflight[key]
+    if exception is not None:
+        future.set_exception(exception)
+    else:
+        future.set_result(result)
+
+
+def _settle_from(key, future, inner):
+    """
+    `_settle()` ``future`` with the outcome of the finished future ``inner``
+    """
+    from concurrent.futures import CancelledError
+
+    if inner.cancelled():
+        _settle(key, future, exception=CancelledError())
+    elif inner.exception() is not None:
+        _settle(key, future, exception=inner.exception())
+    else:
+        _settle(key, future, result=inner.result())
+
+
+def _read_rev_variables(fpath, rev, variables, **options):
+    """
+    Call `_read_variables()` on the contents of the file at ``fpath`` as of
+    the git revision ``rev``.  This is a module-level function so that it can
+    be run in a ``ProcessPoolExecutor``.
+    """
+    return _read_variables(_read_git_blobs(fpath, [rev])[0], variables, **options)
+
+
+def write_version(
+    *fpath, value, variable="__version__", base_dir=None, occurrence="last"
+):
+    """
+    ``write_version()`` is the counterpart to ``read_version()``: it finds the
+    assignment to ``variable`` whose value ``read_version()`` would return
+    (with the same ``occurrence``) in the Python source file at ``fpath``
+    (resolved the same way as for ``read_version()``) and replaces the
+    literal assigned there with ``value``, leaving the rest of the file
+    byte-for-byte unchanged.  The previous value is returned.
+
+    If the variable is one of several targets of a tuple assignment, only its
+    element of the assigned tuple or list display is replaced; if it shares
+    its value with other targets of a chained assignment, they are all
+    changed.  A ``ValueError`` is raised if the variable is not found, if the
+    current value is not a literal (or not a display that the variable is
+    unpacked from), or if ``value`` cannot be written as a literal.  String
+    values are written with the quote character of the old value where
+    possible, and the file's encoding (including any encoding declaration) is
+    preserved.  The file is replaced atomically.
+    """
+
+    with _profile_session("write_version"):
+        fpath = _join_path(fpath, base_dir, "write_version")
+        (old,) = _write_values([(fpath, value)], variable, occurrence)
+        return old
+
+
+def write_versions(
+    updates, *, variable="__version__", base_dir=None, occurrence="last"
+):
+    """
+    ``write_versions()`` is a batch form of ``write_version()``.  ``updates``
+    is a `dict` or an iterable of ``(path, value)`` pairs, and the return value
+    is a `dict` mapping each path to its previous value.  All of the files are
+    read and checked before any of them is written, so if any file cannot be
+    updated, a ``ValueError`` is raised and no files are changed.
+    """
+
+    with _profile_session("write_versions"):
+        if isinstance(updates, dict):
+            updates = updates.items()
+        paths = []
+        pairs = []
+        for p, value in updates:
+            paths.append(p)
+            pairs.append((_join_path((p,), base_dir, "write_versions"), value))
+        return dict(zip(paths, _write_values(pairs, variable, occurrence)))
+
+
+def _write_values(updates, variable, occurrence):
+    """
+    For each ``(path, value)`` pair in ``updates``, compute the new contents
+    of the file at ``path`` with the winning literal assigned to ``variable``
+    replaced by ``value``, and then, once all of the files have been checked,
+    write them.  Returns a list of the old values.
+    """
+    if occurrence not in OCCURRENCES:
+        raise ValueError(f"Invalid occurrence: {occurrence!r}")
+    plans = []
+    seen = set()
+    for fpath, value in updates:
+        if not isinstance(fpath, str):
+            raise TypeError("Only files given by paths can be written")
+        if _split_archive(fpath) is not None:
+            raise ValueError(f"{fpath}: cannot write to a file inside an archive")
+        # Replace the target of a symlink rather than the link itself.
+        path = os.path.realpath(fpath)
+        if path in seen:
+            raise ValueError(f"{fpath}: file given more than once")
+        seen.add(path)
+        with _phase("read_source"):
+            with open(path, "rb") as fp:
+                src = fp.read()
+        _count("bytes_read", len(src))
+        try:
+            start, end, old, new = _patch_span(src, variable, occurrence, value)
+        except ValueError as e:
+            raise ValueError(f"{fpath}: {e}")
+        plans.append((path, src[:start] + new + src[end:], old))
+    with _phase("write"):
+        for path, data, _ in plans:
+            _replace_file(path, data)
+    return [old for _, _, old in plans]
+
+
+def _patch_span(src, variable, occurrence, value):
+    """
+    Locate the literal that `_extract()` would evaluate for the winning
+    assignment to ``variable`` in the Python source ``src`` (a `bytes`
+    object), and return a tuple of its start & end byte offsets, its value,
+    and the encoded source of a literal for ``value`` to replace it with
+    """
+    import ast
+    import io
+    import tokenize
+
+    encoding, _ = tokenize.detect_encoding(io.BytesIO(src).readline)
+    text = src.decode(encoding)
+    with _phase("parse"):
+        _count("parses")
+        top_level = ast.parse(text)
+    # The nodes assigned to ``variable``, in order, as `(statement_index,
+    # node, index, size, starred)` tuples (see `_evaluate()`)
+    candidates = []
+    if variable == "__doc__" and ast.get_docstring(top_level, clean=False) is not None:
+        candidates.append((0, top_level.body[0].value, None, None, False))
+    for i, statement in enumerate(top_level.body):
+        if not isinstance(statement, ast.Assign):
+            continue
+        # As in `_extract()`, a later target in the same statement wins.
+        binding = None
+        for target in statement.targets:
+            for name, index, size, starred in _assignment_targets(target):
+                if name == variable:
+                    binding = (i, statement.value, index, size, starred)
+        if binding is not None:
+            candidates.append(binding)
+    if not candidates:
+        raise ValueError(f"No assignment to {variable!r} found in file")
+    stmnt_index, node, index, size, starred = candidates[
+        0 if occurrence == "first" else -1
+    ]
+    value_node = node
+    if index is not None:
+        if not isinstance(node, (ast.Tuple, ast.List)) or any(
+            isinstance(e, ast.Starred) for e in node.elts
+        ):
+            raise ValueError(
+                f"{variable!r} on line {node.lineno} is unpacked from a value"
+                " that is not a tuple or list display"
+            )
+        _check_unpack(len(node.elts), size, starred)
+        node = node.elts[index]
+    old = ast.literal_eval(node)
+    # The positions in the AST are not used, as Python versions before 3.8
+    # record neither end positions nor the correct start positions of
+    # strings spanning multiple lines.
+    with _phase("tokenize"):
+        tokens = _statement_tokens(text)[stmnt_index]
+    if isinstance(top_level.body[stmnt_index], ast.Assign):
+        # The value follows the last "=" outside of brackets.
+        equals = [
+            i for i, depth in _bracket_depths(tokens) if depth == 0 and tokens[i] == "="
+        ]
+        tokens = tokens[equals[-1] + 1 :]
+    tokens = _strip_parens(tokens, isinstance(value_node, ast.Tuple))
+    if index is not None:
+        if isinstance(value_node, ast.List) or _parenthesized(tokens):
+            tokens = tokens[1:-1]
+        elements = [[]]
+        for i, depth in _bracket_depths(tokens):
+            if depth == 0 and tokens[i] == ",":
+                elements.append([])
+            else:
+                elements[-1].append(tokens[i])
+        if not elements[-1]:
+            # A trailing comma
+            elements.pop()
+        tokens = _strip_parens(elements[index], isinstance(node, ast.Tuple))
+    start = tokens[0].start
+    end = tokens[-1].end
+    # Only the start of the file gets a byte order mark.
+    codec = "utf-8" if encoding == "utf-8-sig" else encoding
+    try:
+        new = _literal_source(value, text[start:end], repr).encode(codec)
+    except UnicodeEncodeError:
+        new = _literal_source(value, text[start:end], ascii).encode(codec)
+    # Measuring the encoded prefix (rather than assuming one byte per
+    # character) accounts for multibyte encodings and byte order marks.
+    return (
+        len(text[:start].encode(encoding)),
+        len(text[:end].encode(encoding)),
+        old,
+        new,
+    )
+
+
+class _Token(str):
+    """
+    The text of a token, with its start & end offsets in the source as the
+    ``start`` and ``end`` attributes
+    """
+
+    def __new__(cls, text, start, end):
+        token = super().__new__(cls, text)
+        token.start = start
+        token.end = end
+        return token
+
+
+def _statement_tokens(text):
+    """
+    Tokenize the Python source ``text`` (a `str`) and return a list with an
+    entry for each top-level statement, corresponding to the body of its
+    `ast.Module`: a list of the statement's tokens as `_Token` objects, not
+    including comments, line breaks, or indentation
+    """
+    import re
+    import tokenize
+
+    # Offsets of the starts of the lines; the parser treats "\r\n", "\r", and
+    # "\n" as line endings, but `tokenize` does not recognize a bare "\r", so
+    # it is passed lines ending in "\n" instead.  The lengths of the lines up
+    # to their endings (and thus all of the offsets) are unaffected.
+    line_starts = [0] + [m.end() for m in re.finditer(r"\r\n?|\n", text)]
+    lines = iter(
+        re.sub(r"\r\Z", "\n", text[a:b])
+        for a, b in zip(line_starts, line_starts[1:] + [len(text)])
+    )
+    statements = []
+    indent = 0
+    # The first token of the current logical line, or `None` at the start of
+    # a logical line
+    first = None
+    # The first token of the previous logical line at the top level
+    previous = None
+    new_statement = True
+    for tok in tokenize.generate_tokens(lambda: next(lines, "")):
+        if tok.type == tokenize.INDENT:
+            indent += 1
+        elif tok.type == tokenize.DEDENT:
+            indent -= 1
+        elif tok.type == tokenize.NEWLINE:
+            if indent == 0:
+                previous = first
+            first = None
+        elif tok.type not in (tokenize.NL, tokenize.COMMENT, tokenize.ENDMARKER):
+            if first is None:
+                first = tok.string
+                if indent == 0:
+                    # A decorated definition or a clause of a compound
+                    # statement continues the current statement.
+                    new_statement = previous != "@" and (
+                        tok.string not in _CLAUSE_KEYWORDS
+                    )
+            if new_statement:
+                statements.append([])
+                new_statement = False
+            (srow, scol), (erow, ecol) = tok.start, tok.end
+            statements[-1].append(
+                _Token(
+                    tok.string,
+                    line_starts[srow - 1] + scol,
+                    line_starts[erow - 1] + ecol,
+                )
+            )
+            if (
+                indent == 0
+                and tok.string == ";"
+                and first not in _HEADER_KEYWORDS
+                and first != "@"
+            ):
+                # The statements of a simple statement line are separate.
+                statements[-1].pop()
+                new_statement = True
+    return statements
+
+
+def _bracket_depths(tokens):
+    """
+    Yield the index of each `_Token` in ``tokens`` and the number of brackets
+    it is nested in, not counting the brackets themselves
+    """
+    depth = 0
+    for i, tok in enumerate(tokens):
+        if tok in (")", "]", "}"):
+            depth -= 1
+        yield (i, depth)
+        if tok in ("(", "[", "{"):
+            depth += 1
+
+
+def _strip_parens(tokens, is_tuple):
+    """
+    Remove the parentheses around the expression consisting of the `_Token`
+    objects ``tokens``, keeping one pair if the expression is a tuple (whose
+    position in the AST includes them)
+    """
+    while _parenthesized(tokens) and not (
+        is_tuple and not _parenthesized(tokens[1:-1])
+    ):
+        tokens = tokens[1:-1]
+    return tokens
+
+
+def _parenthesized(tokens):
+    """
+    Test whether the first of the `_Token` objects ``tokens`` is a
+    parenthesis closed by the last one
+    """
+    if len(tokens) < 2 or tokens[0] != "(" or tokens[-1] != ")":
+        return False
+    return all(
+        depth > 0 for i, depth in _bracket_depths(tokens) if 0 < i < len(tokens) - 1
+    )
+
+
+def _literal_source(value, old_source, func):
+    """
+    Return Python source for a literal evaluating to ``value`` produced with
+    ``func`` (`repr` or `ascii`), using double quotes for a string if
+    ``old_source`` (the source of the literal being replaced) does
+    """
+    import ast
+
+    source = func(value)
+    if (
+        isinstance(value, str)
+        and old_source.startswith('"')
+        and source.startswith("'")
+        and '"' not in value
+    ):
+        # `repr()` only uses single quotes for strings without any, so no
+        # quotes in the body need escaping.
+        source = f'"{source[1:-1]}"'
+    try:
+        ok = type(ast.literal_eval(source)) is type(value) and (
+            ast.literal_eval(source) == value
+        )
+    except (ValueError, SyntaxError, TypeError, MemoryError, RecursionError):
+        ok = False
+    if not ok:
+        raise ValueError(f"{value!r} cannot be written as a literal")
+    return source
+
+
+def _replace_file(path, data):
+    """
+    Atomically replace the contents of the file at ``path`` with ``data``,
+    keeping its permissions
+    """
+    import stat
+    import tempfile
+
+    dirpath, basename = os.path.split(path)
+    fd, tmppath = tempfile.mkstemp(dir=dirpath, prefix=f".{basename}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as fp:
+            fp.write(data)
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.chmod(tmppath, stat.S_IMODE(os.stat(path).st_mode))
+        os.replace(tmppath, path)
+    except BaseException:
+        try:
+            os.unlink(tmppath)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def _read_git_blobs(fpath, revs):
+    """
+    Return a list of the contents (as `bytes`) of the file at ``fpath`` in
+    a git working tree as of each of the revisions in ``revs``, retrieved from
+    the repository's object store with a single ``git cat-file --batch``
+    process
+    """
+    import errno
+    import subprocess
+
+    if not isinstance(fpath, str):
+        raise TypeError("rev can only be used with file paths")
+    dirpath, basename = os.path.split(fpath)
+    specs = []
+    for rev in revs:
+        if not rev or "\n" in rev:
+            raise ValueError(f"Invalid revision: {rev!r}")
+        # "REV:./PATH" is resolved relative to git's working directory.
+        specs.append(f"{rev}:./{basename}\n")
+    with _phase("git"):
+        r = subprocess.run(
+            ["git", "cat-file", "--batch"],
+            cwd=dirpath,
+            input="".join(specs).encode("utf-8"),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            check=True,
+        )
+    out = r.stdout
+    _count("bytes_read", len(out))
+    pos = 0
+    blobs = []
+    for rev in revs:
+        eol = out.index(b"\n", pos)
+        header = out[pos:eol]
+        pos = eol + 1
+        if header.endswith(b" missing"):
+            raise FileNotFoundError(
+                errno.ENOENT, f"No such file at revision {rev!r}", fpath
+            )
+        fields = header.split(b" ")
+        if len(fields) != 3 or fields[1] != b"blob":
+            raise ValueError(
+                f"{fpath}: not a file at revision {rev!r}:"
+                f" {header.decode('utf-8', 'replace')}"
+            )
+        size = int(fields[2])
+        blobs.append(out[pos : pos + size])
+        pos += size + 1
+    return blobs
+
+
+def aread_version(*fpath, executor=None, **kwargs):
+    """
+    ``aread_version()`` is an asynchronous version of ``read_version()``: it
+    takes the same arguments and returns an awaitable that evaluates to the
+    same value.  Blocking file & git I/O is run in the event loop's default
+    executor, and parsing is run in ``executor`` (default: the event loop's
+    default executor).
+
+    Relative paths are resolved against the directory containing the calling
+    script when ``aread_version()`` is called, not when the result is
+    awaited, so the result can be passed to `asyncio.create_task()` and the
+    like.
+    """
+
+    fpath = _join_path(fpath, kwargs.get("base_dir"), "aread_version")
+    variable = kwargs.get("variable", "__version__")
+    if "default" in kwargs:
+        defaults = {variable: kwargs["default"]}
+    else:
+        defaults = {}
+    return _aread_value(
+        fpath,
+        variable,
+        defaults,
+        engine=kwargs.get("engine", "ast"),
+        cache_dir=kwargs.get("cache_dir"),
+        occurrence=kwargs.get("occurrence", "last"),
+        rev=kwargs.get("rev"),
+        max_bytes=kwargs.get("max_bytes"),
+        max_nodes=kwargs.get("max_nodes"),
+        fold_constants=kwargs.get("fold_constants", False),
+        executor=executor,
+    )
+
+
+def aread_many(paths, *, executor=None, limit=None, return_exceptions=False, **kwargs):
+    """
+    Return an awaitable that reads a variable from each of the files in
+    ``paths`` concurrently and evaluates to a list of the values, in order.
+    The keyword arguments of ``read_version()`` are applied to every file,
+    and ``executor`` is used as for ``aread_version()``.
+
+    If ``limit`` is set, at most that many files are read at once.  If
+    ``return_exceptions`` is true, exceptions are returned in the list in
+    place of the values of the files that raised them; otherwise, the first
+    exception is raised, as with `asyncio.gather()`.
+    """
+
+    base_dir = kwargs.get("base_dir")
+    # Not a list comprehension, as that would add a stack frame (before
+    # Python 3.12) between `_join_path()` and the caller.
+    fpaths = []
+    for p in paths:
+        fpaths.append(_join_path((p,), base_dir, "aread_many"))
+    variable = kwargs.get("variable", "__version__")
+    if "default" in kwargs:
+        defaults = {variable: kwargs["default"]}
+    else:
+        defaults = {}
+    return _aread_all(
+        [
+            (
+                _aread_value,
+                (fp, variable, defaults),
+                {
+                    "engine": kwargs.get("engine", "ast"),
+                    "cache_dir": kwargs.get("cache_dir"),
+                    "occurrence": kwargs.get("occurrence", "last"),
+                    "rev": kwargs.get("rev"),
+                    "max_bytes": kwargs.get("max_bytes"),
+                    "max_nodes": kwargs.get("max_nodes"),
+                    "fold_constants": kwargs.get("fold_constants", False),
+                    "executor": executor,
+                },
+            )
+            for fp in fpaths
+        ],
+        limit,
+        return_exceptions,
+    )
+
+
+async def _aread_all(calls, limit, return_exceptions):
+    """
+    Await ``func(*args, **kwargs)`` for each ``(func, args, kwargs)`` in
+    ``calls`` concurrently, at most ``limit`` at a time, and return a list
+    of the results
+    """
+    import asyncio
+
+    if limit is None:
+        coros = [func(*args, **kw) for func, args, kw in calls]
+    else:
+        semaphore = asyncio.Semaphore(limit)
+
+        async def limited(func, args, kw):
+            async with semaphore:
+                return await func(*args, **kw)
+
+        coros = [limited(*c) for c in calls]
+    return await asyncio.gather(*coros, return_exceptions=return_exceptions)
+
+
+async def _aread_value(
+    fpath,
+    variable,
+    defaults,
+    engine,
+    cache_dir,
+    occurrence,
+    rev,
+    executor,
+    max_bytes=None,
+    max_nodes=None,
+    fold_constants=False,
+):
+    """
+    Asynchronously read the value of ``variable`` from the source ``fpath``
+    (as of the git revision ``rev``, if not `None`), running blocking I/O in
+    the event loop's default executor and parsing in ``executor``
+    """
+    import asyncio
+    from functools import partial
+
+    _check_options(engine, occurrence, max_bytes, max_nodes, fold_constants)
+    if rev is None:
+        # The reads may happen in other threads.
+        _record_read(fpath)
+    loop = asyncio.get_event_loop()
+    limits = {
+        "max_bytes": max_bytes,
+        "max_nodes": max_nodes,
+        "fold_constants": fold_constants,
+    }
+    if rev is None and (
+        occurrence == "first"
+        or engine in ("mmap", "pyc")
+        or (
+            isinstance(fpath, str)
+            and (
+                _cache is not None
+                or cache_dir is not None
+                or os.environ.get("READ_VERSION_CACHE_DIR")
+            )
+        )
+    ):
+        # Reading incrementally (including via mmap) and consulting the caches
+        # require the reads to happen where the parsing does.
+        values = await loop.run_in_executor(
+            executor,
+            partial(
+                _read_variables,
+                fpath,
+                [variable],
+                engine,
+                cache_dir,
+                occurrence,
+                **limits,
+            ),
+        )
+    else:
+        if rev is not None:
+            src = (await loop.run_in_executor(None, _read_git_blobs, fpath, [rev]))[0]
+        elif isinstance(fpath, bytes):
+            src = fpath
+        else:
+            src = await loop.run_in_executor(None, _read_source, fpath)
+        values = await loop.run_in_executor(
+            executor,
+            partial(
+                _read_variables, src, [variable], engine, None, occurrence, **limits
+            ),
+        )
+    return _get_value(values, variable, defaults)
+
+
+def _read_source(fpath):
+    """Return the contents of the source ``fpath`` as `bytes`"""
+    with _open_source(fpath) as fp:
+        return fp.read()
+
+
+def _join_path(fpath, base_dir, funcname):
+    """
+    Join the path components ``fpath`` passed to the public function
+    ``funcname`` and, if the result is relative, prepend ``base_dir`` or, if
+    that is `None`, the directory containing the script that called
+    ``funcname``.  If ``fpath`` is a single `bytes`-like object or file
+    object, it is returned as-is (as `bytes` in the former case).
+    """
+    if not fpath:
+        raise ValueError(f"No filepath passed to {funcname}()")
+    if len(fpath) == 1:
+        if isinstance(fpath[0], (bytes, bytearray, memoryview)):
+            return bytes(fpath[0])
+        elif hasattr(fpath[0], "read"):
+            return fpath[0]
+    fpath = os.path.join(*fpath)
+    if not os.path.isabs(fpath):
+        if base_dir is None:
+            with _phase("resolve_path"):
+                # Only look at the single frame we need; `inspect.stack()`
+                # builds `FrameInfo` objects (and reads source lines) for
+                # every frame on the stack.  Frame 1 is the public function,
+                # so frame 2 is its caller.
+                caller_file = sys._getframe(2).f_globals["__file__"]
+                base_dir = os.path.dirname(caller_file)
+        fpath = os.path.join(base_dir, fpath)
+    return fpath
+
+
+def _read_variables(
+    fpath,
+    variables,
+    engine="ast",
+    cache_dir=None,
+    occurrence="last",
+    max_bytes=None,
+    max_nodes=None,
+    fold_constants=False,
+):
+    """
+    Return a `dict` mapping each of the variables in ``variables`` that is
+    assigned to at the top level of the Python source ``fpath`` (a path, a
+    `bytes` object, or a binary file object) to the first or last (depending
+    on ``occurrence``) value assigned to it, consulting the persistent cache
+    in ``cache_dir`` (or ``$READ_VERSION_CACHE_DIR``) if one is configured
+    and ``fpath`` is a path.  If ``fold_constants`` is true, values that are
+    not literals are evaluated with `_fold_variables()`.
+    """
+    _check_options(engine, occurrence, max_bytes, max_nodes, fold_constants)
+    _record_read(fpath)
+    if fold_constants:
+        if not isinstance(fpath, (str, bytes)):
+            # The source may need to be read twice.
+            fpath = _read_source(fpath)
+        try:
+            return _read_variables(fpath, variables, engine, cache_dir, occurrence)
+        except ValueError:
+            # Only files with computed values pay for folding.
+            return _fold_variables(fpath, variables, occurrence)
+    limits = {"max_bytes": max_bytes, "max_nodes": max_nodes}
+    if occurrence == "first":
+        # Looking up the first assignment is already cheap, so the persistent
+        # cache (which only stores last assignments) is not used.
+        return _parse_variables(fpath, variables, engine, occurrence, **limits)
+    if not isinstance(fpath, str):
+        # In-memory sources have no signature to validate cache entries with.
+        return _parse_variables(fpath, variables, engine, **limits)
+    disk_cache = _get_disk_cache(cache_dir)
+    if disk_cache is None:
+        return _parse_variables(fpath, variables, engine, **limits)
+    path = os.path.abspath(fpath)
+    st = _stat_source(path)
+    signature = f"{st.st_dev}:{st.st_ino}:{st.st_mtime_ns}:{st.st_size}"
+    with _phase("disk_cache"):
+        values, known = disk_cache.get(path, signature, variables)
+    remaining = [var for var in variables if var not in known]
+    if remaining:
+        _count("disk_cache_misses")
+        new_values = _parse_variables(path, remaining, engine, **limits)
+        with _phase("disk_cache"):
+            disk_cache.put(path, signature, remaining, new_values)
+        values.update(new_values)
+    else:
+        _count("disk_cache_hits")
+    return values
+
+
+#: Per-thread record of the source files read; while `_recording_reads()` is
+#: active, the ``paths`` attribute holds the `set` of their absolute paths
+_read_log = local()
+
+
+@contextmanager
+def _recording_reads():
+    """
+    Context manager that records the absolute paths of the source files (or,
+    for files in archives, of the archives) that are read in the current
+    thread in its body and yields the `set` they are added to
+    """
+    outer = getattr(_read_log, "paths", None)
+    paths = set()
+    _read_log.paths = paths
+    try:
+        yield paths
+    finally:
+        _read_log.paths = outer
+        if outer is not None:
+            outer.update(paths)
+
+
+def _record_read(fpath):
+    """Record that the source ``fpath`` is read if reads are being recorded"""
+    paths = getattr(_read_log, "paths", None)
+    if paths is not None and isinstance(fpath, str):
+        split = _split_archive(fpath)
+        paths.add(os.path.abspath(fpath if split is None else split[0]))
+
+
+def _check_options(engine, occurrence, max_bytes, max_nodes, fold_constants=False):
+    """Validate the options for reading variables from a file"""
+    if engine not in ENGINES:
+        raise ValueError(f"Invalid engine: {engine!r}")
+    if occurrence not in OCCURRENCES:
+        raise ValueError(f"Invalid occurrence: {occurrence!r}")
+    if (max_bytes is not None or max_nodes is not None) and engine != "mmap":
+        raise ValueError("max_bytes and max_nodes require engine='mmap'")
+    if fold_constants and (max_bytes is not None or max_nodes is not None):
+        raise ValueError(
+            "fold_constants cannot be combined with max_bytes or max_nodes"
+        )
+
+
+def _parse_variables(
+    fpath, variables, engine, occurrence="last", max_bytes=None, max_nodes=None
+):
+    """
+    Parse the Python source ``fpath`` (a path, a `bytes` object, or a binary
+    file object) and return a `dict` mapping each of the variables in
+    ``variables`` that is assigned to at the top level of the source to the
+    first or last (depending on ``occurrence``) value assigned to it
+    """
+    import ast
+
+    cache = _cache
+    if engine == "mmap":
+        # The memory cache is bypassed, as it would hold entire parse trees.
+        return _read_bounded(fpath, variables, occurrence, max_bytes, max_nodes)
+    if engine == "pyc" and isinstance(fpath, str):
+        values = _read_bytecode(fpath, variables, occurrence)
+        if values is not None:
+            return values
+    if cache is not None and isinstance(fpath, str):
+        top_level = cache.get(fpath)
+    elif occurrence == "first":
+        return _read_first(fpath, variables)
+    else:
+        with _phase("read_source"):
+            with _open_source(fpath) as fp:
+                src = fp.read()
+        _count("bytes_read", len(src))
+        with _phase("parse"):
+            _count("parses")
+            top_level = None
+            if engine == "scan":
+                top_level = _scan(src, variables)
+            if top_level is None:
+                top_level = ast.parse(src)
+    with _phase("extract"):
+        return _extract(top_level, variables, occurrence)
+
+
+def _read_first(fpath, variables):
+    """
+    Return a `dict` mapping each of the variables in ``variables`` that is
+    assigned to at the top level of the Python source ``fpath`` (a path, a
+    `bytes` object, or a binary file object) to the first value assigned to
+    it.  The source is tokenized incrementally, one line
+    at a time, and only the top-level statements that mention one of the
+    variables are parsed; reading stops as soon as all of the variables have
+    been found.
+    """
+    import ast
+    import tokenize
+
+    remaining = set(variables)
+    result = {}
+    _count("parses")
+    with _phase("incremental_parse"), _open_source(fpath) as fp:
+        # The lines of the current statement, starting at line number `base`
+        lines = []
+        base = 1
+
+        def readline():
+            line = fp.readline()
+            lines.append(line)
+            _count("bytes_read", len(line))
+            return line
+
+        tokens = tokenize.tokenize(readline)
+        encoding = next(tokens).string
+        if encoding == "utf-8":
+            # `tokenize` reports UTF-8 sources that start with a byte order
+            # mark as plain UTF-8, but the mark is still in `lines`.
+            encoding = "utf-8-sig"
+        depth = 0
+        start = None
+        # The first two significant tokens of the current statement
+        leaders = []
+        mentions = False
+        first = True
+        try:
+            for tok in tokens:
+                if tok.type == tokenize.INDENT:
+                    depth += 1
+                elif tok.type == tokenize.DEDENT:
+                    depth -= 1
+                elif tok.type in (tokenize.NEWLINE, tokenize.ENDMARKER):
+                    if start is None:
+                        continue
+                    if depth == 0 and (mentions or (first and "__doc__" in remaining)):
+                        src = b"".join(lines[start - base : tok.end[0] - base + 1])
+                        try:
+                            body = _relocate(
+                                ast.parse(src.decode(encoding)).body, start
+                            )
+                        except SyntaxError as e:
+                            if not _is_header(leaders):
+                                # Report the line number within the file
+                                if e.lineno is not None:
+                                    e.lineno += start - 1
+                                if getattr(e, "end_lineno", None) is not None:
+                                    e.end_lineno += start - 1
+                                raise
+                            # The header of a compound statement (whose body
+                            # is not part of `src`) or a decorator
+                            body = []
+                        if not first:
+                            # Don't let a later string statement be mistaken
+                            # for the docstring.
+                            body.insert(0, ast.Pass())
+                        found = _extract(
+                            ast.Module(body=body, type_ignores=[]), remaining
+                        )
+                        result.update(found)
+                        remaining.difference_update(found)
+                        if not remaining:
+                            break
+                    if depth == 0:
+                        first = False
+                    start = None
+                    leaders = []
+                    mentions = False
+                elif tok.type not in (tokenize.NL, tokenize.COMMENT):
+                    if start is None:
+                        start = tok.start[0]
+                        del lines[: start - base]
+                        base = start
+                    if len(leaders) < 2:
+                        leaders.append(tok.string)
+                    if tok.type == tokenize.NAME and tok.string in remaining:
+                        mentions = True
+        except tokenize.TokenError as e:
+            raise SyntaxError(f"{_source_name(fpath)}: {e.args[0]}")
+    return result
+
+
+#: Keywords that can only begin the header of a compound statement or one of
+#: its clauses
+_HEADER_KEYWORDS = frozenset(
+    {
+        "async",
+        "class",
+        "def",
+        "elif",
+        "else",
+        "except",
+        "finally",
+        "for",
+        "if",
+        "try",
+        "while",
+        "with",
+    }
+)
+
+#: Keywords that begin a clause of the compound statement on the preceding
+#: lines
+_CLAUSE_KEYWORDS = frozenset({"elif", "else", "except", "finally"})
+
+#: Soft keywords that begin the header of a ``match`` statement or one of its
+#: clauses unless they are used as a name
+_SOFT_HEADER_KEYWORDS = frozenset({"match", "case"})
+
+
+def _is_header(leaders):
+    """
+    Return whether a top-level statement beginning with the tokens
+    ``leaders`` is a decorator or the header of a compound statement or
+    clause, which does not parse on its own
+    """
+    if not leaders:
+        return False
+    if leaders[0] == "@" or leaders[0] in _HEADER_KEYWORDS:
+        return True
+    if leaders[0] in _SOFT_HEADER_KEYWORDS and len(leaders) > 1:
+        # An assignment, annotation, attribute access, etc. of the name
+        follow = leaders[1]
+        return not (follow.endswith("=") or follow in (".", ":", ",", ";"))
+    return False
+
+
+#: Instructions that bind a name at the top level of a module
+_STORE_OPS = ("STORE_NAME", "STORE_GLOBAL", "DELETE_NAME", "DELETE_GLOBAL")
+
+#: Instructions that load a constant
+_CONST_OPS = ("LOAD_CONST", "LOAD_SMALL_INT")
+
+#: Instructions that return from a code object
+_RETURN_OPS = ("RETURN_VALUE", "RETURN_CONST")
+
+#: Regular expression matching the source text between the target of an
+#: assignment and a constant that is its entire value, capturing any opening
+#: parentheses (and the comments in between)
+_BEFORE_CONSTANT = rb"[ \t\f]*(?:\\\n[ \t\f]*)*=((?:\s|\\\n|\(|#[^\n]*)*)"
+
+#: Regular expression matching the source text after a constant up to the end
+#: of its statement, provided that the constant is not parenthesized
+_AFTER_CONSTANT = rb"[ \t\f]*(?:\\\n[ \t\f]*)*(?:#[^\n]*)?(?:\n|;|\Z)"
+
+#: Regular expression matching a closing parenthesis and any whitespace,
+#: comments, and line continuations before it
+_CLOSE_PAREN = rb"(?:\s|\\\n|#[^\n]*)*\)"
+
+
+def _read_bytecode(fpath, variables, occurrence):
+    """
+    Return a `dict` mapping each of the variables in ``variables`` that is
+    assigned to at the top level of the Python source file ``fpath`` to the
+    first or last (depending on ``occurrence``) value assigned to it, locating
+    the assignments via the module's cached bytecode in ``__pycache__``
+    instead of by parsing the source.  `None` is returned if there is no
+    bytecode that is up to date with the source or if any of the winning
+    assignments is not a plain ``NAME = CONSTANT`` statement at the start of a
+    line, in which case the source must be parsed instead.
+
+    The compiler folds constant expressions like ``"1" + ".0"``, which other
+    engines reject, and so the values are evaluated from the source text of
+    the constants (located via the instructions' column offsets, which
+    require Python 3.11) rather than taken from the bytecode.
+    """
+    import ast
+    import dis
+    import importlib.util
+    from itertools import accumulate
+    import marshal
+    import re
+
+    if sys.version_info < (3, 11) or _split_archive(fpath) is not None:
+        return None
+    try:
+        # The bytecode compiled with -OO lacks docstrings.
+        pyc = importlib.util.cache_from_source(fpath, optimization="")
+    except (NotImplementedError, ValueError):
+        return None
+    with _phase("read_bytecode"):
+        try:
+            with open(pyc, "rb") as fp:
+                data = fp.read()
+        except OSError:
+            return None
+        _count("bytes_read", len(data))
+        if len(data) < 16 or data[:4] != importlib.util.MAGIC_NUMBER:
+            return None
+        src = None
+        # See PEP 552 for the format of the header.
+        flags = int.from_bytes(data[4:8], "little")
+        if flags in (1, 3):
+            src = _read_source(fpath)
+            _count("bytes_read", len(src))
+            if importlib.util.source_hash(src) != data[8:16]:
+                return None
+        elif flags == 0:
+            st = os.stat(fpath)
+            if (
+                int.from_bytes(data[8:12], "little") != int(st.st_mtime) & 0xFFFFFFFF
+                or int.from_bytes(data[12:16], "little") != st.st_size & 0xFFFFFFFF
+            ):
+                return None
+        else:
+            return None
+        try:
+            code = marshal.loads(data[16:])
+            co_code = code.co_code
+        except Exception:
+            return None
+    with _phase("extract"):
+        # Every instruction (and inline cache entry, which has an opcode of
+        # zero) is two bytes, so the bytecode is searched for instructions
+        # with bytes methods rather than by decoding it with `dis`, which is
+        # much slower.
+        opcodes = co_code[::2]
+        if not any(dis.opmap[op] in opcodes for op in _RETURN_OPS if op in dis.opmap):
+            # The end of the module is unreachable (e.g., because of a
+            # top-level `raise`), so the compiler discarded the statements
+            # after that point, which the other engines still read.
+            return None
+        extended_arg = dis.opmap["EXTENDED_ARG"]
+        store_ops = [dis.opmap[op] for op in _STORE_OPS]
+        const_ops = [dis.opmap[op] for op in _CONST_OPS if op in dis.opmap]
+        # Mapping from variable names to the offsets of the winning stores
+        # and the preceding instructions
+        winners = {}
+        for var in variables:
+            try:
+                arg = code.co_names.index(var)
+            except ValueError:
+                continue
+            found = []
+            for op in store_ops:
+                # Arguments over 255 are given in preceding `EXTENDED_ARG`
+                # instructions.
+                pattern = b""
+                for shift in range((arg.bit_length() - 1) // 8 * 8, 0, -8):
+                    pattern += bytes([extended_arg, (arg >> shift) & 0xFF])
+                pattern += bytes([op, arg & 0xFF])
+                i = co_code.find(pattern)
+                while i != -1:
+                    if i % 2 == 0 and (i == 0 or co_code[i - 2] != extended_arg):
+                        found.append((i + len(pattern) - 2, op, i - 2))
+                    i = co_code.find(pattern, i + 1)
+            if not found:
+                continue
+            offset, op, prev = max(found) if occurrence == "last" else min(found)
+            if op not in store_ops[:2] or prev < 0 or co_code[prev] not in const_ops:
+                return None
+            winners[var] = (offset, prev)
+        if not winners:
+            _count("bytecode_hits")
+            return {}
+        if src is None:
+            with _phase("read_source"):
+                src = _read_source(fpath)
+            _count("bytes_read", len(src))
+        # Column offsets are in UTF-8 bytes of the decoded source.
+        text = importlib.util.decode_source(src).encode("utf-8")
+        line_ends = list(accumulate(len(line) + 1 for line in text.split(b"\n")))
+
+        def index(lineno, col):
+            return (line_ends[lineno - 2] if lineno > 1 else 0) + col
+
+        positions = list(code.co_positions())
+        before_constant = re.compile(_BEFORE_CONSTANT)
+        after_constant = re.compile(_AFTER_CONSTANT)
+        close_paren = re.compile(_CLOSE_PAREN)
+        result = {}
+        for var, (offset, prev) in winners.items():
+            store = positions[offset // 2]
+            load = positions[prev // 2]
+            if None in store or None in load:
+                return None
+            start = index(load[0], load[2])
+            end = index(load[1], load[3])
+            if var == "__doc__" and store == load:
+                # The module's docstring
+                parens = 0
+            else:
+                target = index(store[0], 0)
+                if store[2] != 0 or text[max(target - 2, 0) : target] == b"\\\n":
+                    # Possibly not a top-level statement
+                    return None
+                m = before_constant.fullmatch(text[index(store[1], store[3]) : start])
+                if m is None:
+                    return None
+                parens = re.sub(rb"#[^\n]*", b"", m.group(1)).count(b"(")
+            pos = end
+            for _ in range(parens):
+                m = close_paren.match(text, pos)
+                if m is None:
+                    return None
+                pos = m.end()
+            if after_constant.match(text, pos) is None:
+                return None
+            try:
+                result[var] = ast.literal_eval(f"({text[start:end].decode('utf-8')})")
+            except (SyntaxError, ValueError, TypeError, RecursionError):
+                # Let the caller report the error as usual.
+                return None
+    _count("bytecode_hits")
+    return result
+
+
+def _split_archive(fpath):
+    """
+    If ``fpath`` is of the form ``ARCHIVE!/MEMBER`` where ``ARCHIVE`` is an
+    existing file, return a pair of ``ARCHIVE`` and ``MEMBER`` (with forward
+    slashes as separators); otherwise, return `None`
+    """
+    i = fpath.find("!")
+    while i != -1:
+        if fpath[i + 1 : i + 2] in ("/", os.sep) and os.path.isfile(fpath[:i]):
+            return (fpath[:i], fpath[i + 2 :].replace(os.sep, "/"))
+        i = fpath.find("!", i + 1)
+    return None
+
+
+def _stat_source(fpath):
+    """
+    `os.stat()` the file at ``fpath`` or, if ``fpath`` points inside an
+    archive, the archive
+    """
+    split = _split_archive(fpath)
+    return os.stat(fpath if split is None else split[0])
+
+
+def _source_name(source):
+    """Return a name for the source ``source`` to use in error messages"""
+    if isinstance(source, str):
+        return source
+    else:
+        return getattr(source, "name", "<string>")
+
+
+@contextmanager
+def _open_source(source):
+    """
+    Open the source ``source`` (a path, possibly into an archive; a `bytes`
+    object; or a binary file object) and return a binary file object for
+    reading it.  File objects passed in by the user are not closed.
+    """
+    import io
+
+    if isinstance(source, bytes):
+        yield io.BytesIO(source)
+    elif not isinstance(source, str):
+        if isinstance(source.read(0), str):
+            raise TypeError("File object must be opened in binary mode")
+        yield source
+    else:
+        split = _split_archive(source)
+        if split is None:
+            with open(source, "rb") as fp:
+                yield fp
+        else:
+            with _open_member(*split) as fp:
+                yield fp
+
+
+@contextmanager
+def _open_member(archive, member):
+    """
+    Open the file ``member`` inside the zip or tar archive ``archive`` for
+    reading without extracting it.  For tar archives, only the archive up to
+    & including the member is read.
+    """
+    import errno
+    import tarfile
+    import zipfile
+
+    not_found = FileNotFoundError(
+        errno.ENOENT, "No such file in archive", f"{archive}!/{member}"
+    )
+    if zipfile.is_zipfile(archive):
+        with zipfile.ZipFile(archive) as zf:
+            try:
+                fp = zf.open(member)
+            except KeyError:
+                raise not_found
+            with fp:
+                yield fp
+    else:
+        try:
+            tf = tarfile.open(archive)
+        except tarfile.ReadError:
+            raise ValueError(f"{archive}: not a zip or tar archive")
+        with tf:
+            # Iterating instead of calling `getmember()` avoids decompressing
+            # the rest of the archive once the member is found.
+            names = (member, "./" + member)
+            fp = None
+            for info in tf:
+                if info.name in names:
+                    fp = tf.extractfile(info)
+                    break
+            if fp is None:
+                raise not_found
+            with fp:
+                yield fp
+
+
+#: The counters included in every profile summary
+PROFILE_COUNTERS = (
+    "bytes_read",
+    "parses",
+    "memory_cache_hits",
+    "memory_cache_misses",
+    "disk_cache_hits",
+    "disk_cache_misses",
+    "memo_hits",
+    "bytecode_hits",
+    "metadata_cache_hits",
+    "metadata_cache_misses",
+    "inflight_hits",
+)
+
+#: Per-thread profiling state; the ``profile`` attribute holds the `_Profile`
+#: for the public function call currently being profiled
+_profiling = local()
+
+_profile_hook = None
+
+
+def set_profile_hook(hook):
+    """
+    Register a callable to be passed a profile summary `dict` at the end of
+    each call to ``read_version()``, ``read_variables()``,
+    ``read_version_revs()``, or the setuptools plugin, replacing any previous
+    hook.  Pass `None` to unregister the hook.
+    """
+    global _profile_hook
+    _profile_hook = hook
+
+
+class _Profile:
+    """Timings & counters collected during a single profiled operation"""
+
+    def __init__(self, operation):
+        import time
+
+        self.operation = operation
+        self.clock = time.perf_counter
+        self.start = self.clock()
+        self.phases = {}
+        self.counters = dict.fromkeys(PROFILE_COUNTERS, 0)
+        self.error = None
+
+    def summary(self):
+        summary = {
+            "operation": self.operation,
+            "total_seconds": self.clock() - self.start,
+            "phases": self.phases,
+            "counters": self.counters,
+        }
+        if self.error is not None:
+            summary["error"] = self.error
+        return summary
+
+
+class _ProfileSession:
+    """
+    Context manager that profiles the code in its body and reports the
+    results
+    """
+
+    def __init__(self, operation):
+        self.profile = _Profile(operation)
+
+    def __enter__(self):
+        _profiling.profile = self.profile
+
+    def __exit__(self, exc_type, exc_value, _tb):
+        _profiling.profile = None
+        if exc_type is None:
+            _report_profile(self.profile.summary())
+            return
+        self.profile.error = f"{exc_type.__name__}: {exc_value}"
+        try:
+            _report_profile(self.profile.summary())
+        except Exception as e:
+            # Let the operation's own error propagate instead.
+            _get_log().warn("read_version: could not report profile: %s", e)
+
+
+class _PhaseTimer:
+    """Context manager that adds the time spent in its body to a phase"""
+
+    __slots__ = ("profile", "phase", "start")
+
+    def __init__(self, profile, phase):
+        self.profile = profile
+        self.phase = phase
+
+    def __enter__(self):
+        self.start = self.profile.clock()
+
+    def __exit__(self, _exc_type, _exc_value, _tb):
+        phases = self.profile.phases
+        phases[self.phase] = (
+            phases.get(self.phase, 0.0) + self.profile.clock() - self.start
+        )
+
+
+class _NoProfile:
+    """Context manager that does nothing, used when profiling is disabled"""
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, _exc_type, _exc_value, _tb):
+        pass
+
+
+_NO_PROFILE = _NoProfile()
+
+
+def _profile_session(operation):
+    """
+    Return a context manager that profiles ``operation`` if profiling is
+    enabled (by ``$READ_VERSION_PROFILE``, ``$READ_VERSION_PROFILE_FILE``, or
+    a profile hook) and another operation is not already being profiled
+    """
+    if getattr(_profiling, "profile", None) is not None or not (
+        _profile_hook is not None
+        or os.environ.get("READ_VERSION_PROFILE", "0") not in ("", "0")
+        or os.environ.get("READ_VERSION_PROFILE_FILE")
+    ):
+        return _NO_PROFILE
+    return _ProfileSession(operation)
+
+
+def _phase(name):
+    """
+    Return a context manager that times its body as part of the phase
+    ``name`` of the current profile, if any
+    """
+    profile = getattr(_profiling, "profile", None)
+    if profile is None:
+        return _NO_PROFILE
+    return _PhaseTimer(profile, name)
+
+
+def _count(counter, n=1):
+    """Add ``n`` to ``counter`` in the current profile, if any"""
+    profile = getattr(_profiling, "profile", None)
+    if profile is not None:
+        profile.counters[counter] += n
+
+
+def _report_profile(summary):
+    """
+    Write the profile summary ``summary`` as a line of JSON to standard error
+    (if ``$READ_VERSION_PROFILE`` is set) and/or to the end of the file
+    ``$READ_VERSION_PROFILE_FILE`` (if set), and pass it to the profile hook
+    (if any)
+    """
+    import json
+
+    if os.environ.get("READ_VERSION_PROFILE", "0") not in ("", "0"):
+        print(json.dumps(summary), file=sys.stderr)
+    profile_file = os.environ.get("READ_VERSION_PROFILE_FILE")
+    if profile_file:
+        try:
+            with open(profile_file, "a", encoding="utf-8") as fp:
+                print(json.dumps(summary), file=fp)
+        except OSError as e:
+            # Failing to record the profile must not fail (or mask the error
+            # of) the profiled operation.
+            _get_log().warn("read_version: could not write profile: %s", e)
+    if _profile_hook is not None:
+        _profile_hook(summary)
+
+
+CacheInfo = namedtuple("CacheInfo", "hits misses maxsize currsize")
+
+
+class _ParseCache:
+    """
+    An LRU cache of the top-level assignment tables of parsed files, keyed by
+    absolute path and validated against each file's modification time & size
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = Lock()
+
+    def get(self, fpath):
+        import ast
+
+        key = os.path.abspath(fpath)
+        st = _stat_source(key)
+        signature = (st.st_mtime_ns, st.st_size)
+        with self.lock:
+            try:
+                entry_sig, table = self.entries[key]
+            except KeyError:
+                pass
+            else:
+                if entry_sig == signature:
+                    self.hits += 1
+                    self.entries.move_to_end(key)
+                    _count("memory_cache_hits")
+                    return table
+            self.misses += 1
+        _count("memory_cache_misses")
+        # The file is parsed outside of the lock so that parses of different
+        # files can proceed concurrently.  As the signature was taken before
+        # reading, a modification made in the meantime will be noticed on the
+        # next lookup.
+        with _phase("read_source"):
+            with _open_source(key) as fp:
+                src = fp.read()
+        _count("bytes_read", len(src))
+        with _phase("parse"):
+            _count("parses")
+            table = _assignment_table(ast.parse(src))
+        with self.lock:
+            self.entries[key] = (signature, table)
+            self.entries.move_to_end(key)
+            if self.maxsize is not None:
+                while len(self.entries) > self.maxsize:
+                    self.entries.popitem(last=False)
+        return table
+
+    def info(self):
+        with self.lock:
+            return CacheInfo(self.hits, self.misses, self.maxsize, len(self.entries))
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+_cache = None
+
+
+def enable_cache(maxsize=128):
+    """
+    Enable a process-wide cache of parsed files, used by all subsequent calls
+    to ``read_version()`` and ``read_variables()``.  Each file's top-level
+    assignments are stored along with the file's modification time and size,
+    so that repeated lookups in an unchanged file only cost a single
+    ``os.stat()`` call.  At most ``maxsize`` files are cached, with the least
+    recently used files evicted first; if ``maxsize`` is `None`, the cache can
+    grow without bound.
+
+    When the cache is enabled, files are always parsed in full (regardless of
+    the ``engine`` argument) so that the cached entries can serve lookups of
+    any variable.
+
+    Calling this function when the cache is already enabled changes the size
+    bound while keeping any entries that still fit.
+    """
+    global _cache
+    if maxsize is not None and maxsize < 0:
+        maxsize = 0
+    if _cache is None:
+        _cache = _ParseCache(maxsize)
+    else:
+        with _cache.lock:
+            _cache.maxsize = maxsize
+            if maxsize is not None:
+                while len(_cache.entries) > maxsize:
+                    _cache.entries.popitem(last=False)
+
+
+def disable_cache():
+    """Disable and discard the process-wide cache of parsed files"""
+    global _cache
+    _cache = None
+
+
+def cache_info():
+    """
+    Return a ``CacheInfo`` named tuple of the hits, misses, maximum size, and
+    current size of the process-wide cache of parsed files.  If the cache is
+    not enabled, `None` is returned.
+    """
+    cache = _cache
+    return None if cache is None else cache.info()
+
+
+def cache_clear():
+    """
+    Empty the process-wide cache of parsed files and reset its statistics, and
+    forget the memoized results of constant folding
+    """
+    cache = _cache
+    if cache is not None:
+        cache.clear()
+    with _fold_memo_lock:
+        _fold_memo.clear()
+
+
+class _DiskCache:
+    """
+    A persistent cache of extracted values, stored in an SQLite database so
+    that it can be shared between processes.  Entries are keyed by absolute
+    path & variable name and are only used if the file's device, inode,
+    modification time, and size are unchanged.  SQLite transactions keep the
+    database consistent when multiple processes use it at once.
+    """
+
+    FILENAME = "read_version-cache.sqlite3"
+
+    def __init__(self, dirpath, max_entries):
+        import sqlite3
+
+        self.Error = sqlite3.Error
+        self.max_entries = max_entries
+        self.lock = Lock()
+        os.makedirs(dirpath, exist_ok=True)
+        self.db = sqlite3.connect(
+            os.path.join(dirpath, self.FILENAME),
+            timeout=30,
+            check_same_thread=False,
+        )
+        with self.db:
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS extracted ("
+                " path TEXT NOT NULL,"
+                " variable TEXT NOT NULL,"
+                " signature TEXT NOT NULL,"
+                " value TEXT,"
+                " stored REAL NOT NULL,"
+                " PRIMARY KEY (path, variable)"
+                ")"
+            )
+            self.db.execute(
+                "CREATE INDEX IF NOT EXISTS extracted_stored ON extracted (stored)"
+            )
+
+    def get(self, path, signature, variables):
+        """
+        Return a `dict` of the cached values of ``variables`` in the file at
+        ``path`` along with the `set` of variables for which the cache knows
+        the outcome (including variables known not to be assigned to)
+        """
+        import ast
+
+        values = {}
+        known = set()
+        try:
+            with self.lock:
+                rows = self.db.execute(
+                    "SELECT variable, value FROM extracted"
+                    " WHERE path = ? AND signature = ?",
+                    (path, signature),
+                ).fetchall()
+        except self.Error as e:
+            _get_log().debug("read_version: could not read from cache: %s", e)
+            return values, known
+        for var, value in rows:
+            if var in variables:
+                known.add(var)
+                if value is not None:
+                    values[var] = ast.literal_eval(value)
+        return values, known
+
+    def put(self, path, signature, variables, values):
+        """
+        Store the outcome of looking up ``variables`` in the file at ``path``,
+        evicting the oldest entries if the cache grows too large
+        """
+        import ast
+        import time
+
+        now = time.time()
+        rows = []
+        for var in variables:
+            if var in values:
+                value = repr(values[var])
+                # Values that do not survive a round trip through `repr()`
+                # (e.g., infinite floats) are not cached.
+                try:
+                    if ast.literal_eval(value) != values[var]:
+                        continue
+                except (SyntaxError, ValueError):
+                    continue
+            else:
+                value = None
+            rows.append((path, var, signature, value, now))
+        try:
+            with self.lock, self.db:
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO extracted"
+                    " (path, variable, signature, value, stored)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    rows,
+                )
+                self.db.execute(
+                    "DELETE FROM extracted WHERE rowid IN ("
+                    " SELECT rowid FROM extracted ORDER BY stored DESC"
+                    " LIMIT -1 OFFSET ?"
+                    ")",
+                    (self.max_entries,),
+                )
+        except self.Error as e:
+            _get_log().debug("read_version: could not write to cache: %s", e)
+
+
+_disk_caches = {}
+_disk_caches_lock = Lock()
+
+
+def _get_disk_cache(cache_dir):
+    """
+    Return the `_DiskCache` for ``cache_dir`` (defaulting to
+    ``$READ_VERSION_CACHE_DIR``), or `None` if no directory is configured or
+    the cache cannot be opened
+    """
+    if cache_dir is None:
+        cache_dir = os.environ.get("READ_VERSION_CACHE_DIR")
+        if not cache_dir:
+            return None
+    cache_dir = os.path.abspath(cache_dir)
+    with _disk_caches_lock:
+        try:
+            return _disk_caches[cache_dir]
+        except KeyError:
+            pass
+        try:
+            max_entries = int(
+                os.environ.get("READ_VERSION_CACHE_MAX_ENTRIES", DISK_CACHE_MAX_ENTRIES)
+            )
+        except ValueError:
+            max_entries = DISK_CACHE_MAX_ENTRIES
+        try:
+            disk_cache = _DiskCache(cache_dir, max_entries)
+        except Exception as e:
+            _get_log().warn(
+                "read_version: could not open cache in %s: %s", cache_dir, e
+            )
+            disk_cache = None
+        _disk_caches[cache_dir] = disk_cache
+        return disk_cache
+
+
+def _assignment_table(top_level):
+    """
+    Return an `ast.Module` containing only the statements of ``top_level``
+    that `_extract()` looks at: the top-level assignments and the candidate
+    docstring
+    """
+    import ast
+
+    body = [
+        statement
+        for i, statement in enumerate(top_level.body)
+        if isinstance(statement, ast.Assign)
+        or (i == 0 and isinstance(statement, ast.Expr))
+    ]
+    return ast.Module(body=body, type_ignores=[])
+
+
+def _scan(src, variables):
+    """
+    Locate the top-level statements in the Python source ``src`` (a `bytes`
+    object) that mention any of ``variables`` without parsing the whole file,
+    and return an `ast.Module` containing just those statements (plus the
+    module docstring, if ``"__doc__"`` is requested).  If the lexer encounters
+    anything it cannot handle, `None` is returned, and the caller should parse
+    the whole file instead.
+    """
+    import ast
+    from bisect import bisect_right
+    import io
+    import re
+    import tokenize
+
+    try:
+        encoding, _ = tokenize.detect_encoding(io.BytesIO(src).readline)
+        text = src.decode(encoding)
+    except (SyntaxError, UnicodeDecodeError):
+        return None
+    try:
+        starts = list(_statement_starts(_get_lexer(), text))
+    except _LexError:
+        return None
+    # Position 0 is always treated as the start of a statement so that any
+    # leading docstring or comments are included in the first span.
+    if not starts or starts[0] != 0:
+        starts.insert(0, 0)
+    spans = set()
+    if "__doc__" in variables:
+        # A docstring with a string prefix starts a span of its own after any
+        # leading comments.
+        if len(starts) > 1 and _skip_trivia(text, 0, starts[1]) == starts[1]:
+            spans.add(1)
+        else:
+            spans.add(0)
+    if variables:
+        rgx = r"\b(?:{})\b".format("|".join(map(re.escape, variables)))
+        for m in re.finditer(rgx, text):
+            spans.add(bisect_right(starts, m.start()) - 1)
+    starts.append(len(text))
+    body = []
+    for i in sorted(spans):
+        try:
+            stmnts = ast.parse(text[starts[i] : starts[i + 1]]).body
+        except SyntaxError:
+            return None
+        # Report line numbers (e.g., in errors from `literal_eval()`) within
+        # the file rather than the span
+        body.extend(_relocate(stmnts, _line_number(text, starts[i])))
+    return ast.Module(body=body, type_ignores=[])
+
+
+def _skip_trivia(src, start=0, end=None):
+    """
+    Return the offset of the first character in ``src[start:end]`` (where
+    ``src`` is a `str` or a `bytes`-like object) that is not whitespace, part
+    of a comment, or (for `bytes` at offset 0) a UTF-8 byte order mark, or
+    ``end`` if there is no such character
+    """
+    if end is None:
+        end = len(src)
+    if isinstance(src, str):
+        space, comment, cr, lf = " \t\n\r\f\v", "#", "\r", "\n"
+    else:
+        space, comment, cr, lf = b" \t\n\r\f\v", b"#", b"\r", b"\n"
+        if start == 0 and src[:3] == b"\xef\xbb\xbf":
+            start = 3
+    pos = start
+    while pos < end:
+        c = src[pos : pos + 1]
+        if c == comment:
+            # Comments end at the end of the line, whether it is terminated by
+            # LF, CR LF, or a bare CR.
+            eol = src.find(lf, pos, end)
+            if eol == -1:
+                eol = end
+            cr_pos = src.find(cr, pos, eol)
+            pos = eol if cr_pos == -1 else cr_pos
+        elif c in space:
+            pos += 1
+        else:
+            return pos
+    return end
+
+
+def _line_number(src, offset):
+    """
+    Return the (1-based) number of the line of the Python source ``src`` (a
+    `str` or `bytes`-like object) that contains offset ``offset``
+    """
+    import re
+
+    rgx = re.compile(r"\r\n?|\n" if isinstance(src, str) else rb"\r\n?|\n")
+    return 1 + sum(1 for _ in rgx.finditer(src, 0, offset))
+
+
+def _relocate(body, lineno):
+    """
+    Shift the line numbers of the statements ``body``, parsed from a span of
+    source starting on line ``lineno``, so that they refer to the whole file
+    """
+    import ast
+
+    if lineno > 1:
+        for stmnt in body:
+            ast.increment_lineno(stmnt, lineno - 1)
+    return body
+
+
+class _LexError(Exception):
+    """Raised when the lexer encounters something it cannot handle"""
+
+
+def _statement_starts(lexer, src):
+    """
+    Yield the offsets in ``src`` (a `str`, or a `bytes`-like object for the
+    `bytes` lexer) of the starts of the top-level statements, as located by
+    the lexer ``lexer``.  Raises `_LexError` if the lexer encounters anything
+    it cannot handle.
+    """
+    depth = 0
+    cont_end = None
+    decorated = False
+    for m in lexer.finditer(src):
+        kind = m.lastgroup
+        if kind == "start":
+            if depth == 0 and m.start() != cont_end:
+                if decorated:
+                    # The line is part of the decorated definition that the
+                    # current span started with.
+                    decorated = m.group() in ("@", b"@")
+                else:
+                    yield m.start()
+                    decorated = m.group() in ("@", b"@")
+        elif kind == "open":
+            depth += 1
+        elif kind == "close":
+            depth -= 1
+            if depth < 0:
+                raise _LexError()
+        elif kind == "cont":
+            cont_end = m.end()
+        elif kind == "badquote":
+            raise _LexError()
+    if depth != 0:
+        raise _LexError()
+
+
+@contextmanager
+def _open_buffer(source):
+    """
+    Return a read-only `bytes`-like view of the source ``source``: a
+    memory map for files on disk (including file objects backed by one and
+    positioned at the start), and the contents as `bytes` otherwise
+    """
+    import io
+    import mmap
+
+    if isinstance(source, str) and _split_archive(source) is None:
+        with open(source, "rb") as fp:
+            if os.fstat(fp.fileno()).st_size == 0:
+                # Empty files cannot be mapped.
+                yield b""
+            else:
+                with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    yield mm
+        return
+    if not isinstance(source, (str, bytes)):
+        try:
+            fd = source.fileno()
+            # Like the other engines, read from the current position, which
+            # a map of the whole file would not respect
+            at_start = source.tell() == 0
+        except (AttributeError, OSError, io.UnsupportedOperation):
+            pass
+        else:
+            if at_start and os.fstat(fd).st_size > 0:
+                with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as mm:
+                    yield mm
+                return
+    yield _read_source(source)
+
+
+def _mention_spans(buf, variables):
+    """
+    Lazily yield a ``(start, end, names)`` triple for each top-level
+    statement in the Python source ``buf`` (a `bytes`-like object) that
+    mentions any of ``variables`` (plus the first statement if ``"__doc__"``
+    is requested), in order, where ``start`` and ``end`` are the statement's
+    offsets and ``names`` is the set of variables it mentions.  Only the
+    statements currently being examined are kept in memory.  Raises
+    `_LexError` if the lexer encounters anything it cannot handle.
+    """
+    import re
+
+    rgx = r"\b(?:{})\b".format("|".join(map(re.escape, variables)))
+    mentions = re.finditer(rgx.encode("utf-8"), buf)
+    mention = next(mentions, None)
+    current = 0
+    # The variables mentioned by the statement beginning at `current`
+    names = {"__doc__"} & set(variables)
+    for start in _statement_starts(_get_bytes_lexer(), buf):
+        if start == 0:
+            continue
+        while mention is not None and mention.start() < start:
+            names.add(mention.group().decode("utf-8"))
+            mention = next(mentions, None)
+        following = set()
+        if (
+            current == 0
+            and "__doc__" in names
+            and _skip_trivia(buf, 0, start) == start
+        ):
+            # A docstring with a string prefix starts a statement of its own
+            # after any leading comments.
+            names.discard("__doc__")
+            following.add("__doc__")
+        if names:
+            yield (current, start, names)
+        current = start
+        names = following
+    while mention is not None:
+        names.add(mention.group().decode("utf-8"))
+        mention = next(mentions, None)
+    if names:
+        yield (current, len(buf), names)
+
+
+def _read_bounded(fpath, variables, occurrence, max_bytes, max_nodes):
+    """
+    Implementation of the ``"mmap"`` engine: memory-map the Python source
+    ``fpath`` and return a `dict` mapping each of the variables in
+    ``variables`` that is assigned to at the top level of the source to the
+    first or last (depending on ``occurrence``) value assigned to it, parsing
+    at most ``max_bytes`` bytes of source into at most ``max_nodes`` AST
+    nodes.  If the lexer cannot handle the file, the whole file is parsed if
+    it is no larger than ``max_bytes``; as nodes can only be counted after
+    the whole file has been parsed, the file is refused if ``max_nodes`` is
+    set without ``max_bytes``.
+    """
+    import ast
+
+    with _open_buffer(fpath) as buf:
+        try:
+            return _extract_bounded(
+                _source_name(fpath), buf, variables, occurrence, max_bytes, max_nodes
+            )
+        except (_LexError, SyntaxError, UnicodeDecodeError):
+            # Fall back to parsing the whole file below, outside of the
+            # `except` clause so that the traceback (which references the
+            # lexer's matches on the map) is released before the map is
+            # closed.
+            pass
+        if max_bytes is None and max_nodes is not None:
+            raise ValueError(
+                f"{_source_name(fpath)}: cannot be scanned, and max_nodes"
+                " cannot be enforced when parsing the whole file unless"
+                " max_bytes is also set"
+            )
+        if max_bytes is not None and len(buf) > max_bytes:
+            raise ValueError(
+                f"{_source_name(fpath)}: cannot be scanned and is larger than"
+                f" max_bytes ({max_bytes})"
+            )
+        _count("bytes_read", len(buf))
+        with _phase("parse"):
+            _count("parses")
+            top_level = ast.parse(bytes(buf))
+            if max_nodes is not None:
+                _check_nodes(fpath, top_level, max_nodes)
+    with _phase("extract"):
+        return _extract(top_level, variables, occurrence)
+
+
+def _extract_bounded(name, buf, variables, occurrence, max_bytes, max_nodes):
+    """
+    Parse the top-level statements in the `bytes`-like object ``buf`` (the
+    contents of the source ``name``) that
+    mention any of ``variables`` one at a time, starting from the end if
+    ``occurrence`` is ``"last"``, until the values of all of the variables
+    are settled
+    """
+    import ast
+    import tokenize
+
+    pos = 0
+
+    def readline():
+        nonlocal pos
+        end = buf.find(b"\n", pos)
+        end = len(buf) if end == -1 else end + 1
+        line = buf[pos:end]
+        pos = end
+        return line
+
+    encoding, _ = tokenize.detect_encoding(readline)
+    remaining = set(variables)
+    result = {}
+    parsed_bytes = 0
+    nodes = 0
+    # Statements starting after this offset cannot be the docstring.
+    first_start = _skip_trivia(buf)
+    span_iter = _mention_spans(buf, variables)
+    try:
+        if occurrence == "last":
+            spans = reversed(list(span_iter))
+        else:
+            spans = span_iter
+        for start, end, names in spans:
+            if remaining.isdisjoint(names):
+                continue
+            parsed_bytes += end - start
+            if max_bytes is not None and parsed_bytes > max_bytes:
+                raise ValueError(
+                    f"{name}: reading the variables requires parsing more than"
+                    f" max_bytes ({max_bytes}) bytes"
+                )
+            _count("bytes_read", end - start)
+            with _phase("parse"):
+                _count("parses")
+                body = _relocate(
+                    ast.parse(buf[start:end].decode(encoding)).body,
+                    _line_number(buf, start),
+                )
+                if max_nodes is not None:
+                    nodes += sum(len(list(ast.walk(stmnt))) for stmnt in body)
+                    if nodes > max_nodes:
+                        raise ValueError(
+                            f"{name}: reading the variables requires building more"
+                            f" than max_nodes ({max_nodes}) AST nodes"
+                        )
+            if start > first_start:
+                # Don't let a string statement be mistaken for the docstring.
+                body.insert(0, ast.Pass())
+            with _phase("extract"):
+                found = _extract(
+                    ast.Module(body=body, type_ignores=[]), remaining, occurrence
+                )
+            result.update(found)
+            remaining.difference_update(found)
+            if not remaining:
+                break
+    finally:
+        # Release the lexer's matches on the map.
+        span_iter.close()
+    return result
+
+
+def _check_nodes(fpath, top_level, max_nodes):
+    """
+    Raise a `ValueError` if the parse tree ``top_level`` contains more than
+    ``max_nodes`` nodes
+    """
+    import ast
+
+    if sum(1 for _ in ast.walk(top_level)) > max_nodes:
+        raise ValueError(
+            f"{_source_name(fpath)}: parse tree has more than max_nodes"
+            f" ({max_nodes}) nodes"
+        )
+
+
+def _extract(top_level, variables, occurrence="last"):
+    """
+    Search the body of the `ast.Module` ``top_level`` for assignments to any
+    of the variables in ``variables`` in a single pass, returning a `dict`
+    mapping each variable found to the first or last (depending on
+    ``occurrence``) value assigned to it.  Only the winning assignment to each
+    variable is evaluated.
+    """
+    import ast
+
+    variables = set(variables)
+    result = {}
+    if "__doc__" in variables:
+        docstring = ast.get_docstring(top_level, clean=False)
+        if docstring is not None:
+            result["__doc__"] = docstring
+    # Mapping from variable names to `(value, index, size, starred)` tuples
+    # describing the assignments to evaluate; see `_evaluate()`
+    candidates = {}
+    for statement in top_level.body:
+        if occurrence == "first":
+            variables.difference_update(result)
+            variables.difference_update(candidates)
+            if not variables:
+                break
+        if isinstance(statement, ast.Assign):
+            for target in statement.targets:
+                for name, index, size, starred in _assignment_targets(target):
+                    if name in variables:
+                        candidates[name] = (statement.value, index, size, starred)
+    for var, (value, index, size, starred) in candidates.items():
+        result[var] = _evaluate(value, index, size, starred)
+    return result
+
+
+def _assignment_targets(target):
+    """
+    Yield a ``(name, index, size, starred)`` tuple for each variable that the
+    assignment target ``target`` assigns to, with the same meaning as the
+    arguments to `_evaluate()`.  Only plain names, on their own or in a tuple,
+    are considered.
+    """
+    import ast
+
+    if isinstance(target, ast.Name):
+        yield (target.id, None, None, False)
+    elif isinstance(target, ast.Tuple):
+        size = len(target.elts)
+        star = None
+        for i, t in enumerate(target.elts):
+            if isinstance(t, ast.Starred):
+                star = i
+        for i, t in enumerate(target.elts):
+            if isinstance(t, ast.Name):
+                # Targets after a starred target are indexed from the end.
+                index = i - size if star is not None and i > star else i
+                yield (t.id, index, size, star is not None)
+
+
+def _evaluate(value, index, size, starred):
+    """
+    Evaluate the literal expression ``value``.  If ``index`` is not `None`,
+    ``value`` is being unpacked into a tuple of ``size`` targets (one of which
+    is a starred target if ``starred`` is true), and only the ``index``-th
+    element is returned; if ``value`` is a tuple or list display, only that
+    element is evaluated.
+    """
+    import ast
+
+    if index is None:
+        return ast.literal_eval(value)
+    if isinstance(value, (ast.Tuple, ast.List)) and not any(
+        isinstance(e, ast.Starred) for e in value.elts
+    ):
+        elements = value.elts
+        evaluate = ast.literal_eval
+    else:
+        elements = list(ast.literal_eval(value))
+        evaluate = None
+    _check_unpack(len(elements), size, starred)
+    element = elements[index]
+    return element if evaluate is None else evaluate(element)
+
+
+def _check_unpack(count, size, starred):
+    """
+    Raise a `ValueError` if ``count`` values cannot be unpacked into a tuple
+    of ``size`` targets (one of which is a starred target if ``starred`` is
+    true)
+    """
+    if starred:
+        if count < size - 1:
+            raise ValueError(
+                f"not enough values to unpack (expected at least {size - 1},"
+                f" got {count})"
+            )
+    elif count < size:
+        raise ValueError(f"not enough values to unpack (expected {size}, got {count})")
+    elif count > size:
+        raise ValueError(f"too many values to unpack (expected {size})")
+
+
+#: The maximum size of a value that constant folding will produce, measured as
+#: the total length of its strings plus the number of bits of its integers and
+#: the number of items in its collections
+FOLD_MAX_SIZE = 100000
+
+#: The maximum number of files whose folded constants are memoized
+_FOLD_MEMO_SIZE = 128
+
+#: LRU mapping from absolute file paths to `(signature, bindings)` pairs, where
+#: ``bindings`` is the return value of `_fold_bindings()` for the file
+_fold_memo = OrderedDict()
+
+_fold_memo_lock = Lock()
+
+#: The built-in functions that folded expressions may call (unless the module
+#: binds their names itself)
+_FOLD_FUNCTIONS = {
+    "float": float,
+    "frozenset": frozenset,
+    "int": int,
+    "len": len,
+    "list": list,
+    "map": map,
+    "repr": repr,
+    "set": set,
+    "str": str,
+    "tuple": tuple,
+}
+
+#: The `str` & `bytes` methods that folded expressions may call
+_FOLD_METHODS = {
+    "format",
+    "join",
+    "lower",
+    "lstrip",
+    "rsplit",
+    "rstrip",
+    "split",
+    "strip",
+    "upper",
+}
+
+
+def _fold_variables(fpath, variables, occurrence):
+    """
+    Like `_parse_variables()`, except that the values are evaluated with
+    constant folding (see `_fold()`), so that assignments may compute their
+    values from the constants assigned before them.  The results of folding
+    each file are memoized.
+    """
+    import ast
+
+    bindings = None
+    if isinstance(fpath, str):
+        path = os.path.abspath(fpath)
+        signature = _stat_signature(path)
+        with _fold_memo_lock:
+            entry = _fold_memo.get(path)
+            if entry is not None and entry[0] == signature:
+                _fold_memo.move_to_end(path)
+                bindings = entry[1]
+    if bindings is None:
+        with _phase("read_source"):
+            src = _read_source(fpath)
+        _count("bytes_read", len(src))
+        with _phase("parse"):
+            _count("parses")
+            top_level = ast.parse(src)
+        with _phase("fold"):
+            bindings = _fold_bindings(top_level)
+        if isinstance(fpath, str):
+            with _fold_memo_lock:
+                _fold_memo[path] = (signature, bindings)
+                _fold_memo.move_to_end(path)
+                while len(_fold_memo) > _FOLD_MEMO_SIZE:
+                    _fold_memo.popitem(last=False)
+    result = {}
+    for var in variables:
+        try:
+            values = bindings[var]
+        except KeyError:
+            continue
+        ok, value = values[-1] if occurrence == "last" else values[0]
+        if not ok:
+            raise ValueError(value)
+        result[var] = value
+    return result
+
+
+def _fold_bindings(top_level):
+    """
+    Evaluate the top-level statements of the `ast.Module` ``top_level`` in a
+    single pass, folding the value of each assignment using the constants
+    assigned before it, and return a `dict` mapping each variable that
+    `_extract()` would find assignments to (plus ``"__doc__"``, if there is a
+    docstring) to a list of ``(True, value)`` or ``(False, error_message)``
+    pairs, one per assignment, in order.  Names bound by statements other
+    than assignments, or assigned values that cannot be folded, are not
+    constants afterwards.
+    """
+    import ast
+
+    # Mapping from names bound at the top level to their values, or to
+    # `_NOTHING` if they are not constants
+    env = {}
+    bindings = {}
+    docstring = ast.get_docstring(top_level, clean=False)
+    if docstring is not None:
+        bindings["__doc__"] = [(True, docstring)]
+    for statement in top_level.body:
+        if isinstance(statement, ast.Assign):
+            try:
+                value = _fold(statement.value, env)
+            except ValueError as e:
+                value = _NOTHING
+                error = str(e)
+            # Names bound by walrus expressions in the value
+            env.update(dict.fromkeys(_bound_names(statement.value), _NOTHING))
+            for target in statement.targets:
+                for name, index, size, star in _assignment_targets(target):
+                    if value is _NOTHING:
+                        bindings.setdefault(name, []).append((False, error))
+                        continue
+                    try:
+                        if index is None:
+                            element = value
+                        else:
+                            elements = list(_fold_iterable(value))
+                            _check_unpack(len(elements), size, star)
+                            element = elements[index]
+                    except ValueError as e:
+                        bindings.setdefault(name, []).append((False, str(e)))
+                    else:
+                        bindings.setdefault(name, []).append((True, element))
+                try:
+                    if value is _NOTHING:
+                        raise ValueError(error)
+                    _fold_bind(target, value, env)
+                except ValueError:
+                    env.update(dict.fromkeys(_bound_names(target), _NOTHING))
+        elif (
+            isinstance(statement, (ast.AugAssign, ast.AnnAssign))
+            and isinstance(statement.target, ast.Name)
+            and statement.value is not None
+        ):
+            name = statement.target.id
+            if isinstance(statement, ast.AugAssign):
+                expr = ast.BinOp(
+                    left=ast.Name(id=name, ctx=ast.Load()),
+                    op=statement.op,
+                    right=statement.value,
+                )
+                ast.copy_location(expr, statement)
+            else:
+                expr = statement.value
+            try:
+                value = _fold(expr, env)
+            except ValueError:
+                value = _NOTHING
+            env.update(dict.fromkeys(_bound_names(statement.value), _NOTHING))
+            env[name] = value
+        else:
+            env.update(dict.fromkeys(_bound_names(statement), _NOTHING))
+    return bindings
+
+
+def _bound_names(node):
+    """
+    Return the set of names that the statement or assignment target ``node``
+    may bind.  Names bound inside nested scopes are included as well.
+    """
+    import ast
+
+    names = set()
+    for n in ast.walk(node):
+        if isinstance(n, ast.Name):
+            if not isinstance(n.ctx, ast.Load):
+                names.add(n.id)
+        elif isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names.add(n.name)
+        elif isinstance(n, ast.alias):
+            names.add((n.asname or n.name).partition(".")[0])
+        else:
+            # Exception handlers and `match` capture patterns
+            for attr in ("name", "rest"):
+                value = getattr(n, attr, None)
+                if isinstance(value, str):
+                    names.add(value)
+    return names
+
+
+def _fold_bind(target, value, env):
+    """
+    Bind the names in the assignment target ``target`` to the folded value
+    ``value`` in ``env``
+    """
+    import ast
+
+    if isinstance(target, ast.Name):
+        env[target.id] = value
+    elif isinstance(target, (ast.Tuple, ast.List)):
+        star = None
+        for i, t in enumerate(target.elts):
+            if isinstance(t, ast.Starred):
+                star = i
+        elements = _fold_unpack(value, len(target.elts), star)
+        for t, v in zip(target.elts, elements):
+            _fold_bind(t.value if isinstance(t, ast.Starred) else t, v, env)
+    else:
+        raise ValueError("unsupported assignment target")
+
+
+def _fold_unpack(value, size, star):
+    """
+    Unpack the folded value ``value`` into a list of ``size`` values.  If
+    ``star`` is not `None`, the ``star``-th target is starred, and its element
+    is a list of the values it receives.
+    """
+    elements = list(_fold_iterable(value))
+    _check_unpack(len(elements), size, star is not None)
+    if star is None:
+        return elements
+    end = len(elements) - (size - star - 1)
+    return elements[:star] + [elements[star:end]] + elements[end:]
+
+
+def _fold(node, env):
+    """
+    Evaluate the expression ``node`` without side effects, in the manner of
+    `ast.literal_eval()` but additionally allowing references to the
+    constants in ``env``, arithmetic, string formatting (with ``%``,
+    f-strings, and ``str.format()``), subscripting, and calls to a few
+    built-in functions and `str` methods.  Raises `ValueError` if the
+    expression is not supported or cannot be evaluated, or if a value would
+    exceed `FOLD_MAX_SIZE`.
+    """
+    try:
+        return _fold_node(node, env)
+    except (ArithmeticError, LookupError, TypeError, RecursionError) as e:
+        raise ValueError(
+            f"cannot fold expression on line {getattr(node, 'lineno', '?')}:"
+            f" {type(e).__name__}: {e}"
+        )
+
+
+def _fold_node(node, env):
+    import ast
+
+    if isinstance(node, ast.Constant):
+        return node.value
+    elif sys.version_info < (3, 8) and isinstance(
+        node, (ast.Num, ast.Str, ast.Bytes, ast.NameConstant, ast.Ellipsis)
+    ):
+        return ast.literal_eval(node)
+    elif isinstance(node, ast.Name):
+        value = env.get(node.id, _NOTHING)
+        if value is _NOTHING:
+            raise ValueError(
+                f"{node.id!r} on line {node.lineno} is not a known constant"
+            )
+        return value
+    elif isinstance(node, (ast.Tuple, ast.List, ast.Set)):
+        elements = []
+        for e in node.elts:
+            if isinstance(e, ast.Starred):
+                elements.extend(_fold_iterable(_fold_node(e.value, env)))
+            else:
+                elements.append(_fold_node(e, env))
+        value = {ast.Tuple: tuple, ast.List: list, ast.Set: set}[type(node)](elements)
+    elif isinstance(node, ast.Dict):
+        value = {}
+        for k, v in zip(node.keys, node.values):
+            if k is None:
+                mapping = _fold_node(v, env)
+                if not isinstance(mapping, dict):
+                    raise TypeError("argument after ** must be a dict")
+                value.update(mapping)
+            else:
+                value[_fold_node(k, env)] = _fold_node(v, env)
+    elif isinstance(node, ast.UnaryOp):
+        operand = _fold_node(node.operand, env)
+        if isinstance(node.op, ast.Not):
+            return not operand
+        elif not isinstance(operand, (int, float, complex)):
+            raise TypeError(f"bad operand type for unary operator: {operand!r}")
+        elif isinstance(node.op, ast.USub):
+            value = -operand
+        elif isinstance(node.op, ast.UAdd):
+            value = +operand
+        else:
+            value = ~operand
+    elif isinstance(node, ast.BinOp):
+        value = _fold_binop(
+            node.op, _fold_node(node.left, env), _fold_node(node.right, env)
+        )
+    elif isinstance(node, ast.JoinedStr):
+        parts = []
+        size = 0
+        for part in node.values:
+            if isinstance(part, ast.FormattedValue):
+                v = _fold_node(part.value, env)
+                if part.conversion != -1:
+                    v = {"r": repr, "s": str, "a": ascii}[chr(part.conversion)](v)
+                if part.format_spec is None:
+                    spec = ""
+                else:
+                    spec = _fold_node(part.format_spec, env)
+                s = _fold_format_value(v, spec)
+            else:
+                s = _fold_node(part, env)
+            size += len(s)
+            if size > FOLD_MAX_SIZE:
+                raise ValueError("folded value is too large")
+            parts.append(s)
+        value = "".join(parts)
+    elif isinstance(node, ast.Subscript):
+        container = _fold_node(node.value, env)
+        index = node.slice
+        if type(index).__name__ == "Index":
+            # Python 3.8 and earlier
+            index = index.value
+        if isinstance(index, ast.Slice):
+            index = slice(
+                *(
+                    None if n is None else _fold_node(n, env)
+                    for n in (index.lower, index.upper, index.step)
+                )
+            )
+        else:
+            index = _fold_node(index, env)
+        if not isinstance(container, (str, bytes, tuple, list, dict)):
+            raise TypeError(f"{type(container).__name__!r} is not subscriptable")
+        value = container[index]
+    elif isinstance(node, ast.Call):
+        value = _fold_call(node, env)
+    else:
+        raise ValueError(
+            f"cannot fold {type(node).__name__} expression on line"
+            f" {getattr(node, 'lineno', '?')}"
+        )
+    _fold_check_size(value)
+    return value
+
+
+def _fold_binop(op, left, right):
+    """Apply the binary operator ``op`` to folded operands"""
+    import ast
+    import operator
+
+    sequences = (str, bytes, tuple, list)
+    if isinstance(op, ast.Mult):
+        for seq, n in ((left, right), (right, left)):
+            if isinstance(seq, sequences) and isinstance(n, int):
+                if len(seq) * n > FOLD_MAX_SIZE:
+                    raise ValueError("folded value is too large")
+    elif isinstance(op, ast.Pow):
+        if (
+            isinstance(left, int)
+            and isinstance(right, int)
+            and abs(left) > 1
+            and left.bit_length() * right > FOLD_MAX_SIZE
+        ):
+            raise ValueError("folded value is too large")
+    elif isinstance(op, ast.LShift):
+        if (
+            isinstance(left, int)
+            and isinstance(right, int)
+            and left.bit_length() + right > FOLD_MAX_SIZE
+        ):
+            raise ValueError("folded value is too large")
+    elif isinstance(op, ast.Mod) and isinstance(left, (str, bytes)):
+        _fold_check_template(left, right, method=False)
+    try:
+        func = {
+            ast.Add: operator.add,
+            ast.Sub: operator.sub,
+            ast.Mult: operator.mul,
+            ast.Div: operator.truediv,
+            ast.FloorDiv: operator.floordiv,
+            ast.Mod: operator.mod,
+            ast.Pow: operator.pow,
+            ast.LShift: operator.lshift,
+            ast.RShift: operator.rshift,
+            ast.BitOr: operator.or_,
+            ast.BitXor: operator.xor,
+            ast.BitAnd: operator.and_,
+        }[type(op)]
+    except KeyError:
+        raise ValueError(f"cannot fold {type(op).__name__} operator")
+    return func(left, right)
+
+
+def _fold_call(node, env):
+    """
+    Evaluate a call to one of `_FOLD_FUNCTIONS` or a `_FOLD_METHODS` method of
+    a folded `str` or `bytes`
+    """
+    import ast
+
+    func = node.func
+    if (
+        isinstance(func, ast.Name)
+        and func.id == "map"
+        and "map" not in env
+        and len(node.args) == 2
+        and not node.keywords
+        and isinstance(node.args[0], ast.Name)
+        and node.args[0].id in _FOLD_FUNCTIONS
+        and node.args[0].id not in env
+        and node.args[0].id != "map"
+    ):
+        function = _FOLD_FUNCTIONS[node.args[0].id]
+        return [function(v) for v in _fold_iterable(_fold_node(node.args[1], env))]
+    args = []
+    for a in node.args:
+        if isinstance(a, ast.Starred):
+            args.extend(_fold_iterable(_fold_node(a.value, env)))
+        else:
+            args.append(_fold_node(a, env))
+    kwargs = {}
+    for kw in node.keywords:
+        if kw.arg is None:
+            raise ValueError(f"cannot fold ** arguments on line {node.lineno}")
+        kwargs[kw.arg] = _fold_node(kw.value, env)
+    if (
+        isinstance(func, ast.Name)
+        and func.id in _FOLD_FUNCTIONS
+        and func.id != "map"
+        and func.id not in env
+        and not kwargs
+    ):
+        if func.id in ("frozenset", "list", "set", "tuple") and args:
+            return _FOLD_FUNCTIONS[func.id](_fold_iterable(args[0]), *args[1:])
+        return _FOLD_FUNCTIONS[func.id](*args)
+    elif isinstance(func, ast.Attribute) and func.attr in _FOLD_METHODS:
+        receiver = _fold_node(func.value, env)
+        if isinstance(receiver, (str, bytes)):
+            if func.attr == "join" and len(args) == 1:
+                items = list(_fold_iterable(args[0]))
+                size = len(receiver) * (len(items) - 1)
+                size += sum(len(s) for s in items if isinstance(s, (str, bytes)))
+                if size > FOLD_MAX_SIZE:
+                    raise ValueError("folded value is too large")
+                args = [items]
+            elif func.attr == "format":
+                if not isinstance(receiver, str):
+                    raise TypeError("bytes have no format() method")
+                _fold_check_template(receiver, (args, kwargs), method=True)
+            return getattr(receiver, func.attr)(*args, **kwargs)
+    raise ValueError(f"cannot fold call on line {node.lineno}")
+
+
+def _fold_iterable(value):
+    """Return the folded value ``value`` if it can be iterated over"""
+    if not isinstance(value, (str, bytes, tuple, list, dict, set, frozenset)):
+        raise TypeError(f"{type(value).__name__!r} object is not iterable")
+    return value
+
+
+def _fold_format_value(value, spec):
+    """
+    Format ``value`` with the format spec ``spec``, checking that any widths
+    or precisions in the spec do not exceed `FOLD_MAX_SIZE`
+    """
+    import re
+
+    if any(int(n) > FOLD_MAX_SIZE for n in re.findall(r"\d+", spec)):
+        raise ValueError("folded value is too large")
+    return format(value, spec)
+
+
+def _fold_check_template(template, args, method):
+    """
+    Check that formatting the string ``template`` with ``%`` (or with
+    ``str.format()``, if ``method`` is true) and the folded arguments ``args``
+    will not produce a
+    value exceeding `FOLD_MAX_SIZE` and does not access any attributes or
+    items of the arguments
+    """
+    import re
+
+    if isinstance(template, bytes):
+        template = template.decode("latin-1")
+    if not method:
+        specs = re.findall(r"%(?:\([^)]*\))?[-#0 +]*(\*|\d*)(?:\.(\*|\d*))?", template)
+        fields = len(specs)
+        numbers = [n for spec in specs for n in spec if n]
+    else:
+        import string
 
-    If no assignments to the variable are found, a ``ValueError`` is raised.
-    To instead return a default value when this happens, set the ``default``
-    keyword argument.
+        fields = 0
+        numbers = []
+        for _, field, spec, _ in string.Formatter().parse(template):
+            if field is not None:
+                fields += 1
+                if not re.fullmatch(r"\w*", field) or "{" in (spec or ""):
+                    raise ValueError("cannot fold format string with complex fields")
+                numbers.extend(re.findall(r"\d+", spec or ""))
+    if "*" in numbers or any(int(n) > FOLD_MAX_SIZE for n in numbers):
+        raise ValueError("folded value is too large")
+    if len(template) + fields * (_fold_size(args) + 1) > FOLD_MAX_SIZE:
+        raise ValueError("folded value is too large")
+
+
+def _fold_size(value, limit=FOLD_MAX_SIZE):
+    """
+    Return the size of the folded value ``value`` as defined for
+    `FOLD_MAX_SIZE`, stopping early once it exceeds ``limit``
     """
+    if isinstance(value, bool) or value is None:
+        return 1
+    elif isinstance(value, int):
+        return max(value.bit_length(), 1)
+    elif isinstance(value, (str, bytes)):
+        return max(len(value), 1)
+    elif isinstance(value, (tuple, list, set, frozenset, dict)):
+        size = 1 + len(value)
+        items = value.items() if isinstance(value, dict) else value
+        for item in items:
+            if size > limit:
+                break
+            size += _fold_size(item, limit - size)
+        return size
+    else:
+        return 1
 
-    if not fpath:
-        raise ValueError("No filepath passed to read_version()")
-    fpath = os.path.join(*fpath)
-    if not os.path.isabs(fpath):
-        caller_file = inspect.stack()[1][0].f_globals["__file__"]
-        fpath = os.path.join(os.path.dirname(caller_file), fpath)
-    with open(fpath, "rb") as fp:
-        src = fp.read()
-    top_level = ast.parse(src)
-    variable = kwargs.get("variable", "__version__")
+
+def _fold_check_size(value):
+    """Raise a `ValueError` if ``value`` exceeds `FOLD_MAX_SIZE`"""
+    if _fold_size(value) > FOLD_MAX_SIZE:
+        raise ValueError("folded value is too large")
+
+
+def _get_value(values, variable, defaults):
     try:
-        result = kwargs["default"]
+        return values[variable]
     except KeyError:
-        pass
-    if variable == "__doc__":
-        result = ast.get_docstring(top_level, clean=False)
-        if result is None:
-            if "default" in kwargs:
-                result = kwargs["default"]
-            else:
-                del result
-    for statement in top_level.body:
-        if isinstance(statement, ast.Assign):
-            for target in statement.targets:
-                if isinstance(target, ast.Tuple):
-                    if any(
-                        isinstance(t, ast.Name) and t.id == variable
-                        for t in target.elts
-                    ):
-                        value = ast.literal_eval(statement.value)
-                        for t, v in zip(target.elts, value):
-                            if isinstance(t, ast.Name) and t.id == variable:
-                                result = v
-                elif isinstance(target, ast.Name) and target.id == variable:
-                    result = ast.literal_eval(statement.value)
-    try:
-        return result
-    except NameError:
-        raise ValueError(f"No assignment to {variable!r} found in file")
+        try:
+            return defaults[variable]
+        except KeyError:
+            raise ValueError(f"No assignment to {variable!r} found in file")
 
 
 SETTABLE_METADATA_ATTRIBUTES = {
@@ -127,6 +3154,37 @@ SETTABLE_METADATA_ATTRIBUTES = {
 }
 
 
+def _get_log():
+    # Starting in v49.2.0, setuptools warns if distutils is imported before it.
+    # We thus need to import setuptools before distutils so that any users of
+    # this library that import it before setuptools don't get a warning.
+    import setuptools  # noqa: F401
+
+    from distutils import log  # noqa
+
+    return log
+
+
+class _ConfigError(Exception):
+    """Raised when the ``tool.read_version`` table is invalid"""
+
+
+class _WarningCollector:
+    """
+    A stand-in for `distutils.log` that discards debug messages and records
+    warnings
+    """
+
+    def __init__(self):
+        self.warnings = []
+
+    def debug(self, _msg, *_args):
+        pass
+
+    def warn(self, msg, *args):
+        self.warnings.append(msg % args)
+
+
 def setuptools_finalizer(dist):
     # I *think* it's reasonable to assume that the project root is always the
     # current directory when this function is called.  Setuptools doesn't seem
@@ -135,58 +3193,1382 @@ def setuptools_finalizer(dist):
     # directory when run.  PEP 517 also says, "All hooks are run with working
     # directory set to the root of the source tree".
     PROJECT_ROOT = os.path.abspath(os.curdir)
+    with _profile_session("setuptools_finalizer"):
+        with _phase("import_setuptools"):
+            log = _get_log()
+        # Setuptools calls finalizers before applying the options in
+        # setup.cfg and pyproject.toml, so any layout settings not passed to
+        # setup() are read from those files.
+        modules = _ModuleIndex(
+            PROJECT_ROOT,
+            package_dir=getattr(dist, "package_dir", None),
+            packages=getattr(dist, "packages", None),
+            declared=True,
+        )
+        for attrib, value in _finalize_values(PROJECT_ROOT, log, modules).items():
+            setattr(dist.metadata, attrib, value)
+
+
+#: Mapping from project roots to `(pyproject_signature, layout,
+#: source_signatures, values)` tuples recording the metadata values that
+#: `setuptools_finalizer()` previously computed for each project; ``layout``
+#: is `None` if no fields were configured
+_finalizer_memo = {}
+
+
+def _finalize_values(project_root, log, modules=None):
+    """
+    Return a `dict` of the metadata values configured for the project at
+    ``project_root``, resolving module names with the `_ModuleIndex`
+    ``modules``.  Setuptools may call the finalizer several times in the same
+    process (e.g., once for each PEP 517 hook), so the values are memoized and
+    reused as long as ``pyproject.toml``, the package layout, and all of the
+    source files the values were read from are unchanged.
+    """
+    import copy
+
+    if modules is None:
+        modules = _ModuleIndex(project_root, declared=True)
+    pyproject_sig = _stat_signature(os.path.join(project_root, "pyproject.toml"))
     try:
-        import toml
-    except ImportError:
-        log.debug("read_version: toml not installed; not using pyproject.toml")
-        return
+        memo_pyproject_sig, memo_layout, source_sigs, values = _finalizer_memo[
+            project_root
+        ]
+    except KeyError:
+        pass
+    else:
+        if (
+            memo_pyproject_sig == pyproject_sig
+            and memo_layout in (None, modules.layout)
+            and all(_stat_signature(path) == sig for path, sig in source_sigs)
+        ):
+            log.debug("read_version: reusing previously read values")
+            _count("memo_hits")
+            return copy.deepcopy(values)
+    cfg = _load_config(project_root, log)
+    if cfg is None:
+        fields = []
+    else:
+        try:
+            fields = _parse_fields(cfg, project_root, log, modules=modules)
+        except _ConfigError as e:
+            sys.exit(str(e))
+    # Take the signatures before reading so that any modifications made in the
+    # meantime are noticed next time.
+    source_sigs = [
+        (path, _stat_signature(path)) for path in {path for _, path, _, _ in fields}
+    ]
+    values = _read_fields(fields, log)
+    # The layout only matters (and is only looked up) when there are fields.
+    layout = modules.layout if fields else None
+    _finalizer_memo[project_root] = (pyproject_sig, layout, source_sigs, values)
+    return copy.deepcopy(values)
+
+
+class _MetadataCachingBackend:
+    """
+    A PEP 517 build backend that delegates to ``setuptools.build_meta``,
+    except that the output of the ``prepare_metadata_for_build_wheel`` and
+    ``prepare_metadata_for_build_editable`` hooks is cached in the project's
+    ``build/read_version-metadata/`` directory and reused as long as nothing
+    it could have been generated from has changed (see
+    `_metadata_fingerprint()`), sparing the ``egg_info`` run
+    """
+
+    #: The directory, relative to the project root, in which to cache metadata
+    CACHE_DIR = os.path.join("build", "read_version-metadata")
+
+    def __getattr__(self, name):
+        import setuptools.build_meta
+
+        hook = getattr(setuptools.build_meta, name)
+        if name in (
+            "prepare_metadata_for_build_wheel",
+            "prepare_metadata_for_build_editable",
+        ):
+            from functools import partial
+
+            return partial(self._prepare_metadata, hook)
+        return hook
+
+    def _prepare_metadata(self, hook, metadata_directory, config_settings=None):
+        import json
+        import shutil
+        import setuptools
+
+        with _profile_session("prepare_metadata"):
+            # PEP 517 hooks are run with the project root as the working
+            # directory.
+            project_root = os.path.abspath(os.curdir)
+            entry = os.path.join(project_root, self.CACHE_DIR, hook.__name__)
+            key = json.loads(
+                json.dumps(
+                    {
+                        "config_settings": config_settings,
+                        "python": list(sys.version_info[:2]),
+                        "read_version": __version__,
+                        "setuptools": setuptools.__version__,
+                    },
+                    sort_keys=True,
+                    default=repr,
+                )
+            )
+            with _phase("metadata_cache"):
+                try:
+                    with open(os.path.join(entry, "manifest.json"), "rb") as fp:
+                        manifest = json.loads(fp.read().decode("utf-8"))
+                except (OSError, ValueError):
+                    manifest = None
+            if manifest is not None and manifest.get("key") != key:
+                manifest = None
+            with _phase("fingerprint"):
+                fingerprint = _metadata_fingerprint(
+                    project_root,
+                    manifest["fingerprint"]["files"] if manifest is not None else (),
+                )
+            if (
+                fingerprint is not None
+                and manifest is not None
+                and manifest["fingerprint"] == fingerprint
+            ):
+                name = manifest["dist_info"]
+                dest = os.path.join(metadata_directory, name)
+                try:
+                    with _phase("metadata_cache"):
+                        shutil.copytree(os.path.join(entry, name), dest)
+                except OSError:
+                    shutil.rmtree(dest, ignore_errors=True)
+                else:
+                    _get_log().info("read_version: reusing cached %s", name)
+                    _count("metadata_cache_hits")
+                    return name
+            _count("metadata_cache_misses")
+            # Records the files read by any read_version() calls in setup.py
+            # as well as by `setuptools_finalizer()`
+            with _recording_reads() as sources:
+                name = hook(metadata_directory, config_settings)
+            memo = _finalizer_memo.get(project_root)
+            if memo is not None:
+                # Values reused from an earlier call are not read again.
+                sources.update(path for path, _ in memo[2])
+            if fingerprint is None:
+                # The inputs cannot be determined, so the metadata cannot be
+                # cached.
+                return name
+            with _phase("fingerprint"):
+                new_fingerprint = _metadata_fingerprint(
+                    project_root, sorted(sources) + list(fingerprint["files"])
+                )
+            if (
+                new_fingerprint is not None
+                and all(
+                    new_fingerprint["files"].get(path) == digest
+                    for path, digest in fingerprint["files"].items()
+                )
+                and new_fingerprint["modules"] == fingerprint["modules"]
+            ):
+                # Only cache the metadata if no input changed while it was being
+                # generated.
+                with _phase("metadata_cache"):
+                    _store_metadata(
+                        entry,
+                        os.path.join(metadata_directory, name),
+                        {"key": key, "fingerprint": new_fingerprint, "dist_info": name},
+                    )
+            return name
+
+
+#: A PEP 517 build backend wrapping ``setuptools.build_meta`` that caches
+#: prepared metadata; use with ``build-backend = "read_version:build_meta"``
+build_meta = _MetadataCachingBackend()
+
+
+def _metadata_fingerprint(project_root, files=()):
+    """
+    Return a JSON-serializable fingerprint of the files that the metadata
+    setuptools generates for the project at ``project_root`` may depend on,
+    or `None` if they cannot be determined (see `_declared_inputs()`).
+    ``"files"`` maps the paths (relative to ``project_root``) of the regular
+    files in the project root (including ``pyproject.toml``, ``setup.py``,
+    ``setup.cfg``, and any READMEs or requirements files they read), the files
+    named by ``file:`` and ``attr:`` directives, and the additional files
+    ``files`` (e.g., the sources read while generating the metadata) to the
+    SHA-256 digests of their contents, or `None` for missing files.
+    ``"modules"`` lists the top-level modules & packages in the project root
+    and ``src/`` directory, which determine ``top_level.txt``.  Contents are
+    hashed rather than stat'ed so that checking out a branch & back does not
+    invalidate the cache.
+    """
+    import hashlib
+
+    declared = _declared_inputs(project_root)
+    if declared is None:
+        return None
+    paths = {os.path.join(project_root, p) for p in files}
+    paths.update(declared)
+    modules = []
+    for subdir in ("", "src"):
+        dirpath = os.path.join(project_root, subdir)
+        try:
+            entries = list(os.scandir(dirpath))
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        for e in entries:
+            if e.name.startswith("."):
+                continue
+            if not subdir and e.is_file():
+                paths.add(e.path)
+            if (e.name.endswith(".py") and e.is_file()) or (
+                e.is_dir() and os.path.exists(os.path.join(e.path, "__init__.py"))
+            ):
+                modules.append(os.path.join(subdir, e.name))
+    digests = {}
+    for path in sorted(paths):
+        try:
+            with open(path, "rb") as fp:
+                data = fp.read()
+        except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+            digest = None
+        else:
+            _count("bytes_read", len(data))
+            digest = hashlib.sha256(data).hexdigest()
+        digests[os.path.relpath(path, project_root)] = digest
+    return {"files": digests, "modules": sorted(modules)}
+
+
+def _declared_inputs(project_root):
+    """
+    Return the paths of the files that the declarative configuration of the
+    project at ``project_root`` tells setuptools to read metadata from: the
+    targets of ``file:`` and ``attr:`` directives in ``setup.cfg``, of
+    ``file`` and ``attr`` entries in the ``[tool.setuptools.dynamic]`` table
+    of ``pyproject.toml``, and of ``project.readme`` and
+    ``project.license.file``.  Returns `None` if the inputs cannot be
+    determined, i.e., if ``pyproject.toml`` cannot be parsed, if an
+    ``attr:`` directive names a value that setuptools can only get by
+    executing its module (which may read anything), if ``setup.py`` is not
+    declarative (see `_setup_py_is_declarative()`), if the build requires
+    anything other than setuptools, wheel, and read_version (as setuptools
+    plugins like setuptools_scm can compute metadata from anything, such as
+    git), or if the ``[egg_info]`` section of ``setup.cfg`` sets
+    ``tag_date`` or ``tag_svn_revision`` (whose values change over time).
+    """
+    from configparser import Error, RawConfigParser
+    import re
+
+    if not _setup_py_is_declarative(project_root):
+        return None
+    files = []
+    attrs = []
+    parser = RawConfigParser()
+    try:
+        parser.read(os.path.join(project_root, "setup.cfg"), encoding="utf-8")
+    except (Error, UnicodeDecodeError):
+        pass
+    else:
+        if parser.has_section("egg_info"):
+            for option, value in parser.items("egg_info"):
+                option = option.replace("-", "_")
+                if option.startswith("tag_") and option != "tag_build":
+                    if value.strip().lower() not in ("", "0", "false", "no", "off"):
+                        return None
+        for section in parser.sections():
+            for value in parser[section].values():
+                value = value.strip()
+                if value.startswith("file:"):
+                    files.extend(p.strip() for p in value[5:].split(","))
+                elif value.startswith("attr:"):
+                    attrs.append(value[5:].strip())
+    try:
+        with open(os.path.join(project_root, "pyproject.toml"), "rb") as fp:
+            data = fp.read()
+    except FileNotFoundError:
+        data = b""
+    if data:
+        _count("bytes_read", len(data))
+        loads = _get_toml_loads()
+        if loads is None:
+            return None
+        try:
+            cfg = loads(data.decode("utf-8"))
+        except ValueError:
+            return None
+        requires = cfg.get("build-system", {}).get("requires", [])
+        if not isinstance(requires, list):
+            return None
+        for req in requires:
+            m = re.match(r"\s*([A-Za-z0-9][A-Za-z0-9._-]*)", str(req))
+            if m is None or re.sub(r"[-_.]+", "-", m[1].lower()) not in (
+                "setuptools",
+                "wheel",
+                "read-version",
+            ):
+                return None
+        project = cfg.get("project", {})
+        specs = list(
+            cfg.get("tool", {}).get("setuptools", {}).get("dynamic", {}).values()
+        )
+        readme = project.get("readme")
+        specs.append({"file": readme} if isinstance(readme, str) else readme)
+        specs.append(project.get("license"))
+        for spec in specs:
+            if not isinstance(spec, dict):
+                continue
+            if isinstance(spec.get("file"), str):
+                files.append(spec["file"])
+            elif isinstance(spec.get("file"), list):
+                files.extend(spec["file"])
+            if isinstance(spec.get("attr"), str):
+                attrs.append(spec["attr"])
+    paths = [os.path.join(project_root, p) for p in files if p]
+    modules = _ModuleIndex(project_root, declared=True)
+    for attr in attrs:
+        modpath, _, name = attr.rpartition(".")
+        path = modules.resolve(modpath or "__init__")
+        try:
+            # Unless the value is a literal, setuptools executes the module.
+            _get_value(_read_variables(path, [name]), name, {})
+        except Exception:
+            return None
+        paths.append(path)
+    return paths
+
+
+def _setup_py_is_declarative(project_root):
+    """
+    Test whether the metadata that the ``setup.py`` file (if any) in
+    ``project_root`` passes to setuptools depends only on files that we know
+    about.  ``setup.py`` is arbitrary code that may compute metadata from
+    anything (environment variables, git, files it opens itself, etc.), so it
+    only qualifies if it consists solely of a docstring, imports of
+    ``setuptools`` and ``read_version.read_version``, and calls to
+    ``setup()`` (optionally inside an ``if __name__ == "__main__":`` block)
+    whose arguments are all either literals or calls to ``read_version()``
+    with literal arguments, whose reads are recorded while generating the
+    metadata.
+    """
+    import ast
+
+    try:
+        with open(os.path.join(project_root, "setup.py"), "rb") as fp:
+            source = fp.read()
+    except FileNotFoundError:
+        return True
+    _count("bytes_read", len(source))
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return False
+    setup_funcs = set()
+    setuptools_mods = set()
+    readers = set()
+    importable = {
+        "setuptools": ("setup", setup_funcs),
+        "read_version": ("read_version", readers),
+    }
+
+    def is_literal(node):
+        try:
+            ast.literal_eval(node)
+        except (ValueError, SyntaxError, TypeError, MemoryError, RecursionError):
+            return False
+        return True
+
+    def is_call(node, names, modules=()):
+        return isinstance(node, ast.Call) and (
+            (isinstance(node.func, ast.Name) and node.func.id in names)
+            or (
+                isinstance(node.func, ast.Attribute)
+                and node.func.attr == "setup"
+                and isinstance(node.func.value, ast.Name)
+                and node.func.value.id in modules
+            )
+        )
+
+    def is_value(node):
+        return is_literal(node) or (
+            is_call(node, readers)
+            and all(is_literal(arg) for arg in node.args)
+            and all(
+                kw.arg is not None and is_literal(kw.value) for kw in node.keywords
+            )
+        )
+
+    def check(body):
+        for i, stmt in enumerate(body):
+            if isinstance(stmt, ast.Import):
+                for alias in stmt.names:
+                    if alias.name != "setuptools":
+                        return False
+                    setuptools_mods.add(alias.asname or alias.name)
+            elif isinstance(stmt, ast.ImportFrom):
+                try:
+                    name, bound = importable[stmt.module]
+                except KeyError:
+                    return False
+                for alias in stmt.names:
+                    if stmt.level or alias.name != name:
+                        return False
+                    bound.add(alias.asname or alias.name)
+            elif isinstance(stmt, ast.Expr):
+                if i == 0 and body is tree.body and is_literal(stmt.value):
+                    continue
+                call = stmt.value
+                if not (
+                    is_call(call, setup_funcs, setuptools_mods)
+                    and all(is_value(arg) for arg in call.args)
+                    and all(
+                        kw.arg is not None and is_value(kw.value)
+                        for kw in call.keywords
+                    )
+                ):
+                    return False
+            elif isinstance(stmt, ast.If):
+                test = stmt.test
+                if not (
+                    body is tree.body
+                    and not stmt.orelse
+                    and isinstance(test, ast.Compare)
+                    and isinstance(test.left, ast.Name)
+                    and test.left.id == "__name__"
+                    and len(test.ops) == 1
+                    and isinstance(test.ops[0], ast.Eq)
+                    and is_literal(test.comparators[0])
+                    and ast.literal_eval(test.comparators[0]) == "__main__"
+                    and check(stmt.body)
+                ):
+                    return False
+            else:
+                return False
+        return True
+
+    return check(tree.body)
+
+
+def _store_metadata(entry, dist_info, manifest):
+    """
+    Replace the metadata cache entry directory ``entry`` with a copy of the
+    ``.dist-info`` directory ``dist_info`` and the JSON manifest ``manifest``.
+    Failure to write the cache is logged and otherwise ignored.
+    """
+    import json
+    import shutil
+    import tempfile
+
+    parent = os.path.dirname(entry)
+    try:
+        os.makedirs(parent, exist_ok=True)
+        tmpdir = tempfile.mkdtemp(dir=parent, prefix=".tmp-")
+        try:
+            shutil.copytree(
+                dist_info, os.path.join(tmpdir, os.path.basename(dist_info))
+            )
+            # Written last so that a partially-copied entry is never used
+            with open(
+                os.path.join(tmpdir, "manifest.json"), "w", encoding="utf-8"
+            ) as fp:
+                json.dump(manifest, fp, sort_keys=True)
+            shutil.rmtree(entry, ignore_errors=True)
+            os.replace(tmpdir, entry)
+        except BaseException:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+            raise
+    except OSError as e:
+        _get_log().warn("read_version: could not cache metadata: %s", e)
+
+
+def _stat_signature(path):
+    """
+    Return the modification time & size of the file at ``path``, or `None` if
+    it does not exist
+    """
+    try:
+        st = _stat_source(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _load_config(project_root, log):
+    """
+    Return the ``tool.read_version`` table from the ``pyproject.toml`` file
+    in ``project_root``, or `None` if there is no usable table
+    """
     try:
-        cfg = toml.load(os.path.join(PROJECT_ROOT, "pyproject.toml"))
+        with _phase("read_config"):
+            with open(os.path.join(project_root, "pyproject.toml"), "rb") as fp:
+                data = fp.read()
     except FileNotFoundError:
         log.debug("read_version: pyproject.toml not found")
-        return
+        return None
+    _count("bytes_read", len(data))
+    if not _mentions_config(data):
+        log.debug("read_version: no tool.read_version table in pyproject.toml")
+        return None
+    loads = _get_toml_loads()
+    if loads is None:
+        log.debug("read_version: toml not installed; not using pyproject.toml")
+        return None
+    with _phase("parse_config"):
+        cfg = loads(data.decode("utf-8"))
     cfg = cfg.get("tool", {}).get("read_version", {})
     if not isinstance(cfg, dict):
         log.warn('read_version: "tool.read_version" is not a table; ignoring')
-        return
+        return None
+    return cfg
+
+
+def _mentions_config(data):
+    """
+    Test whether the contents ``data`` of a ``pyproject.toml`` file could
+    possibly define a ``tool.read_version`` table, i.e., whether
+    ``read_version`` occurs as a key (as opposed to, say, in a requirement
+    string) anywhere in the file.  This lets us skip parsing the TOML for the
+    majority of projects, which do not use ``read_version``.
+    """
+    if b"read_version" not in data:
+        return False
+    import re
+
+    return re.search(rb"read_version[\"']?\s*(?:[.\]]|=(?!=))", data) is not None
+
+
+def _get_toml_loads():
+    """
+    Return a function for parsing a TOML document from a `str`, preferring the
+    standard library's `tomllib` and then `tomli` (both of which are much
+    faster than `toml`), or `None` if no TOML library is installed
+    """
+    try:
+        from tomllib import loads
+    except ImportError:
+        try:
+            from tomli import loads
+        except ImportError:
+            try:
+                from toml import loads
+            except ImportError:
+                return None
+    return loads
+
+
+class _ModuleIndex:
+    """
+    An index of the Python modules & packages in a project for resolving the
+    dotted module names in ``"module:variable"`` specifiers to files.  The
+    package directories are determined from the ``package_dir`` and
+    ``packages`` settings of the project's distribution the same way that
+    setuptools does; if ``package_dir`` is not set, modules are looked for in
+    both the project root and a ``src/`` directory.  The index is built
+    lazily, one top-level module or package at a time: the first time a name
+    under a given top-level name is resolved, only the directories for that
+    top-level name are walked, once, so that unrelated directories (such as
+    ``docs/``, ``build/``, or virtual environments) are never visited.  If
+    ``declared`` is true, settings that are `None` are read from the
+    project's ``setup.cfg`` and ``pyproject.toml`` files (see
+    `_declared_layout()`) on first use.
+    """
+
+    def __init__(self, project_root, package_dir=None, packages=None, declared=False):
+        self.project_root = project_root
+        self._package_dir = package_dir
+        self._packages = packages
+        #: The ``(package_dir, packages)`` settings, or `None` if they have
+        #: not been determined yet
+        self._layout = None
+        if not declared or (package_dir is not None and packages is not None):
+            self._layout = (dict(package_dir or {}), list(packages or []))
+        #: Mapping from dotted module names to file paths for the top-level
+        #: names indexed so far
+        self.modules = {}
+        #: The top-level names that have been indexed
+        self._indexed = set()
+
+    @property
+    def layout(self):
+        """The ``(package_dir, packages)`` settings of the project"""
+        if self._layout is None:
+            with _phase("read_layout"):
+                package_dir, packages = _declared_layout(self.project_root)
+            if self._package_dir is not None:
+                package_dir = self._package_dir
+            if self._packages is not None:
+                packages = self._packages
+            self._layout = (dict(package_dir or {}), list(packages or []))
+        return self._layout
+
+    @property
+    def package_dir(self):
+        return self.layout[0]
+
+    @property
+    def packages(self):
+        return self.layout[1]
+
+    def resolve(self, modpath):
+        """
+        Return the path to the file defining the module or package
+        ``modpath``.  Modules not found in the index are assumed to be at
+        ``PROJECT_ROOT/MOD/PATH.py``.
+        """
+        top = modpath.partition(".")[0]
+        if top not in self._indexed:
+            with _phase("index_modules"):
+                for name, path in self._build(top).items():
+                    self.modules.setdefault(name, path)
+            self._indexed.add(top)
+        try:
+            return self.modules[modpath]
+        except KeyError:
+            path = modpath.split(".")
+            path[-1] += ".py"
+            return os.path.join(self.project_root, *path)
+
+    def _package_path(self, package):
+        """
+        Return the directory for the package ``package`` (``""`` for the root
+        package), as in setuptools' ``build_py.get_package_dir()``
+        """
+        path = package.split(".") if package else []
+        tail = []
+        while path:
+            try:
+                pdir = self.package_dir[".".join(path)]
+            except KeyError:
+                tail.insert(0, path.pop())
+            else:
+                tail.insert(0, pdir)
+                break
+        else:
+            pdir = self.package_dir.get("")
+            if pdir is not None:
+                tail.insert(0, pdir)
+        return os.path.join(self.project_root, *tail)
+
+    def _build(self, top):
+        """
+        Return a `dict` mapping the names of the modules under the top-level
+        name ``top`` to their paths
+        """
+        if self.packages:
+            # Only the listed packages and the top-level modules are indexed.
+            packages = self.packages
+            recurse = False
+        else:
+            # Packages with their own directories take precedence.
+            packages = sorted(self.package_dir, key=len, reverse=True)
+            recurse = True
+        roots = [
+            (p, self._package_path(p))
+            for p in packages
+            if p and p.partition(".")[0] == top
+        ]
+        # Directories that `top` may be found in
+        bases = [self._package_path("")]
+        if recurse and not self.package_dir:
+            bases.append(os.path.join(self.project_root, "src"))
+        modules = {}
+        for package, dirpath in roots:
+            for modpath, path in self._scan(package, dirpath, recurse).items():
+                modules.setdefault(modpath, path)
+        if not top.isidentifier():
+            return modules
+        for dirpath in bases:
+            found = {}
+            path = os.path.join(dirpath, top + ".py")
+            if os.path.isfile(path):
+                found[top] = path
+            path = os.path.join(dirpath, top)
+            if recurse and top != "__pycache__" and os.path.isdir(path):
+                # Packages take precedence over modules.
+                found.update(self._scan(top, path, recurse))
+            for modpath, path in found.items():
+                modules.setdefault(modpath, path)
+        return modules
+
+    def _scan(self, package, dirpath, recurse):
+        """
+        Return a `dict` mapping the names of the modules in the directory
+        ``dirpath`` for the package ``package`` (and, if ``recurse`` is true,
+        in its subdirectories) to their paths.  Directories that are not valid
+        package names are skipped.
+        """
+        modules = {}
+        stack = [(package, dirpath)]
+        seen = set()
+        while stack:
+            package, dirpath = stack.pop()
+            prefix = package + "." if package else ""
+            try:
+                realpath = os.path.realpath(dirpath)
+                if realpath in seen:
+                    continue
+                seen.add(realpath)
+                entries = list(os.scandir(dirpath))
+            except OSError:
+                continue
+            for entry in entries:
+                name = entry.name
+                if name.endswith(".py") and name[:-3].isidentifier():
+                    modules[prefix + name[:-3]] = entry.path
+                    if name == "__init__.py" and package:
+                        # Packages take precedence over modules.
+                        modules[package] = entry.path
+                elif (
+                    recurse
+                    and name.isidentifier()
+                    and name != "__pycache__"
+                    and entry.is_dir()
+                ):
+                    stack.append((prefix + name, entry.path))
+        return modules
+
+
+def _declared_layout(project_root):
+    """
+    Return the ``package_dir`` and ``packages`` settings declared in the
+    ``[options]`` section of the ``setup.cfg`` file and the
+    ``[tool.setuptools]`` table of the ``pyproject.toml`` file (which takes
+    precedence) in ``project_root``, parsed the way setuptools does.  Settings
+    that are not declared (or that use ``find:`` directives) are `None`.
+    """
+    from configparser import Error, RawConfigParser
+
+    package_dir = packages = None
+    parser = RawConfigParser()
+    try:
+        parser.read(os.path.join(project_root, "setup.cfg"), encoding="utf-8")
+    except (Error, UnicodeDecodeError):
+        pass
+    else:
+
+        def parse_list(value):
+            sep = "\n" if "\n" in value else ","
+            return [v.strip() for v in value.split(sep) if v.strip()]
+
+        if parser.has_option("options", "package_dir"):
+            package_dir = {}
+            for line in parse_list(parser.get("options", "package_dir")):
+                key, _, value = line.partition("=")
+                package_dir[key.strip()] = value.strip()
+        if parser.has_option("options", "packages"):
+            value = parser.get("options", "packages").strip()
+            if not value.startswith(("find:", "find_namespace:")):
+                packages = parse_list(value)
+    try:
+        with open(os.path.join(project_root, "pyproject.toml"), "rb") as fp:
+            data = fp.read()
+    except FileNotFoundError:
+        data = b""
+    _count("bytes_read", len(data))
+    loads = _get_toml_loads() if b"setuptools" in data else None
+    if loads is not None:
+        try:
+            cfg = loads(data.decode("utf-8"))
+        except ValueError:
+            # Errors in pyproject.toml are reported elsewhere.
+            cfg = {}
+        cfg = cfg.get("tool", {}).get("setuptools", {})
+        if isinstance(cfg.get("package-dir"), dict):
+            package_dir = cfg["package-dir"]
+        if isinstance(cfg.get("packages"), list):
+            packages = cfg["packages"]
+        elif isinstance(cfg.get("packages"), dict):
+            # ``find`` with a single ``where`` directory implies a
+            # ``package_dir`` for the root package.
+            where = cfg["packages"].get("find", {}).get("where", ["."])
+            if package_dir is None and len(where) == 1 and where[0] != ".":
+                package_dir = {"": where[0]}
+    return package_dir, packages
+
+
+def _parse_fields(
+    cfg, project_root, log, allowed=SETTABLE_METADATA_ATTRIBUTES, modules=None
+):
+    """
+    Validate the ``tool.read_version`` table ``cfg`` and return a list of
+    ``(attrib, path, varname, defaults)`` tuples, one for each metadata field
+    to set.  Fields not in ``allowed`` are ignored with a warning, unless
+    ``allowed`` is `None`.  Module names in string specifiers are resolved
+    with the `_ModuleIndex` ``modules`` (by default, one that detects the
+    project's layout).  Raises `_ConfigError` if the table is invalid.
+    """
+    if modules is None:
+        modules = _ModuleIndex(project_root, declared=True)
+    fields = []
     for attrib, spec in cfg.items():
-        if attrib in SETTABLE_METADATA_ATTRIBUTES:
+        if allowed is None or attrib in allowed:
             if isinstance(spec, str):
                 modpath, _, varname = spec.partition(":")
                 if not modpath or not varname:
-                    sys.exit(
+                    raise _ConfigError(
                         f"tool.read_version.{attrib}:" f" Invalid specifier {spec!r}"
                     )
-                path = modpath.split(".")
-                path[-1] += ".py"
-                path = os.path.join(PROJECT_ROOT, *path)
-                kwargs = {"variable": varname}
+                path = modules.resolve(modpath)
+                defaults = {}
             elif isinstance(spec, dict):
                 try:
                     path = spec["path"]
                 except KeyError:
-                    sys.exit(
+                    raise _ConfigError(
                         f'"path" key of tool.read_version.{attrib} missing in'
                         " pyproject.toml"
                     )
                 if isinstance(path, list):
-                    path = os.path.join(PROJECT_ROOT, *path)
+                    path = os.path.join(project_root, *path)
                 else:
-                    sys.exit(f'"path" key of tool.read_version.{attrib} must be a list')
+                    raise _ConfigError(
+                        f'"path" key of tool.read_version.{attrib} must be a list'
+                    )
                 try:
                     varname = spec["variable"]
                 except KeyError:
-                    sys.exit(
+                    raise _ConfigError(
                         f'"variable" key of tool.read_version.{attrib} missing'
                         " in pyproject.toml"
                     )
-                kwargs = {"variable": varname}
-                if "default" in cfg[attrib]:
-                    kwargs["default"] = spec["default"]
+                defaults = {}
+                if "default" in spec:
+                    defaults[varname] = spec["default"]
             else:
-                sys.exit(f"tool.read_version.{attrib} must be a string or table")
-            log.debug("read_version: reading %s value from file", attrib)
-            value = read_version(path, **kwargs)
-            setattr(dist.metadata, attrib, value)
+                raise _ConfigError(
+                    f"tool.read_version.{attrib} must be a string or table"
+                )
+            fields.append((attrib, path, varname, defaults))
         else:
             log.warn("read_version: ignoring unknown field %r", attrib)
+    return fields
+
+
+def _read_fields(fields, log):
+    """
+    Read the values for the fields returned by `_parse_fields()`, parsing each
+    source file only once, and return a `dict` mapping field names to values
+    """
+    # Group the fields by source file so that each file is only parsed once
+    file_vars = {}
+    for _, path, varname, _ in fields:
+        file_vars.setdefault(path, set()).add(varname)
+    file_values = {}
+    for path, variables in file_vars.items():
+        log.debug("read_version: reading values from %s", path)
+        file_values[path] = _read_variables(path, variables)
+    return {
+        attrib: _get_value(file_values[path], varname, defaults)
+        for attrib, path, varname, defaults in fields
+    }
+
+
+def watch_versions(
+    specs,
+    callback,
+    project_root=None,
+    interval=1.0,
+    stop_event=None,
+    on_error=None,
+    force_polling=False,
+):
+    """
+    Watch the source files referenced by ``specs`` and call ``callback`` with
+    a `dict` of the extracted values whenever any of them changes (and once
+    at the start).  This function blocks until ``stop_event`` (a
+    `threading.Event`) is set, and so it is usually run in its own thread.
+
+    ``specs`` is a mapping in the same format as the ``tool.read_version``
+    table of ``pyproject.toml``, except that any keys are allowed.  If
+    ``specs`` is `None`, the ``tool.read_version`` table of the
+    ``pyproject.toml`` file in ``project_root`` is used instead, and it is
+    re-read whenever the file changes.  Paths are resolved relative to
+    ``project_root``, which defaults to the current directory.
+
+    On Linux, changes are detected with inotify; elsewhere (or if
+    ``force_polling`` is true), the files are polled every ``interval``
+    seconds.  Only files whose modification time or size changed are parsed
+    again.  If reading the values fails (e.g., because a file is being
+    edited), the exception is passed to ``on_error`` (if given), and the
+    callback is not called until the values can be read again.
+    """
+    import copy
+    from threading import Event
+    import time
+
+    project_root = os.path.abspath(project_root or os.curdir)
+    if stop_event is None:
+        stop_event = Event()
+    watcher = _SourceWatcher(specs, project_root)
+    notifier = None
+    if not force_polling and sys.platform.startswith("linux"):
+        try:
+            notifier = _Inotify()
+        except OSError:
+            pass
+    try:
+        while not stop_event.is_set():
+            try:
+                changed = watcher.refresh()
+            except Exception as e:
+                if on_error is not None:
+                    on_error(e)
+            else:
+                if changed:
+                    callback(copy.deepcopy(watcher.values))
+            if notifier is not None:
+                added = [notifier.watch(d) for d in watcher.directories()]
+                if any(added):
+                    # Anything that changed before the new watches were in
+                    # place would otherwise go unnoticed, so check again.
+                    continue
+                # Wait in short slices so that setting ``stop_event`` is
+                # noticed promptly even when nothing changes.
+                deadline = time.monotonic() + interval
+                while not stop_event.is_set():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or notifier.wait(min(remaining, 0.25)):
+                        break
+            else:
+                stop_event.wait(interval)
+    finally:
+        if notifier is not None:
+            notifier.close()
+
+
+class _SourceWatcher:
+    """
+    The state of a `watch_versions()` call: the fields being watched and the
+    signatures & values of their source files
+    """
+
+    def __init__(self, specs, project_root):
+        self.specs = specs
+        self.project_root = project_root
+        #: The files that the fields are configured in (or, for setup.cfg,
+        #: that the package layout used to resolve module names is)
+        self.config_files = [
+            os.path.join(project_root, "pyproject.toml"),
+            os.path.join(project_root, "setup.cfg"),
+        ]
+        if specs is None:
+            self.fields = None
+            self.config_sig = _NOTHING
+        else:
+            try:
+                self.fields = _parse_fields(
+                    specs, project_root, _WarningCollector(), allowed=None
+                )
+            except _ConfigError as e:
+                raise ValueError(str(e))
+        #: Mapping from source file paths to `(signature, values)` pairs
+        self.sources = {}
+        #: The last values reported to the callback, or `None`
+        self.values = None
+
+    def directories(self):
+        """Return the set of directories containing watched files"""
+        dirs = {os.path.dirname(path) for path in self.sources}
+        if self.specs is None:
+            dirs.add(self.project_root)
+        return dirs
+
+    def refresh(self):
+        """
+        Re-read ``pyproject.toml`` (if used) when it or ``setup.cfg`` has
+        changed and any changed source files, and return whether the extracted
+        values changed
+        """
+        dirty = False
+        if self.specs is None:
+            sig = [_stat_signature(path) for path in self.config_files]
+            if sig != self.config_sig:
+                # Record the signature first so that a broken file is not
+                # re-read (and its error not reported again) until it changes.
+                dirty = True
+                self.config_sig = sig
+                self.fields = None
+                cfg = _load_config(self.project_root, _WarningCollector())
+                if cfg is None:
+                    self.fields = []
+                else:
+                    try:
+                        self.fields = _parse_fields(
+                            cfg, self.project_root, _WarningCollector()
+                        )
+                    except _ConfigError as e:
+                        raise ValueError(str(e))
+            elif self.fields is None:
+                return False
+        file_vars = {}
+        for _, path, varname, _ in self.fields:
+            file_vars.setdefault(path, set()).add(varname)
+        for path in list(self.sources):
+            if path not in file_vars:
+                del self.sources[path]
+        for path, variables in file_vars.items():
+            sig = _stat_signature(path)
+            try:
+                old_sig, old_vars, values = self.sources[path]
+            except KeyError:
+                pass
+            else:
+                if old_sig == sig and variables <= old_vars:
+                    continue
+            # As above, a file that fails to parse is not parsed again until
+            # it changes.
+            dirty = True
+            try:
+                values = _read_variables(path, variables)
+            except Exception as e:
+                values = e
+            self.sources[path] = (sig, variables, values)
+        if not dirty:
+            return False
+        for _, _, values in self.sources.values():
+            if isinstance(values, Exception):
+                raise values
+        new_values = {
+            attrib: _get_value(self.sources[path][2], varname, defaults)
+            for attrib, path, varname, defaults in self.fields
+        }
+        if new_values != self.values:
+            self.values = new_values
+            return True
+        else:
+            return False
+
+
+class _Inotify:
+    """
+    A minimal `ctypes` binding to Linux's inotify for waiting until something
+    in one of a set of directories changes
+    """
+
+    # IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE |
+    # IN_DELETE
+    MASK = 0x004 | 0x008 | 0x040 | 0x080 | 0x100 | 0x200
+
+    def __init__(self):
+        import ctypes
+        import ctypes.util
+
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        try:
+            init = libc.inotify_init1
+        except AttributeError:
+            raise OSError("inotify not available")
+        # IN_NONBLOCK | IN_CLOEXEC
+        self.fd = init(os.O_NONBLOCK | 0o2000000)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1() failed")
+        self.libc = libc
+        self.watched = set()
+
+    def watch(self, dirpath):
+        """
+        Start watching ``dirpath`` and return whether it was not already being
+        watched
+        """
+        if dirpath in self.watched:
+            return False
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(dirpath), self.MASK)
+        if wd < 0:
+            # Nonexistent directories are not watched until they exist, though
+            # the files in them are still polled.
+            return False
+        self.watched.add(dirpath)
+        return True
+
+    def wait(self, timeout):
+        """
+        Wait up to ``timeout`` seconds for a change, discard the pending
+        events, and return whether there were any
+        """
+        import select
+
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return False
+        try:
+            while os.read(self.fd, 65536):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+    def close(self):
+        os.close(self.fd)
+
+
+def _scan_project(project_root):
+    """
+    Read the metadata fields configured in the ``pyproject.toml`` file in
+    ``project_root`` and return a JSON-serializable record of the results, or
+    `None` if the project does not configure ``read_version``
+    """
+    log = _WarningCollector()
+    record = {"project": project_root}
+    try:
+        cfg = _load_config(project_root, log)
+        if cfg is None and not log.warnings:
+            return None
+        if cfg is not None:
+            fields = _parse_fields(cfg, project_root, log)
+            record["fields"] = _read_fields(fields, log)
+    except _ConfigError as e:
+        record["error"] = str(e)
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+    if log.warnings:
+        record["warnings"] = log.warnings
+    return record
+
+
+def _find_projects(root):
+    """
+    Yield the directories at or below ``root`` that contain a
+    ``pyproject.toml`` file, skipping hidden directories
+    """
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(
+            d for d in dirnames if not d.startswith(".") and d != "__pycache__"
+        )
+        if "pyproject.toml" in filenames:
+            yield dirpath
+
+
+def _scan_command(args):
+    import json
+
+    if _get_toml_loads() is None:
+        sys.exit("read-version scan: a TOML library (tomli or toml) is required")
+    projects = [os.path.abspath(p) for p in _find_projects(args.root)]
+    if args.jobs == 1:
+        records = map(_scan_project, projects)
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+
+        executor = ProcessPoolExecutor(max_workers=args.jobs)
+        records = executor.map(_scan_project, projects, chunksize=CLI_CHUNKSIZE)
+    ok = True
+    try:
+        for rec in records:
+            if rec is not None:
+                ok = ok and "error" not in rec
+                print(json.dumps(rec, default=repr), flush=True)
+    finally:
+        if args.jobs != 1:
+            executor.shutdown()
+    return 0 if ok else 1
+
+
+def _read_file(task):
+    """
+    Read the variables from a file for the ``read-version read`` command and
+    return a JSON-serializable record of the results.  ``task`` is a tuple of
+    the file path, the variable names, the engine, the occurrence, and
+    whether to fold constants.
+    """
+    path, variables, engine, occurrence, fold_constants = task
+    record = {"file": path}
+    try:
+        values = _read_variables(
+            os.path.abspath(path),
+            variables,
+            engine,
+            occurrence=occurrence,
+            fold_constants=fold_constants,
+        )
+        record["values"] = {var: _get_value(values, var, {}) for var in variables}
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+    return record
+
+
+def _format_value(value, table=False):
+    """
+    Format a variable's value for plain output: strings are output as-is
+    (unless they would break a table row), and everything else as a Python
+    literal
+    """
+    if isinstance(value, str) and not (table and any(c in value for c in "\t\n\r")):
+        return value
+    else:
+        return repr(value)
+
+
+def _read_command(args):
+    import json
+
+    if not args.files and args.files_from is None:
+        sys.exit("read-version read: no files given")
+    paths = list(args.files)
+    if args.files_from is not None:
+        if args.files_from == "-":
+            data = sys.stdin.read()
+        else:
+            with open(args.files_from, encoding="utf-8") as fp:
+                data = fp.read()
+        if args.null:
+            paths.extend(p for p in data.split("\0") if p)
+        else:
+            paths.extend(p for p in data.splitlines() if p)
+    variables = args.variables or ["__version__"]
+    occurrence = "first" if args.first else "last"
+    tasks = [
+        (p, variables, args.engine, occurrence, args.fold_constants) for p in paths
+    ]
+    jobs = args.jobs
+    if jobs is None and len(tasks) <= CLI_CHUNKSIZE:
+        # Starting worker processes would take longer than reading the files.
+        jobs = 1
+    if jobs == 1:
+        records = map(_read_file, tasks)
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+
+        executor = ProcessPoolExecutor(max_workers=jobs)
+        records = executor.map(_read_file, tasks, chunksize=CLI_CHUNKSIZE)
+    ok = True
+    try:
+        for rec in records:
+            if "error" in rec:
+                ok = False
+                if args.format != "json":
+                    print(
+                        f"read-version: {rec['file']}: {rec['error']}", file=sys.stderr
+                    )
+                    continue
+            if args.format == "json":
+                print(json.dumps(rec, default=repr), flush=True)
+            elif args.format == "nul":
+                for var, value in rec["values"].items():
+                    sys.stdout.write(f"{rec['file']}\0{var}\0{_format_value(value)}\0")
+                sys.stdout.flush()
+            else:
+                for var, value in rec["values"].items():
+                    print(
+                        f"{rec['file']}\t{var}\t{_format_value(value, table=True)}",
+                        flush=True,
+                    )
+    finally:
+        if jobs != 1:
+            executor.shutdown()
+    return 0 if ok else 1
+
+
+def _positive_int(value):
+    """Parse a command-line argument as a positive integer"""
+    import argparse
+
+    try:
+        n = int(value)
+    except ValueError:
+        n = 0
+    if n < 1:
+        raise argparse.ArgumentTypeError(f"not a positive integer: {value!r}")
+    return n
+
+
+def main(argv=None):
+    """Entry point for the ``read-version`` command"""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="read-version",
+        description=(
+            "Extract variables from Python source files.  If no command is"
+            " given, the read command is assumed."
+        ),
+    )
+    subparsers = parser.add_subparsers(title="commands", dest="command")
+    subparsers.required = True
+    read_parser = subparsers.add_parser(
+        "read",
+        help="Read variables from Python source files",
+        description=(
+            "Read the values of the given variables from each FILE and output"
+            " them as JSON lines, NUL-separated records, or tab-separated rows"
+        ),
+    )
+    read_parser.add_argument(
+        "-v",
+        "--variable",
+        dest="variables",
+        action="append",
+        metavar="NAME",
+        help="Variable to read; can be given multiple times [default: __version__]",
+    )
+    read_parser.add_argument(
+        "-f",
+        "--format",
+        choices=["json", "nul", "table"],
+        default="table",
+        help="Output format [default: table]",
+    )
+    read_parser.add_argument(
+        "-T",
+        "--files-from",
+        metavar="LIST",
+        help="Also read file paths from LIST (one per line), or stdin if '-'",
+    )
+    read_parser.add_argument(
+        "-0",
+        "--null",
+        action="store_true",
+        help="Paths in --files-from are NUL-separated",
+    )
+    read_parser.add_argument(
+        "-e",
+        "--engine",
+        choices=ENGINES,
+        default="ast",
+        help="How to analyze the files [default: ast]",
+    )
+    read_parser.add_argument(
+        "--first",
+        action="store_true",
+        help="Read the first value assigned to each variable instead of the last",
+    )
+    read_parser.add_argument(
+        "--fold-constants",
+        action="store_true",
+        help="Evaluate computed values as constant expressions over earlier literals",
+    )
+    read_parser.add_argument(
+        "-j",
+        "--jobs",
+        type=_positive_int,
+        default=None,
+        help=(
+            "Number of worker processes to use [default: number of CPUs, or"
+            f" 1 for {CLI_CHUNKSIZE} files or fewer]"
+        ),
+    )
+    read_parser.add_argument("files", metavar="FILE", nargs="*", help="File to read")
+    read_parser.set_defaults(func=_read_command)
+    scan_parser = subparsers.add_parser(
+        "scan",
+        help="Read the tool.read_version fields of every project under a directory",
+        description=(
+            "Find every pyproject.toml file at or below ROOT and, for each"
+            " project that configures read_version, output a JSON object on"
+            " its own line giving the values of the metadata fields configured"
+            " in its tool.read_version table"
+        ),
+    )
+    scan_parser.add_argument(
+        "-j",
+        "--jobs",
+        type=_positive_int,
+        default=None,
+        help="Number of worker processes to use [default: number of CPUs]",
+    )
+    scan_parser.add_argument("root", metavar="ROOT", help="Directory to search")
+    scan_parser.set_defaults(func=_scan_command)
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv and argv[0] not in subparsers.choices and argv[0] not in ("-h", "--help"):
+        argv = ["read", *argv]
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
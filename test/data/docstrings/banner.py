@@ -0,0 +1,9 @@
+# ########################################################################## #
+# #                                                                        # #
+# #  Copyright (c) 2005-2025, Example Project Developers                   # #
+# #  All rights reserved.  ## See LICENSE.txt for details. ##              # #
+# #                                                                        # #
+# ########################################################################## #
+"""This docstring follows a license banner."""
+
+__version__ = "1.2.3"
@@ -0,0 +1,6 @@
+#!/usr/bin/env python
+# A comment before the docstring
+
+r"""This is a \raw docstring."""
+
+x = "This is not a docstring."
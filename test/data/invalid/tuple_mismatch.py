@@ -0,0 +1 @@
+__version__, a = "1.2.3", 2, 3
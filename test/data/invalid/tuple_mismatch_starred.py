@@ -0,0 +1 @@
+__version__, *a, b, c = ["1.2.3", 2]
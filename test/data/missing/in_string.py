@@ -0,0 +1,6 @@
+'''
+__version__ = "1.2.3"
+'''
+"""
+__version__ = "1.2.3"
+"""
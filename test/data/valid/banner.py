@@ -0,0 +1,10 @@
+# ########################################################################## #
+# #                                                                        # #
+# #  Copyright (c) 2005-2025, Example Project Developers                   # #
+# #  All rights reserved.  ## See LICENSE.txt for details. ##              # #
+# #                                                                        # #
+# ########################################################################## #
+"""Module docstring"""
+
+__version__ = "1.2.3"
+__custom__ = 42
@@ -0,0 +1,29 @@
+import sys
+
+
+@staticmethod
+@property
+def get_version():
+    __version__ = "0.0.0"
+    return __version__
+
+
+try:
+    __version__ = "0.1.0"
+except ImportError:
+    __version__ = "0.2.0"
+else:
+    pass
+finally:
+    pass
+
+if sys.version_info[0] > 2: __custom__ = 23
+
+__version__ = \
+    "1.2.3"
+__custom__ = (
+    42
+)
+__unused__ = [
+__version__,
+__custom__ ]
@@ -0,0 +1,8 @@
+"""
+__version__ = "0.0.0"
+"""
+__version__ = "1.2.3"
+notes = '''
+__custom__ = 23
+'''
+__custom__ = 42
@@ -1,2 +1,3 @@
 __version__ = ".".join(map(str, range(3)))
 __version__ = "1.2.3"
+__custom__ = 42
@@ -0,0 +1,2 @@
+a, __version__ = [1 / 0, "1.2.3"]
+__custom__, b = 42, pow(0, 0)
@@ -0,0 +1,2 @@
+a, *b, __version__ = "x", "y", "z", "1.2.3"
+__custom__, *c, d = 42, ["foo"]
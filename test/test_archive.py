@@ -0,0 +1,141 @@
+import io
+import os
+from os.path import dirname, join
+import tarfile
+import zipfile
+import pytest
+from read_version import (
+    ENGINES,
+    cache_clear,
+    cache_info,
+    disable_cache,
+    enable_cache,
+    read_variables,
+    read_version,
+)
+
+DATA_DIR = join(dirname(__file__), "data")
+
+VALID = sorted(os.listdir(join(DATA_DIR, "valid")))
+
+
+@pytest.fixture(scope="module")
+def sdist(tmp_path_factory):
+    path = tmp_path_factory.mktemp("archives") / "pkg-1.0.tar.gz"
+    with tarfile.open(str(path), "w:gz") as tf:
+        tf.add(join(DATA_DIR, "valid"), arcname="pkg-1.0/pkg")
+    return str(path)
+
+
+@pytest.fixture(scope="module")
+def wheel(tmp_path_factory):
+    path = tmp_path_factory.mktemp("archives") / "pkg-1.0-py3-none-any.whl"
+    with zipfile.ZipFile(str(path), "w") as zf:
+        for fname in VALID:
+            zf.write(join(DATA_DIR, "valid", fname), f"pkg/{fname}")
+    return str(path)
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize("fname", VALID)
+def test_read_version_sdist(sdist, fname, engine):
+    assert read_version(f"{sdist}!/pkg-1.0/pkg/{fname}", engine=engine) == "1.2.3"
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize("fname", VALID)
+def test_read_version_wheel(wheel, fname, engine):
+    assert read_version(wheel + "!/pkg", fname, engine=engine) == "1.2.3"
+
+
+def test_read_version_archive_dot_slash(tmp_path):
+    path = tmp_path / "pkg.tar"
+    with tarfile.open(str(path), "w") as tf:
+        tf.add(join(DATA_DIR, "valid", "latin1.py"), arcname="./latin1.py")
+    assert read_version(f"{path}!/latin1.py") == "1.2.3"
+    assert read_variables(
+        f"{path}!/latin1.py",
+        variables=["__version__", "nonascii"],
+        occurrence="first",
+    ) == read_variables(
+        "data", "valid", "latin1.py", variables=["__version__", "nonascii"]
+    )
+
+
+def test_read_version_archive_first(sdist, wheel):
+    for archive, prefix in [(sdist, "pkg-1.0/pkg"), (wheel, "pkg")]:
+        assert (
+            read_version(f"{archive}!/{prefix}/overwrite.py", occurrence="first")
+            == "42"
+        )
+
+
+@pytest.mark.parametrize("member", ["pkg/nonexistent.py", "pkg-1.0/pkg"])
+def test_read_version_archive_no_member(sdist, member):
+    with pytest.raises(FileNotFoundError):
+        read_version(f"{sdist}!/{member}")
+
+
+def test_read_version_archive_not_archive():
+    with pytest.raises(ValueError, match="not a zip or tar archive"):
+        read_version(join(DATA_DIR, "valid", "simple.py") + "!/simple.py")
+
+
+def test_read_version_archive_cache(wheel):
+    enable_cache()
+    try:
+        for _ in range(2):
+            assert read_version(f"{wheel}!/pkg/simple.py") == "1.2.3"
+        assert cache_info().hits == 1
+    finally:
+        cache_clear()
+        disable_cache()
+
+
+def test_read_version_archive_disk_cache(tmp_path, wheel):
+    for _ in range(2):
+        assert (
+            read_version(f"{wheel}!/pkg/simple.py", cache_dir=str(tmp_path)) == "1.2.3"
+        )
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize("fname", VALID)
+def test_read_version_bytes(fname, engine):
+    with open(join(DATA_DIR, "valid", fname), "rb") as fp:
+        src = fp.read()
+    assert read_version(src, engine=engine) == "1.2.3"
+    assert read_version(bytearray(src), variable="__custom__", engine=engine) == 42
+
+
+@pytest.mark.parametrize("fname", VALID)
+def test_read_version_fileobj(fname):
+    with open(join(DATA_DIR, "valid", fname), "rb") as fp:
+        assert read_version(fp) == "1.2.3"
+        assert not fp.closed
+
+
+def test_read_version_fileobj_first():
+    with open(join(DATA_DIR, "valid", "latin1.py"), "rb") as fp:
+        assert read_version(fp, occurrence="first") == "1.2.3"
+
+
+def test_read_variables_bytes():
+    assert read_variables(
+        b'"""Docstring"""\n__version__ = "1.2.3"\n',
+        variables=["__version__", "__doc__"],
+    ) == {"__version__": "1.2.3", "__doc__": "Docstring"}
+
+
+def test_read_version_bytes_cached():
+    enable_cache()
+    try:
+        assert read_version(b'__version__ = "1.2.3"\n') == "1.2.3"
+        assert cache_info().misses == 0
+    finally:
+        disable_cache()
+
+
+def test_read_version_text_fileobj():
+    with pytest.raises(TypeError, match="binary mode"):
+        read_version(io.StringIO('__version__ = "1.2.3"\n'))
@@ -0,0 +1,113 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import os
+from os.path import dirname, join
+import pytest
+from read_version import (
+    ENGINES,
+    aread_many,
+    aread_version,
+    cache_info,
+    disable_cache,
+    enable_cache,
+)
+
+DATA_DIR = join(dirname(__file__), "data")
+
+VALID = sorted(os.listdir(join(DATA_DIR, "valid")))
+
+MISSING = os.listdir(join(DATA_DIR, "missing"))[0]
+
+
+def run(awaitable):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(awaitable)
+    finally:
+        loop.close()
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize("fname", VALID)
+def test_aread_version(fname, engine):
+    assert run(aread_version("data", "valid", fname, engine=engine)) == "1.2.3"
+
+
+def test_aread_version_options():
+    assert run(aread_version("data", "valid", "latin1.py", variable="__custom__")) == 42
+    assert (
+        run(aread_version("data", "missing", MISSING, default="DEFAULT")) == "DEFAULT"
+    )
+    assert (
+        run(
+            aread_version(
+                "data", "docstrings", "onestring.py", variable="__doc__", default=None
+            )
+        )
+        == "\nThis is a docstring.\n"
+    )
+    assert (
+        run(aread_version("data", "valid", "overwrite.py", occurrence="first")) == "42"
+    )
+    assert run(aread_version(b'__version__ = "1.2.3"\n')) == "1.2.3"
+
+
+def test_aread_version_missing():
+    with pytest.raises(ValueError, match="No assignment to '__version__' found"):
+        run(aread_version("data", "missing", MISSING))
+
+
+def test_aread_version_invalid_engine():
+    with pytest.raises(ValueError, match="Invalid engine: 'regex'"):
+        run(aread_version("data", "valid", "simple.py", engine="regex"))
+
+
+def test_aread_version_task():
+    # The relative path is resolved when aread_version() is called, even
+    # though the result is awaited in a task.
+    async def main():
+        task = asyncio.ensure_future(aread_version("data", "valid", "simple.py"))
+        return await task
+
+    assert run(main()) == "1.2.3"
+
+
+def test_aread_version_cached():
+    enable_cache()
+    try:
+        for _ in range(2):
+            assert run(aread_version("data", "valid", "simple.py")) == "1.2.3"
+        assert cache_info().hits == 1
+    finally:
+        disable_cache()
+
+
+@pytest.mark.parametrize("limit", [None, 1, 3])
+def test_aread_many(limit):
+    paths = [join("data", "valid", fname) for fname in VALID]
+    assert run(aread_many(paths, limit=limit, engine="scan")) == ["1.2.3"] * len(VALID)
+
+
+def test_aread_many_base_dir():
+    assert run(
+        aread_many(["simple.py", "utf8.py"], base_dir=join(DATA_DIR, "valid"))
+    ) == ["1.2.3", "1.2.3"]
+
+
+def test_aread_many_errors():
+    paths = [join("data", "valid", "simple.py"), join("data", "missing", MISSING)]
+    with pytest.raises(ValueError):
+        run(aread_many(paths))
+    simple, err = run(aread_many(paths, return_exceptions=True))
+    assert simple == "1.2.3"
+    assert isinstance(err, ValueError)
+    assert run(aread_many(paths, default=None)) == ["1.2.3", None]
+
+
+@pytest.mark.parametrize("executor_class", [ThreadPoolExecutor, ProcessPoolExecutor])
+def test_aread_many_executor(executor_class):
+    paths = [join(DATA_DIR, "valid", fname) for fname in VALID]
+    with executor_class(max_workers=2) as executor:
+        assert run(
+            aread_many(paths, variable="__custom__", executor=executor, limit=4)
+        ) == [42] * len(VALID)
@@ -0,0 +1,423 @@
+import os
+from os.path import dirname, join
+import shutil
+import pytest
+import setuptools.build_meta
+import read_version
+from read_version import build_meta, set_profile_hook
+
+pytestmark = [
+    pytest.mark.requires_toml,
+    # Emitted by setuptools' metadata hooks when an older setuptools is
+    # used with a newer wheel
+    pytest.mark.filterwarnings("ignore:The 'wheel' package:FutureWarning"),
+]
+
+PROJECT_DIR = join(dirname(__file__), "data", "projects")
+
+
+@pytest.fixture
+def project(monkeypatch, tmp_path):
+    path = tmp_path / "project"
+    shutil.copytree(join(PROJECT_DIR, "list-path"), str(path))
+    monkeypatch.chdir(path)
+    return path
+
+
+def prepare(tmp_path, hook="prepare_metadata_for_build_wheel", **kwargs):
+    """
+    Run a metadata hook of `build_meta` in a fresh directory and return the
+    contents of the METADATA file and whether the cache was used
+    """
+    n = len(list(tmp_path.glob("metadata*")))
+    metadata_directory = tmp_path / f"metadata{n}"
+    metadata_directory.mkdir()
+    summaries = []
+    set_profile_hook(summaries.append)
+    try:
+        name = getattr(build_meta, hook)(str(metadata_directory), **kwargs)
+    finally:
+        set_profile_hook(None)
+    assert name.endswith(".dist-info")
+    metadata = (metadata_directory / name / "METADATA").read_text()
+    (summary,) = summaries
+    assert summary["operation"] == "prepare_metadata"
+    hits = summary["counters"]["metadata_cache_hits"]
+    misses = summary["counters"]["metadata_cache_misses"]
+    assert hits + misses == 1
+    return metadata, bool(hits)
+
+
+def test_build_meta_cache(project, tmp_path):
+    metadata, cached = prepare(tmp_path)
+    assert "Version: 1.3.2.4\n" in metadata
+    assert not cached
+    assert prepare(tmp_path) == (metadata, True)
+    # Changing a file that a metadata field is read from
+    src = project / "foobar" / "__init__.py"
+    src.write_text(src.read_text().replace("1.3.2.4", "1.3.2.5"))
+    metadata, cached = prepare(tmp_path)
+    assert "Version: 1.3.2.5\n" in metadata
+    assert not cached
+    assert prepare(tmp_path) == (metadata, True)
+    # Changing setup.py
+    setup_py = project / "setup.py"
+    setup_py.write_text(setup_py.read_text().replace("A test", "A cached"))
+    metadata, cached = prepare(tmp_path)
+    assert "Summary: A cached package\n" in metadata
+    assert not cached
+    # Adding a file to the project root
+    (project / "requirements.txt").write_text("")
+    assert prepare(tmp_path) == (metadata, False)
+    assert prepare(tmp_path) == (metadata, True)
+    # Passing different config settings
+    settings = {"--global-option": ["--quiet"]}
+    assert prepare(tmp_path, config_settings=settings) == (metadata, False)
+    assert prepare(tmp_path, config_settings=settings) == (metadata, True)
+    assert prepare(tmp_path) == (metadata, False)
+
+
+def test_build_meta_setup_cfg_file(project, tmp_path):
+    (project / "docs").mkdir()
+    (project / "docs" / "README.rst").write_text("Read me.\n")
+    (project / "setup.cfg").write_text(
+        "[metadata]\nlong_description = file: docs/README.rst\n"
+    )
+    metadata, cached = prepare(tmp_path)
+    assert "Read me." in metadata
+    assert not cached
+    assert prepare(tmp_path) == (metadata, True)
+    (project / "docs" / "README.rst").write_text("Read me again.\n")
+    metadata, cached = prepare(tmp_path)
+    assert "Read me again." in metadata
+    assert not cached
+
+
+def test_build_meta_setup_py_reads(monkeypatch, tmp_path):
+    project = tmp_path / "project"
+    (project / "foo").mkdir(parents=True)
+    (project / "setup.py").write_text(
+        "from setuptools import setup\n"
+        "from read_version import read_version\n"
+        "\n"
+        'setup(name="foo", version=read_version("foo", "__init__.py"),'
+        ' packages=["foo"])\n'
+    )
+    src = project / "foo" / "__init__.py"
+    src.write_text('__version__ = "1.0"\n')
+    monkeypatch.chdir(project)
+    metadata, cached = prepare(tmp_path)
+    assert "Version: 1.0\n" in metadata
+    assert not cached
+    assert prepare(tmp_path) == (metadata, True)
+    src.write_text('__version__ = "2.0"\n')
+    metadata, cached = prepare(tmp_path)
+    assert "Version: 2.0\n" in metadata
+    assert not cached
+
+
+def test_build_meta_setup_py_not_declarative(monkeypatch, tmp_path):
+    # setup.py may compute metadata from anything, so unless it only passes
+    # literals to setup(), what it depends on is unknown.
+    project = tmp_path / "project"
+    (project / "foo").mkdir(parents=True)
+    (project / "setup.py").write_text(
+        "import re\n"
+        "from setuptools import setup\n"
+        "\n"
+        'with open("foo/__init__.py") as fp:\n'
+        "    version = re.search(r'__version__ = \"(.+)\"', fp.read()).group(1)\n"
+        "\n"
+        'setup(name="foo", version=version, packages=["foo"])\n'
+    )
+    src = project / "foo" / "__init__.py"
+    src.write_text('__version__ = "1.0"\n')
+    monkeypatch.chdir(project)
+    metadata, cached = prepare(tmp_path)
+    assert "Version: 1.0\n" in metadata
+    assert not cached
+    assert prepare(tmp_path) == (metadata, False)
+    src.write_text('__version__ = "2.0"\n')
+    metadata, cached = prepare(tmp_path)
+    assert "Version: 2.0\n" in metadata
+    assert not cached
+
+
+@pytest.mark.parametrize(
+    "setup_py,declarative",
+    [
+        ("from setuptools import setup\n\nsetup()\n", True),
+        (
+            '"""Setup script"""\n'
+            "import setuptools\n"
+            "\n"
+            'if __name__ == "__main__":\n'
+            '    setuptools.setup(name="foo", packages=["foo"])\n',
+            True,
+        ),
+        (
+            "from setuptools import setup\n"
+            "from read_version import read_version as rv\n"
+            "\n"
+            'setup(version=rv("foo/__init__.py", "__version__"))\n',
+            True,
+        ),
+        (
+            "from setuptools import setup, find_packages\n"
+            "\n"
+            "setup(packages=find_packages())\n",
+            False,
+        ),
+        (
+            "import os\n"
+            "from setuptools import setup\n"
+            "\n"
+            'setup(version=os.environ["VERSION"])\n',
+            False,
+        ),
+        (
+            "from setuptools import setup\n"
+            "from read_version import read_version\n"
+            "\n"
+            'setup(version=read_version("foo.py", NAME))\n',
+            False,
+        ),
+        ("from setuptools import setup\n\nsetup(**{})\n", False),
+        ("from setuptools import setup\n\nsetup(\n", False),
+    ],
+)
+def test_setup_py_is_declarative(tmp_path, setup_py, declarative):
+    assert read_version._setup_py_is_declarative(str(tmp_path))
+    (tmp_path / "setup.py").write_text(setup_py)
+    assert read_version._setup_py_is_declarative(str(tmp_path)) is declarative
+
+
+def make_project(monkeypatch, tmp_path, files):
+    project = tmp_path / "project"
+    for relpath, text in files.items():
+        path = project / relpath
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text)
+    monkeypatch.chdir(project)
+    return project
+
+
+def test_build_meta_setup_cfg_attr(monkeypatch, tmp_path):
+    project = make_project(
+        monkeypatch,
+        tmp_path,
+        {
+            "setup.py": "from setuptools import setup\n\nsetup()\n",
+            "setup.cfg": (
+                "[metadata]\n"
+                "name = foobar\n"
+                "version = attr: foobar.__version__\n"
+                "long_description = file: docs/README.rst\n"
+                "\n"
+                "[options]\n"
+                "package_dir =\n"
+                "    =lib\n"
+                "packages = foobar\n"
+            ),
+            "docs/README.rst": "Read me.\n",
+            "lib/foobar/__init__.py": '__version__ = "1.0"\n',
+        },
+    )
+    metadata, cached = prepare(tmp_path)
+    assert "Version: 1.0\n" in metadata
+    assert not cached
+    assert prepare(tmp_path) == (metadata, True)
+    (project / "lib" / "foobar" / "__init__.py").write_text('__version__ = "2.0"\n')
+    metadata, cached = prepare(tmp_path)
+    assert "Version: 2.0\n" in metadata
+    assert not cached
+
+
+# Emitted by setuptools versions that consider `[tool.setuptools]` a beta
+# feature
+@pytest.mark.filterwarnings("ignore:Support for `\\[tool.setuptools\\]`")
+def test_build_meta_pyproject_dynamic(monkeypatch, tmp_path):
+    project = make_project(
+        monkeypatch,
+        tmp_path,
+        {
+            "pyproject.toml": (
+                "[project]\n"
+                'name = "foobar"\n'
+                'dynamic = ["version", "description"]\n'
+                'readme = "docs/README.rst"\n'
+                "\n"
+                "[tool.setuptools]\n"
+                'packages = ["foobar"]\n'
+                "\n"
+                "[tool.setuptools.dynamic]\n"
+                'version = {attr = "foobar.__version__"}\n'
+                'description = {file = "docs/summary.txt"}\n'
+            ),
+            "docs/README.rst": "Read me.\n",
+            "docs/summary.txt": "A summary",
+            "foobar/__init__.py": '__version__ = "1.0"\n',
+        },
+    )
+    metadata, cached = prepare(tmp_path)
+    assert "Version: 1.0\n" in metadata
+    assert not cached
+    assert prepare(tmp_path) == (metadata, True)
+    (project / "foobar" / "__init__.py").write_text('__version__ = "2.0"\n')
+    metadata, cached = prepare(tmp_path)
+    assert "Version: 2.0\n" in metadata
+    assert not cached
+    assert prepare(tmp_path) == (metadata, True)
+    (project / "docs" / "summary.txt").write_text("Another summary")
+    metadata, cached = prepare(tmp_path)
+    assert "Summary: Another summary\n" in metadata
+    assert not cached
+    (project / "docs" / "README.rst").write_text("Read me again.\n")
+    metadata, cached = prepare(tmp_path)
+    assert "Read me again." in metadata
+    assert not cached
+
+
+def test_build_meta_attr_not_literal(monkeypatch, tmp_path):
+    # setuptools executes the module to get the value, so what it depends on
+    # is unknown.
+    make_project(
+        monkeypatch,
+        tmp_path,
+        {
+            "setup.py": "from setuptools import setup\n\nsetup()\n",
+            "setup.cfg": (
+                "[metadata]\n"
+                "name = foobar\n"
+                "version = attr: foobar.__version__\n"
+                "\n"
+                "[options]\n"
+                "packages = foobar\n"
+            ),
+            "foobar/__init__.py": "from ._version import __version__\n",
+            "foobar/_version.py": '__version__ = "1.0"\n',
+        },
+    )
+    metadata, cached = prepare(tmp_path)
+    assert "Version: 1.0\n" in metadata
+    assert not cached
+    assert prepare(tmp_path) == (metadata, False)
+
+
+@pytest.mark.parametrize(
+    "requires,cached",
+    [
+        ('["setuptools>=42", "wheel", "read_version[toml] ~= 0.4.0"]', True),
+        ('["setuptools>=42", "setuptools_scm[toml]>=6.2", "wheel"]', False),
+        ('["setuptools>=42", "Setuptools-Git-Versioning"]', False),
+    ],
+)
+def test_build_meta_build_requires(monkeypatch, tmp_path, requires, cached):
+    # Setuptools plugins (e.g., setuptools_scm, which reads the version from
+    # git) can compute metadata from anything.
+    make_project(
+        monkeypatch,
+        tmp_path,
+        {
+            "pyproject.toml": (
+                "[build-system]\n"
+                f"requires = {requires}\n"
+                'build-backend = "read_version:build_meta"\n'
+            ),
+            "setup.cfg": (
+                "[metadata]\n"
+                "name = foobar\n"
+                "version = 1.0\n"
+                "\n"
+                "[options]\n"
+                "py_modules = foobar\n"
+            ),
+            "foobar.py": "",
+        },
+    )
+    metadata, _ = prepare(tmp_path)
+    assert "Version: 1.0\n" in metadata
+    assert prepare(tmp_path) == (metadata, cached)
+
+
+@pytest.mark.parametrize(
+    "egg_info,cached",
+    [
+        ("tag_build = .dev\ntag_date = 0\n", True),
+        ("tag_build = .dev\ntag_date = 1\n", False),
+        ("tag_date = true\n", False),
+    ],
+)
+def test_build_meta_egg_info_tags(monkeypatch, tmp_path, egg_info, cached):
+    # The date that tag_date adds to the version changes every day.
+    make_project(
+        monkeypatch,
+        tmp_path,
+        {
+            "setup.cfg": (
+                "[metadata]\n"
+                "name = foobar\n"
+                "version = 1.0\n"
+                "\n"
+                "[options]\n"
+                "py_modules = foobar\n"
+                "\n"
+                "[egg_info]\n" + egg_info
+            ),
+            "foobar.py": "",
+        },
+    )
+    metadata, _ = prepare(tmp_path)
+    assert "Version: 1.0." in metadata
+    assert prepare(tmp_path) == (metadata, cached)
+
+
+@pytest.mark.usefixtures("project")
+def test_build_meta_read_version_upgrade(monkeypatch, tmp_path):
+    metadata, _ = prepare(tmp_path)
+    assert prepare(tmp_path) == (metadata, True)
+    monkeypatch.setattr(read_version, "__version__", "99.0")
+    assert prepare(tmp_path) == (metadata, False)
+    assert prepare(tmp_path) == (metadata, True)
+
+
+def test_build_meta_new_package(project, tmp_path):
+    metadata, _ = prepare(tmp_path)
+    (project / "newpkg").mkdir()
+    (project / "newpkg" / "__init__.py").write_text("")
+    assert prepare(tmp_path) == (metadata, False)
+
+
+def test_build_meta_corrupt_cache(project, tmp_path):
+    metadata, _ = prepare(tmp_path)
+    entry = project / "build" / "read_version-metadata"
+    (manifest,) = entry.glob("*/manifest.json")
+    manifest.write_text("{")
+    assert prepare(tmp_path) == (metadata, False)
+    assert prepare(tmp_path) == (metadata, True)
+
+
+@pytest.mark.skipif(
+    not hasattr(setuptools.build_meta, "prepare_metadata_for_build_editable"),
+    reason="Requires PEP 660 support in setuptools",
+)
+@pytest.mark.usefixtures("project")
+def test_build_meta_editable(tmp_path):
+    hook = "prepare_metadata_for_build_editable"
+    metadata, cached = prepare(tmp_path, hook)
+    assert "Version: 1.3.2.4\n" in metadata
+    assert not cached
+    assert prepare(tmp_path, hook) == (metadata, True)
+
+
+def test_build_meta_delegates():
+    assert build_meta.build_sdist is setuptools.build_meta.build_sdist
+    assert (
+        build_meta.get_requires_for_build_wheel
+        is setuptools.build_meta.get_requires_for_build_wheel
+    )
+    assert hasattr(build_meta, "prepare_metadata_for_build_editable") == hasattr(
+        setuptools.build_meta, "prepare_metadata_for_build_editable"
+    )
+    assert not hasattr(build_meta, "nonexistent_hook")
+    assert os.path.join("build", "read_version-metadata") == build_meta.CACHE_DIR
@@ -0,0 +1,151 @@
+import os
+from os.path import dirname, join
+import pytest
+import read_version as read_version_module
+from read_version import (
+    CacheInfo,
+    cache_clear,
+    cache_info,
+    disable_cache,
+    enable_cache,
+    read_variables,
+    read_version,
+)
+
+DATA_DIR = join(dirname(__file__), "data")
+
+
+@pytest.fixture
+def cache():
+    enable_cache(maxsize=2)
+    yield
+    disable_cache()
+
+
+def test_cache_disabled():
+    assert cache_info() is None
+    cache_clear()
+    assert read_version("data", "valid", "simple.py") == "1.2.3"
+    assert cache_info() is None
+
+
+@pytest.mark.usefixtures("cache")
+@pytest.mark.parametrize("fname", os.listdir(join(DATA_DIR, "valid")))
+def test_cached_read_version(fname):
+    assert read_version("data", "valid", fname) == "1.2.3"
+    assert read_version("data", "valid", fname, variable="__custom__") == 42
+    assert cache_info() == CacheInfo(hits=1, misses=1, maxsize=2, currsize=1)
+
+
+@pytest.mark.usefixtures("cache")
+@pytest.mark.parametrize(
+    "filename,expected",
+    [
+        ("onestring.py", "\nThis is a docstring.\n"),
+        ("adjstrings.py", " This is a  docstring. "),
+        ("twostrings.py", " This is a docstring. "),
+        ("overridden.py", "This overrides the module docstring."),
+        ("prefixed.py", "This is a \\raw docstring."),
+    ],
+)
+def test_cached_docstring(filename, expected):
+    s = read_version("data", "docstrings", filename, variable="__doc__")
+    assert s == expected
+
+
+@pytest.mark.usefixtures("cache")
+def test_cache_invalidated_on_change(tmp_path):
+    src = tmp_path / "foo.py"
+    src.write_text('__version__ = "1.2.3"\n')
+    assert read_version(str(src)) == "1.2.3"
+    src.write_text('__version__ = "1.2.34"\n')
+    assert read_version(str(src)) == "1.2.34"
+    st = os.stat(src)
+    src.write_text('__version__ = "5.6.78"\n')
+    os.utime(src, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    assert read_version(str(src)) == "5.6.78"
+    assert read_version(str(src)) == "5.6.78"
+    assert cache_info() == CacheInfo(hits=1, misses=3, maxsize=2, currsize=1)
+
+
+@pytest.mark.usefixtures("cache")
+def test_cache_eviction():
+    for fname in ["simple.py", "tuple.py", "simple.py", "overwrite.py", "tuple.py"]:
+        read_version("data", "valid", fname)
+    assert cache_info() == CacheInfo(hits=1, misses=4, maxsize=2, currsize=2)
+    cache_clear()
+    assert cache_info() == CacheInfo(hits=0, misses=0, maxsize=2, currsize=0)
+
+
+@pytest.mark.usefixtures("cache")
+def test_cache_resize():
+    for fname in ["simple.py", "tuple.py"]:
+        read_variables("data", "valid", fname, variables=["__version__"])
+    enable_cache(maxsize=1)
+    assert cache_info() == CacheInfo(hits=0, misses=2, maxsize=1, currsize=1)
+    assert read_version("data", "valid", "tuple.py") == "1.2.3"
+    assert cache_info() == CacheInfo(hits=1, misses=2, maxsize=1, currsize=1)
+
+
+def fail_parse(*_args, **_kwargs):
+    raise AssertionError("File should not have been parsed")
+
+
+def test_disk_cache(monkeypatch, tmp_path):
+    src = tmp_path / "foo.py"
+    src.write_text('__version__ = "1.2.3"\n__author__ = ("Me", b"You")\n')
+    cache_dir = tmp_path / "cache"
+    assert read_variables(
+        str(src),
+        variables=["__version__", "__author__", "__custom__"],
+        defaults={"__custom__": None},
+        cache_dir=str(cache_dir),
+    ) == {"__version__": "1.2.3", "__author__": ("Me", b"You"), "__custom__": None}
+    monkeypatch.setattr(read_version_module, "_parse_variables", fail_parse)
+    assert read_version(str(src), cache_dir=str(cache_dir)) == "1.2.3"
+    assert read_version(str(src), variable="__author__", cache_dir=str(cache_dir)) == (
+        "Me",
+        b"You",
+    )
+    with pytest.raises(ValueError, match="No assignment to '__custom__' found in file"):
+        read_version(str(src), variable="__custom__", cache_dir=str(cache_dir))
+
+
+def test_disk_cache_env(monkeypatch, tmp_path):
+    src = tmp_path / "foo.py"
+    src.write_text('__version__ = "1.2.3"\n')
+    monkeypatch.setenv("READ_VERSION_CACHE_DIR", str(tmp_path / "cache"))
+    assert read_version(str(src)) == "1.2.3"
+    src.write_text('__version__ = "1.2.34"\n')
+    assert read_version(str(src)) == "1.2.34"
+    monkeypatch.setattr(read_version_module, "_parse_variables", fail_parse)
+    assert read_version(str(src)) == "1.2.34"
+
+
+def test_disk_cache_unrepresentable(monkeypatch, tmp_path):
+    src = tmp_path / "foo.py"
+    src.write_text("__version__ = 1e999\n")
+    cache_dir = str(tmp_path / "cache")
+    assert read_version(str(src), cache_dir=cache_dir) == float("inf")
+    monkeypatch.setattr(read_version_module, "_parse_variables", fail_parse)
+    with pytest.raises(AssertionError):
+        read_version(str(src), cache_dir=cache_dir)
+
+
+def test_disk_cache_eviction(monkeypatch, tmp_path):
+    monkeypatch.setenv("READ_VERSION_CACHE_MAX_ENTRIES", "2")
+    cache_dir = str(tmp_path / "cache")
+    for fname in ["simple.py", "tuple.py", "overwrite.py"]:
+        read_version("data", "valid", fname, cache_dir=cache_dir)
+    monkeypatch.setattr(read_version_module, "_parse_variables", fail_parse)
+    assert read_version("data", "valid", "overwrite.py", cache_dir=cache_dir) == "1.2.3"
+    assert read_version("data", "valid", "tuple.py", cache_dir=cache_dir) == "1.2.3"
+    with pytest.raises(AssertionError):
+        read_version("data", "valid", "simple.py", cache_dir=cache_dir)
+
+
+@pytest.mark.usefixtures("cache")
+def test_cached_first():
+    assert read_version("data", "valid", "overwrite.py", occurrence="first") == "42"
+    assert read_version("data", "valid", "overwrite.py") == "1.2.3"
+    assert cache_info() == CacheInfo(hits=1, misses=1, maxsize=2, currsize=1)
@@ -0,0 +1,103 @@
+import io
+import json
+import os
+from os.path import dirname, join
+import pytest
+from read_version import main
+
+DATA_DIR = join(dirname(__file__), "data")
+
+VALID = sorted(
+    join(DATA_DIR, "valid", fname) for fname in os.listdir(join(DATA_DIR, "valid"))
+)
+
+
+def test_read_table(capsys):
+    path = join(DATA_DIR, "valid", "simple.py")
+    assert main(["-v", "__version__", "-v", "__custom__", path]) == 0
+    out, err = capsys.readouterr()
+    assert out == f"{path}\t__version__\t1.2.3\n{path}\t__custom__\t42\n"
+    assert err == ""
+
+
+def test_read_default_variable(capsys):
+    path = join(DATA_DIR, "valid", "simple.py")
+    assert main(["read", path]) == 0
+    out, _ = capsys.readouterr()
+    assert out == f"{path}\t__version__\t1.2.3\n"
+
+
+def test_read_table_escapes(capsys):
+    path = join(DATA_DIR, "docstrings", "onestring.py")
+    assert main(["-v", "__doc__", path]) == 0
+    out, _ = capsys.readouterr()
+    assert out == f"{path}\t__doc__\t'\\nThis is a docstring.\\n'\n"
+
+
+@pytest.mark.parametrize("jobs", ["1", "2"])
+def test_read_json(capsys, jobs):
+    missing = join(DATA_DIR, "missing", os.listdir(join(DATA_DIR, "missing"))[0])
+    assert main(["-f", "json", "-j", jobs, "-e", "scan", *VALID, missing]) == 1
+    out, _ = capsys.readouterr()
+    records = [json.loads(line) for line in out.splitlines()]
+    assert records == [
+        {"file": path, "values": {"__version__": "1.2.3"}} for path in VALID
+    ] + [
+        {
+            "file": missing,
+            "error": "ValueError: No assignment to '__version__' found in file",
+        }
+    ]
+
+
+def test_read_nul(capsys):
+    paths = [join(DATA_DIR, "valid", "simple.py"), join(DATA_DIR, "valid", "utf8.py")]
+    assert main(["-f", "nul", "-v", "__custom__", *paths]) == 0
+    out, _ = capsys.readouterr()
+    assert out == "".join(f"{p}\0__custom__\0{42}\0" for p in paths)
+
+
+def test_read_error(capsys):
+    path = join(DATA_DIR, "valid", "simple.py")
+    assert main(["-v", "__nonexistent__", path]) == 1
+    out, err = capsys.readouterr()
+    assert out == ""
+    assert err == (
+        f"read-version: {path}: ValueError: No assignment to '__nonexistent__'"
+        " found in file\n"
+    )
+
+
+@pytest.mark.parametrize("null", [False, True])
+def test_read_files_from_stdin(capsys, monkeypatch, null):
+    sep = "\0" if null else "\n"
+    monkeypatch.setattr("sys.stdin", io.StringIO(sep.join(VALID) + sep))
+    argv = ["-f", "json", "-T", "-"]
+    if null:
+        argv.append("-0")
+    assert main(argv) == 0
+    out, _ = capsys.readouterr()
+    assert [json.loads(line)["file"] for line in out.splitlines()] == VALID
+
+
+def test_read_files_from_file(capsys, tmp_path):
+    listfile = tmp_path / "files.txt"
+    listfile.write_text(VALID[1] + "\n")
+    assert main(["--first", "-f", "json", "-T", str(listfile), VALID[0]]) == 0
+    out, _ = capsys.readouterr()
+    assert [json.loads(line)["file"] for line in out.splitlines()] == VALID[:2]
+
+
+def test_read_no_files():
+    with pytest.raises(SystemExit):
+        main(["read"])
+
+
+@pytest.mark.parametrize("command", ["read", "scan"])
+@pytest.mark.parametrize("jobs", ["0", "-1", "x"])
+def test_invalid_jobs(capsys, command, jobs):
+    with pytest.raises(SystemExit) as excinfo:
+        main([command, f"--jobs={jobs}", VALID[0]])
+    assert excinfo.value.code == 2
+    _, err = capsys.readouterr()
+    assert f"not a positive integer: '{jobs}'" in err
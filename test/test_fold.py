@@ -0,0 +1,215 @@
+import io
+import sys
+import pytest
+from read_version import (
+    aread_version,
+    cache_clear,
+    main,
+    read_variables,
+    read_version,
+    set_profile_hook,
+)
+from test_async import run
+
+SOURCE = '''\
+"""Docstring"""
+import os
+
+VERSION_INFO = (1, 2, 3)
+MAJOR, MINOR, *_ = VERSION_INFO
+PATCH = VERSION_INFO[-1]
+__version__ = ".".join(map(str, VERSION_INFO))
+short = "%d.%d" % (MAJOR, MINOR)
+fstring = f"{MAJOR}.{MINOR:02d}-{VERSION_INFO[1:]!r}"
+number = MAJOR * 100 + MINOR * 10 + PATCH
+method = "v{}.{minor}".format(MAJOR, minor=MINOR).upper()
+split = __version__.split(".")[::-1]
+first, *rest, last = VERSION_INFO
+'''
+
+
+def write(tmp_path, src):
+    path = tmp_path / "module.py"
+    path.write_text(src)
+    return str(path)
+
+
+def read_folded(src, variable="__version__", **kwargs):
+    return read_version(
+        io.BytesIO(src.encode("utf-8")),
+        variable=variable,
+        fold_constants=True,
+        **kwargs,
+    )
+
+
+def test_fold_constants(tmp_path):
+    path = write(tmp_path, SOURCE)
+    assert read_variables(
+        path,
+        variables=[
+            "__doc__",
+            "__version__",
+            "short",
+            "fstring",
+            "number",
+            "method",
+            "split",
+            "first",
+            "last",
+        ],
+        fold_constants=True,
+    ) == {
+        "__doc__": "Docstring",
+        "__version__": "1.2.3",
+        "short": "1.2",
+        "fstring": "1.02-(2, 3)",
+        "number": 123,
+        "method": "V1.2",
+        "split": ["3", "2", "1"],
+        "first": 1,
+        "last": 3,
+    }
+
+
+def test_fold_constants_off_by_default(tmp_path):
+    path = write(tmp_path, SOURCE)
+    with pytest.raises(ValueError, match="malformed node or string"):
+        read_version(path)
+    assert read_version(path, variable="VERSION_INFO") == (1, 2, 3)
+
+
+@pytest.mark.parametrize("occurrence", ["first", "last"])
+def test_fold_constants_occurrence(occurrence):
+    src = (
+        'V = (1, 2)\n__version__ = "%d.%d" % V\nV = (3, 4)\n__version__ = "%d.%d" % V\n'
+    )
+    expected = "1.2" if occurrence == "first" else "3.4"
+    assert read_folded(src, occurrence=occurrence) == expected
+
+
+@pytest.mark.parametrize(
+    "src,expected",
+    [
+        ('A = "1"\nA += ".2"\n__version__ = A\n', "1.2"),
+        ('A: str = "1"\n__version__ = A + ".0"\n', "1.0"),
+        ('A = B = "1"\n__version__ = A + B\n', "11"),
+        ("A = [1, 2]\n__version__ = tuple([*A, 3])\n", (1, 2, 3)),
+        ("A = {'x': 1}\n__version__ = {**A, 'y': 2}['y']\n", 2),
+        ("__version__ = -(2**10) // 3 % 7\n", (-(2**10) // 3) % 7),
+        ("A = '1.2.3'\n__version__ = tuple(map(int, A.split('.')))\n", (1, 2, 3)),
+        ("A = 1.5\n__version__ = f'{A:.3f}'\n", "1.500"),
+        ("__version__ = len('abc') * int('2')\n", 6),
+    ],
+)
+def test_fold_expressions(src, expected):
+    assert read_folded(src) == expected
+
+
+@pytest.mark.parametrize(
+    "src,match",
+    [
+        # Names bound by anything other than a foldable assignment
+        ("import VERSION\n__version__ = str(VERSION)\n", "not a known constant"),
+        (
+            'V = "1"\nif x:\n    V = "2"\n__version__ = V\n',
+            "not a known constant",
+        ),
+        ('V = "1"\nfor V in x:\n    pass\n__version__ = V\n', "not a known constant"),
+        ('V = x\n__version__ = V + "1"\n', "not a known constant"),
+        ("def str(x):\n    pass\n__version__ = str(1)\n", "cannot fold call"),
+        # Unsupported expressions
+        ('__version__ = os.environ["VERSION"]\n', "cannot fold"),
+        ('__version__ = "{0.real}".format(1)\n', "complex fields"),
+        ('__version__ = open("VERSION").read()\n', "cannot fold call"),
+        ('__version__ = "1" if x else "2"\n', "cannot fold IfExp"),
+        # Evaluation errors
+        ("__version__ = 1 / 0\n", "ZeroDivisionError"),
+        ("__version__ = (1, 2)[5]\n", "IndexError"),
+        ('__version__ = "1" + 2\n', "TypeError"),
+        ("__version__, x = (1, 2, 3)\n", "too many values to unpack"),
+        # Size limits
+        ('__version__ = "x" * 10**9\n', "too large"),
+        ("__version__ = 10**10**9\n", "too large"),
+        ("__version__ = 1 << 10**9\n", "too large"),
+        ('A = "x" * 50000\n__version__ = (A,) * 50000\n', "too large"),
+        ('A = "x" * 50000\n__version__ = A.join([A] * 10)\n', "too large"),
+        ('A = "x" * 50000\n__version__ = "%s%s%s" % (A, A, A)\n', "too large"),
+        ('A = "x" * 50000\n__version__ = "{0}{0}{0}".format(A)\n', "too large"),
+        ('A = "x" * 50000\n__version__ = f"{A}{A}{A}"\n', "too large"),
+        ('__version__ = f"{1:999999999}"\n', "too large"),
+        ('__version__ = "%*d" % (999999999, 1)\n', "too large"),
+    ],
+)
+def test_fold_errors(src, match):
+    with pytest.raises(ValueError, match=match):
+        read_folded(src)
+
+
+@pytest.mark.skipif(sys.version_info < (3, 8), reason="Requires walrus operator")
+@pytest.mark.parametrize(
+    "src",
+    [
+        "Y = 1\nX = (Y := 2)\n__version__ = str(Y)\n",
+        "Y = 1\nX: int = (Y := 2)\n__version__ = str(Y)\n",
+        "Y = 1\nX = 0\nX += (Y := 2)\n__version__ = str(Y)\n",
+        "Y = 1\nX, Z = [(Y := 2), 3]\n__version__ = str(Y)\n",
+    ],
+)
+def test_fold_walrus_in_assignment(src):
+    # Names bound by walrus expressions in an assigned value are not constants
+    # afterwards, even if the assignment itself cannot be folded.
+    with pytest.raises(ValueError, match="not a known constant"):
+        read_folded(src)
+
+
+def test_fold_constants_default():
+    # As without folding, defaults only apply to variables that are never
+    # assigned.
+    with pytest.raises(ValueError, match="not a known constant"):
+        read_folded("import x\n__version__ = x\n", default=None)
+    assert read_folded('__version__ = "1.2"\n', variable="other", default=42) == 42
+
+
+def test_fold_constants_memo(tmp_path):
+    cache_clear()
+    path = write(tmp_path, SOURCE)
+    summaries = []
+    set_profile_hook(summaries.append)
+    try:
+        assert read_version(path, fold_constants=True) == "1.2.3"
+        assert read_version(path, variable="short", fold_constants=True) == "1.2"
+        (tmp_path / "module.py").write_text(
+            SOURCE.replace("(1, 2, 3)", "(10, 2, 3)") + "\n"
+        )
+        assert read_version(path, fold_constants=True) == "10.2.3"
+    finally:
+        set_profile_hook(None)
+        cache_clear()
+    # Each read first tries to extract a literal, then folds if that fails.
+    assert [s["counters"]["parses"] for s in summaries] == [2, 1, 2]
+    assert "fold" in summaries[0]["phases"]
+    assert "fold" not in summaries[1]["phases"]
+
+
+@pytest.mark.parametrize("engine", ["scan", "mmap", "pyc"])
+def test_fold_constants_engines(tmp_path, engine):
+    path = write(tmp_path, SOURCE)
+    assert read_version(path, engine=engine, fold_constants=True) == "1.2.3"
+
+
+def test_fold_constants_max_bytes(tmp_path):
+    path = write(tmp_path, SOURCE)
+    with pytest.raises(ValueError, match="fold_constants cannot be combined"):
+        read_version(path, engine="mmap", fold_constants=True, max_bytes=1000)
+
+
+def test_fold_constants_async(tmp_path):
+    path = write(tmp_path, SOURCE)
+    assert run(aread_version(path, fold_constants=True)) == "1.2.3"
+
+
+def test_fold_constants_cli(tmp_path, capsys):
+    path = write(tmp_path, SOURCE)
+    assert main(["read", "-j1", "--fold-constants", "-v", "short", path]) == 0
+    assert capsys.readouterr().out == f"{path}\tshort\t1.2\n"
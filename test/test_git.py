@@ -0,0 +1,103 @@
+import shutil
+from subprocess import CalledProcessError, run
+import pytest
+from read_version import read_variables, read_version, read_version_revs
+
+pytestmark = pytest.mark.skipif(shutil.which("git") is None, reason="Requires git")
+
+
+def git(repo, *args):
+    run(
+        [
+            "git",
+            "-c",
+            "user.name=Test",
+            "-c",
+            "user.email=test@example.com",
+            *args,
+        ],
+        cwd=str(repo),
+        check=True,
+    )
+
+
+@pytest.fixture
+def repo(tmp_path):
+    git(tmp_path, "init", "-q")
+    pkg = tmp_path / "pkg"
+    pkg.mkdir()
+    init = pkg / "__init__.py"
+    for i, version in enumerate(["1.0.0", "1.1.0", "1.2.0"]):
+        init.write_text(
+            f'"""Release {i}"""\n__version__ = "{version}"\n__custom__ = {i}\n'
+        )
+        git(tmp_path, "add", "pkg/__init__.py")
+        git(tmp_path, "commit", "-q", "-m", f"Release {version}")
+        git(tmp_path, "tag", f"v{version}")
+    init.write_text('__version__ = "2.0.0.dev1"\n')
+    return tmp_path
+
+
+def test_read_version_rev(repo):
+    init = str(repo / "pkg" / "__init__.py")
+    assert read_version(init, rev="v1.1.0") == "1.1.0"
+    assert read_version(init, rev="HEAD~2") == "1.0.0"
+    assert read_version(init, rev="HEAD", variable="__custom__") == 2
+    assert read_version(init) == "2.0.0.dev1"
+
+
+def test_read_version_rev_base_dir(repo):
+    assert (
+        read_version("pkg", "__init__.py", base_dir=str(repo), rev="v1.2.0") == "1.2.0"
+    )
+
+
+def test_read_variables_rev(repo):
+    assert read_variables(
+        str(repo / "pkg" / "__init__.py"),
+        variables=["__version__", "__doc__"],
+        rev="v1.0.0",
+        occurrence="first",
+    ) == {"__version__": "1.0.0", "__doc__": "Release 0"}
+
+
+def test_read_version_revs(repo):
+    assert read_version_revs(
+        "pkg",
+        "__init__.py",
+        base_dir=str(repo),
+        revs=["v1.2.0", "v1.0.0", "HEAD~1", "v1.2.0"],
+        engine="scan",
+    ) == {"v1.2.0": "1.2.0", "v1.0.0": "1.0.0", "HEAD~1": "1.1.0"}
+
+
+def test_read_version_revs_default(repo):
+    assert read_version_revs(
+        str(repo / "pkg" / "__init__.py"),
+        revs=["v1.0.0"],
+        variable="__other__",
+        default=None,
+    ) == {"v1.0.0": None}
+    with pytest.raises(ValueError, match="No assignment to '__other__'"):
+        read_version_revs(
+            str(repo / "pkg" / "__init__.py"), revs=["v1.0.0"], variable="__other__"
+        )
+
+
+def test_read_version_rev_missing(repo):
+    (repo / "pkg" / "new.py").write_text('__version__ = "1.0"\n')
+    with pytest.raises(FileNotFoundError, match="No such file at revision 'HEAD'"):
+        read_version(str(repo / "pkg" / "new.py"), rev="HEAD")
+    with pytest.raises(FileNotFoundError):
+        read_version(str(repo / "pkg" / "__init__.py"), rev="nonexistent")
+
+
+def test_read_version_rev_directory(repo):
+    with pytest.raises(ValueError, match="not a file at revision"):
+        read_version(str(repo), "pkg", rev="HEAD")
+
+
+def test_read_version_rev_not_repo(tmp_path):
+    (tmp_path / "foo.py").write_text('__version__ = "1.0"\n')
+    with pytest.raises(CalledProcessError):
+        read_version(str(tmp_path / "foo.py"), rev="HEAD")
@@ -0,0 +1,43 @@
+import platform
+import re
+from subprocess import PIPE, run
+import sys
+import pytest
+
+#: Budget for the cumulative time to import `read_version` with no other
+#: modules loaded, in microseconds.  Before imports were deferred, importing
+#: setuptools alone took several times this long.
+IMPORT_BUDGET_US = 100_000
+
+#: Modules that a bare `import read_version` must not import
+DEFERRED_MODULES = [
+    "ast",
+    "distutils",
+    "inspect",
+    "setuptools",
+    "sqlite3",
+    "tokenize",
+]
+
+
+@pytest.mark.skipif(
+    platform.python_implementation() != "CPython" or sys.version_info < (3, 7),
+    reason="-X importtime requires CPython 3.7+",
+)
+def test_import_time():
+    r = run(
+        [sys.executable, "-X", "importtime", "-c", "import read_version"],
+        stdout=PIPE,
+        stderr=PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    cumulative = {}
+    for line in r.stderr.splitlines():
+        m = re.fullmatch(r"import time:\s*\d+\s*\|\s*(\d+)\s*\|\s*(\S+)", line)
+        if m:
+            cumulative[m.group(2)] = int(m.group(1))
+    assert "read_version" in cumulative
+    for modname in DEFERRED_MODULES:
+        assert modname not in cumulative
+    assert cumulative["read_version"] < IMPORT_BUDGET_US
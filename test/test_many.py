@@ -0,0 +1,191 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import os
+from os.path import dirname, join
+import threading
+import time
+import pytest
+import read_version
+from read_version import read_many, set_profile_hook
+
+DATA_DIR = join(dirname(__file__), "data")
+
+VALID = sorted(os.listdir(join(DATA_DIR, "valid")))
+
+
+@pytest.mark.parametrize(
+    "make_executor",
+    [lambda: None, lambda: ThreadPoolExecutor(max_workers=4), ProcessPoolExecutor],
+)
+def test_read_many(make_executor):
+    executor = make_executor()
+    try:
+        paths = [join(DATA_DIR, "valid", f) for f in VALID]
+        assert read_many(paths, executor=executor, engine="scan") == ["1.2.3"] * len(
+            VALID
+        )
+        assert read_many(paths, executor=executor, variable="__custom__") == [42] * len(
+            VALID
+        )
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+
+def test_read_many_base_dir():
+    assert read_many(["simple.py", "utf8.py"], base_dir=join(DATA_DIR, "valid")) == [
+        "1.2.3",
+        "1.2.3",
+    ]
+    assert read_many([join("data", "valid", "simple.py")]) == ["1.2.3"]
+
+
+def test_read_many_errors():
+    paths = [
+        join(DATA_DIR, "valid", "simple.py"),
+        join(DATA_DIR, "missing", os.listdir(join(DATA_DIR, "missing"))[0]),
+        join(DATA_DIR, "nonexistent.py"),
+    ]
+    with pytest.raises(ValueError, match="No assignment to '__version__'"):
+        read_many(paths)
+    values = read_many(paths, return_exceptions=True)
+    assert values[0] == "1.2.3"
+    assert isinstance(values[1], ValueError)
+    assert isinstance(values[2], FileNotFoundError)
+    assert read_many(paths[:2], default=None) == ["1.2.3", None]
+    with pytest.raises(ValueError, match="Invalid engine"):
+        read_many(paths, engine="nonexistent")
+    assert not read_version._inflight
+
+
+def test_read_many_bytes():
+    with open(join(DATA_DIR, "valid", "simple.py"), "rb") as fp:
+        src = fp.read()
+    assert read_many([src, src]) == ["1.2.3", "1.2.3"]
+
+
+class GatedReads:
+    """
+    A stand-in for `_read_variables()` that counts calls and blocks until
+    `release()` is called
+    """
+
+    def __init__(self, real, error=None):
+        self.real = real
+        self.error = error
+        self.calls = 0
+        self.event = threading.Event()
+
+    def __call__(self, *args, **kwargs):
+        self.calls += 1
+        assert self.event.wait(10)
+        if self.error is not None:
+            raise self.error
+        return self.real(*args, **kwargs)
+
+    def release(self):
+        self.event.set()
+
+
+@pytest.fixture
+def gated(monkeypatch):
+    reads = GatedReads(read_version._read_variables)
+    monkeypatch.setattr(read_version, "_read_variables", reads)
+    hits = []
+    real_count = read_version._count
+
+    def counting(counter, n=1):
+        if counter == "inflight_hits":
+            hits.append(n)
+        real_count(counter, n)
+
+    monkeypatch.setattr(read_version, "_count", counting)
+    reads.hits = hits
+    return reads
+
+
+def wait_for(predicate):
+    deadline = time.monotonic() + 10
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def run_threads(n, func):
+    results = [None] * n
+
+    def target(i):
+        try:
+            results[i] = func()
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=target, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    return threads, results
+
+
+@pytest.mark.parametrize("use_executor", [False, True])
+def test_read_many_single_flight(gated, use_executor):
+    path = join(DATA_DIR, "valid", "simple.py")
+    executor = ThreadPoolExecutor(max_workers=2) if use_executor else None
+    try:
+        threads, results = run_threads(
+            8, lambda: read_many([path, path], executor=executor)
+        )
+        # Wait until every other request has joined the first read.  Without
+        # an executor, the thread doing the read only gets to its second path
+        # once the read is done.
+        wait_for(lambda: len(gated.hits) == (15 if use_executor else 14))
+        gated.release()
+        for t in threads:
+            t.join()
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    assert results == [["1.2.3", "1.2.3"]] * 8
+    assert gated.calls == 1
+    assert not read_version._inflight
+
+
+def test_read_many_single_flight_error(gated):
+    gated.error = ValueError("Simulated failure")
+    path = join(DATA_DIR, "valid", "simple.py")
+    threads, results = run_threads(4, lambda: read_many([path]))
+    wait_for(lambda: len(gated.hits) == 3)
+    gated.release()
+    for t in threads:
+        t.join()
+    assert all(isinstance(r, ValueError) for r in results)
+    assert gated.calls == 1
+    assert not read_version._inflight
+
+
+def test_read_many_modified_in_flight(gated, tmp_path):
+    path = tmp_path / "module.py"
+    path.write_text('__version__ = "1.2.3"\n')
+    threads, results = run_threads(1, lambda: read_many([str(path)]))
+    wait_for(lambda: gated.calls == 1)
+    path.write_text('__version__ = "1.2.30"\n')
+    # A request for the modified file does not join the read of the old one.
+    threads2, results2 = run_threads(1, lambda: read_many([str(path)]))
+    wait_for(lambda: gated.calls == 2)
+    gated.release()
+    for t in threads + threads2:
+        t.join()
+    assert gated.hits == []
+    assert results2 == [["1.2.30"]]
+
+
+def test_read_many_profile():
+    summaries = []
+    set_profile_hook(summaries.append)
+    try:
+        path = join(DATA_DIR, "valid", "simple.py")
+        assert read_many([path, path, path]) == ["1.2.3"] * 3
+    finally:
+        set_profile_hook(None)
+    (summary,) = summaries
+    assert summary["operation"] == "read_many"
+    assert summary["counters"]["inflight_hits"] == 2
+    assert summary["counters"]["parses"] == 1
@@ -0,0 +1,149 @@
+import io
+from os.path import dirname, join
+import tracemalloc
+import pytest
+import read_version as read_version_module
+from read_version import read_variables, read_version
+
+DATA_DIR = join(dirname(__file__), "data")
+
+FILLER = """
+def function_{i}(x, y={i}):
+    \"\"\"Docstring for function {i}.\"\"\"
+    return {{"key_{i}": [x * n for n in range(y)]}}
+"""
+
+
+@pytest.fixture(scope="module")
+def big_module(tmp_path_factory):
+    path = tmp_path_factory.mktemp("mmap") / "big.py"
+    with path.open("w") as fp:
+        fp.write('"""Big module"""\n__version__ = "0.1.0"\n')
+        for i in range(20000):
+            fp.write(FILLER.format(i=i))
+        fp.write('__version__ = "1.2.3"\n__custom__ = 42\n')
+    return str(path)
+
+
+def test_mmap_big(big_module):
+    assert read_version(big_module, engine="mmap") == "1.2.3"
+    assert read_version(big_module, engine="mmap", occurrence="first") == "0.1.0"
+    assert read_variables(
+        big_module,
+        variables=["__version__", "__custom__", "__doc__"],
+        engine="mmap",
+        max_bytes=100,
+        max_nodes=10,
+    ) == {"__version__": "1.2.3", "__custom__": 42, "__doc__": "Big module"}
+
+
+def test_mmap_bounded_memory(big_module):
+    tracemalloc.start()
+    try:
+        assert read_version(big_module, engine="mmap") == "1.2.3"
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert peak < 100_000
+
+
+def test_mmap_max_bytes(big_module):
+    with pytest.raises(ValueError, match=r"more than max_bytes \(10\) bytes"):
+        read_version(big_module, engine="mmap", max_bytes=10)
+
+
+def test_mmap_max_nodes(big_module):
+    with pytest.raises(ValueError, match=r"more than max_nodes \(2\) AST nodes"):
+        read_version(big_module, engine="mmap", max_nodes=2)
+
+
+@pytest.mark.parametrize("engine", ["ast", "scan"])
+def test_limits_require_mmap(engine):
+    with pytest.raises(ValueError, match="max_bytes and max_nodes require"):
+        read_version("data", "valid", "simple.py", engine=engine, max_bytes=1000)
+
+
+def test_mmap_stops_when_settled(tmp_path):
+    src = tmp_path / "foo.py"
+    src.write_text('__version__ = 1 +* 2\n__version__ = "1.2.3"\n')
+    assert read_version(str(src), engine="mmap") == "1.2.3"
+    with pytest.raises(SyntaxError):
+        read_version(str(src), engine="ast")
+    src.write_text('__version__ = "1.2.3"\n__version__ = (\n')
+    assert read_version(str(src), engine="mmap", occurrence="first") == "1.2.3"
+
+
+def test_mmap_fallback(monkeypatch, tmp_path):
+    def unlexable(_buf, _variables):
+        raise read_version_module._LexError()
+
+    monkeypatch.setattr(read_version_module, "_mention_spans", unlexable)
+    src = tmp_path / "foo.py"
+    src.write_text('x = 1\n__version__ = "1.2.3"\n')
+    assert read_version(str(src), engine="mmap") == "1.2.3"
+    assert read_version(str(src), engine="mmap", max_bytes=100) == "1.2.3"
+    with pytest.raises(ValueError, match="cannot be scanned"):
+        read_version(str(src), engine="mmap", max_bytes=20)
+    with pytest.raises(ValueError, match="parse tree has more than max_nodes"):
+        read_version(str(src), engine="mmap", max_bytes=100, max_nodes=3)
+    assert (
+        read_version(str(src), engine="mmap", max_bytes=100, max_nodes=100)
+        == "1.2.3"
+    )
+    # The nodes can only be counted after the whole file has been parsed.
+    with pytest.raises(ValueError, match="unless max_bytes is also set"):
+        read_version(str(src), engine="mmap", max_nodes=100)
+
+
+def test_mmap_unlexable(tmp_path):
+    src = tmp_path / "foo.py"
+    src.write_text('__version__ = "1.2.3"\nx = "unterminated\n')
+    with pytest.raises(SyntaxError):
+        read_version(str(src), engine="mmap")
+    with pytest.raises(ValueError, match="cannot be scanned"):
+        read_version(str(src), engine="mmap", max_bytes=20)
+
+
+def test_mmap_empty(tmp_path):
+    src = tmp_path / "foo.py"
+    src.touch()
+    assert read_version(str(src), engine="mmap", default=None) is None
+
+
+def test_mmap_fileobj():
+    with open(join(DATA_DIR, "valid", "latin1.py"), "rb") as fp:
+        assert read_version(fp, engine="mmap") == "1.2.3"
+    assert read_version(io.BytesIO(b'__version__ = "1.2.3"\n'), engine="mmap") == (
+        "1.2.3"
+    )
+
+
+@pytest.mark.parametrize("occurrence", ["first", "last"])
+@pytest.mark.parametrize(
+    "src",
+    [
+        b'# Comment\nr"""Doc"""\n',
+        b'\nu"Doc"\n__version__ = "1.2.3"\n',
+        b'\xef\xbb\xbf# Comment\n\nb"Doc"\nx = "Not the docstring"\n',
+        b'# Comment\nfoo()\nr"Not the docstring"\n',
+    ],
+)
+def test_mmap_prefixed_docstring(src, occurrence):
+    assert read_version(
+        io.BytesIO(src),
+        variable="__doc__",
+        default=None,
+        engine="mmap",
+        occurrence=occurrence,
+    ) == read_version(io.BytesIO(src), variable="__doc__", default=None)
+
+
+@pytest.mark.parametrize("engine", ["ast", "mmap"])
+def test_mmap_fileobj_position(engine):
+    # Reading starts from the current position, as with the other engines.
+    with open(join(DATA_DIR, "valid", "simple.py"), "rb") as fp:
+        fp.readline()
+        with pytest.raises(ValueError, match="No assignment to '__version__'"):
+            read_version(fp, engine=engine)
+        fp.seek(6)
+        assert read_version(fp, variable="ion__", engine=engine) == "1.2.3"
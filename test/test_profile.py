@@ -0,0 +1,166 @@
+import json
+import os
+from os.path import dirname, getsize, join
+from types import SimpleNamespace
+import pytest
+import read_version
+from read_version import (
+    PROFILE_COUNTERS,
+    disable_cache,
+    enable_cache,
+    read_variables,
+    read_version as read_version_func,
+    set_profile_hook,
+    setuptools_finalizer,
+)
+
+DATA_DIR = join(dirname(__file__), "data")
+
+
+@pytest.fixture
+def summaries(monkeypatch):
+    monkeypatch.delenv("READ_VERSION_PROFILE", raising=False)
+    monkeypatch.delenv("READ_VERSION_PROFILE_FILE", raising=False)
+    monkeypatch.delenv("READ_VERSION_CACHE_DIR", raising=False)
+    collected = []
+    set_profile_hook(collected.append)
+    try:
+        yield collected
+    finally:
+        set_profile_hook(None)
+
+
+@pytest.mark.parametrize("engine", ["ast", "scan"])
+def test_profile_read_version(summaries, engine):
+    assert read_version_func("data", "valid", "simple.py", engine=engine) == "1.2.3"
+    (summary,) = summaries
+    assert summary["operation"] == "read_version"
+    assert summary["total_seconds"] > 0
+    assert set(summary["phases"]) == {"resolve_path", "read_source", "parse", "extract"}
+    assert summary["counters"] == {
+        **dict.fromkeys(PROFILE_COUNTERS, 0),
+        "bytes_read": getsize(join(DATA_DIR, "valid", "simple.py")),
+        "parses": 1,
+    }
+    assert "error" not in summary
+
+
+def test_profile_first(summaries):
+    read_version_func(join(DATA_DIR, "valid", "simple.py"), occurrence="first")
+    (summary,) = summaries
+    assert set(summary["phases"]) == {"incremental_parse"}
+    assert summary["counters"]["parses"] == 1
+    assert summary["counters"]["bytes_read"] > 0
+
+
+def test_profile_memory_cache(summaries):
+    enable_cache()
+    try:
+        for _ in range(2):
+            read_variables(
+                "data", "valid", "simple.py", variables=["__version__", "__custom__"]
+            )
+    finally:
+        disable_cache()
+    assert [s["operation"] for s in summaries] == ["read_variables"] * 2
+    assert summaries[0]["counters"]["memory_cache_misses"] == 1
+    assert summaries[0]["counters"]["parses"] == 1
+    assert summaries[1]["counters"]["memory_cache_hits"] == 1
+    assert summaries[1]["counters"]["parses"] == 0
+
+
+def test_profile_disk_cache(summaries, tmp_path):
+    for _ in range(2):
+        read_version_func("data", "valid", "simple.py", cache_dir=str(tmp_path))
+    assert summaries[0]["counters"]["disk_cache_misses"] == 1
+    assert summaries[0]["counters"]["parses"] == 1
+    assert summaries[1]["counters"]["disk_cache_hits"] == 1
+    assert summaries[1]["counters"]["parses"] == 0
+    assert "disk_cache" in summaries[1]["phases"]
+
+
+def test_profile_error(summaries):
+    with pytest.raises(ValueError):
+        read_version_func("data", "missing", os.listdir(join(DATA_DIR, "missing"))[0])
+    (summary,) = summaries
+    assert summary["error"] == (
+        "ValueError: No assignment to '__version__' found in file"
+    )
+
+
+def test_profile_disabled(monkeypatch, capsys):
+    monkeypatch.delenv("READ_VERSION_PROFILE", raising=False)
+    monkeypatch.delenv("READ_VERSION_PROFILE_FILE", raising=False)
+    assert read_version_func("data", "valid", "simple.py") == "1.2.3"
+    assert capsys.readouterr() == ("", "")
+    assert getattr(read_version._profiling, "profile", None) is None
+
+
+def test_profile_env_stderr(monkeypatch, capsys):
+    monkeypatch.setenv("READ_VERSION_PROFILE", "1")
+    monkeypatch.delenv("READ_VERSION_PROFILE_FILE", raising=False)
+    assert read_version_func("data", "valid", "simple.py") == "1.2.3"
+    out, err = capsys.readouterr()
+    assert out == ""
+    assert json.loads(err)["operation"] == "read_version"
+
+
+def test_profile_env_file(monkeypatch, capsys, tmp_path):
+    monkeypatch.delenv("READ_VERSION_PROFILE", raising=False)
+    profile_file = tmp_path / "profile.jsonl"
+    monkeypatch.setenv("READ_VERSION_PROFILE_FILE", str(profile_file))
+    read_version_func("data", "valid", "simple.py")
+    read_variables("data", "valid", "simple.py", variables=["__custom__"])
+    assert capsys.readouterr() == ("", "")
+    with profile_file.open() as fp:
+        operations = [json.loads(line)["operation"] for line in fp]
+    assert operations == ["read_version", "read_variables"]
+
+
+@pytest.mark.parametrize("missing", [False, True])
+def test_profile_env_file_error(monkeypatch, capsys, tmp_path, missing):
+    monkeypatch.delenv("READ_VERSION_PROFILE", raising=False)
+    profile_file = tmp_path / "nonexistent" / "profile.jsonl"
+    monkeypatch.setenv("READ_VERSION_PROFILE_FILE", str(profile_file))
+    if missing:
+        with pytest.raises(ValueError, match="No assignment to '__version__'"):
+            read_version_func(
+                "data", "missing", os.listdir(join(DATA_DIR, "missing"))[0]
+            )
+    else:
+        assert read_version_func("data", "valid", "simple.py") == "1.2.3"
+    assert "read_version: could not write profile" in capsys.readouterr().err
+
+
+def test_profile_hook_error_does_not_mask(capsys):
+    def hook(_summary):
+        raise RuntimeError("Hook failed")
+
+    set_profile_hook(hook)
+    try:
+        with pytest.raises(RuntimeError, match="Hook failed"):
+            read_version_func("data", "valid", "simple.py")
+        with pytest.raises(ValueError, match="No assignment to '__version__'"):
+            read_version_func(
+                "data", "missing", os.listdir(join(DATA_DIR, "missing"))[0]
+            )
+    finally:
+        set_profile_hook(None)
+    assert "could not report profile: Hook failed" in capsys.readouterr().err
+
+
+@pytest.mark.requires_toml
+def test_profile_finalizer(summaries, monkeypatch):
+    monkeypatch.chdir(join(DATA_DIR, "projects", "all-attribs"))
+    read_version._finalizer_memo.clear()
+    for _ in range(2):
+        setuptools_finalizer(SimpleNamespace(metadata=SimpleNamespace()))
+    assert [s["operation"] for s in summaries] == ["setuptools_finalizer"] * 2
+    first, second = summaries
+    assert {"read_config", "parse_config", "read_source", "parse"} <= set(
+        first["phases"]
+    )
+    assert first["counters"]["parses"] == 1
+    assert first["counters"]["bytes_read"] > 0
+    assert second["counters"]["memo_hits"] == 1
+    assert second["counters"]["parses"] == 0
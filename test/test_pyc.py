@@ -0,0 +1,141 @@
+import os
+from os.path import dirname, join
+import py_compile
+import shutil
+import sys
+import pytest
+from read_version import read_variables, read_version, set_profile_hook
+
+DATA_DIR = join(dirname(__file__), "data")
+
+needs_positions = pytest.mark.skipif(
+    sys.version_info < (3, 11), reason="Requires instruction column offsets"
+)
+
+MODES = [
+    py_compile.PycInvalidationMode.TIMESTAMP,
+    py_compile.PycInvalidationMode.CHECKED_HASH,
+]
+
+DEFAULTS = {"__version__": None, "__custom__": None, "__doc__": None}
+
+
+def compiled(tmp_path, src, mode=MODES[0]):
+    path = tmp_path / "module.py"
+    path.write_text(src)
+    py_compile.compile(str(path), doraise=True, invalidation_mode=mode)
+    return str(path)
+
+
+def read_counting(*args, **kwargs):
+    summaries = []
+    set_profile_hook(summaries.append)
+    try:
+        value = read_version(*args, **kwargs)
+    except Exception as e:
+        value = type(e)
+    finally:
+        set_profile_hook(None)
+    return value, summaries[0]["counters"]
+
+
+def read_all(path, engine, occurrence):
+    try:
+        return read_variables(
+            path,
+            variables=DEFAULTS,
+            defaults=DEFAULTS,
+            engine=engine,
+            occurrence=occurrence,
+        )
+    except Exception as e:
+        return type(e)
+
+
+@pytest.mark.parametrize("mode", MODES)
+@pytest.mark.parametrize("occurrence", ["first", "last"])
+@pytest.mark.parametrize(
+    "subdir", ["valid", "invalid", "missing", "missing_custom", "docstrings"]
+)
+def test_pyc_matches_ast(tmp_path, subdir, occurrence, mode):
+    shutil.copytree(join(DATA_DIR, subdir), str(tmp_path / subdir))
+    for fname in os.listdir(str(tmp_path / subdir)):
+        path = str(tmp_path / subdir / fname)
+        py_compile.compile(path, doraise=True, invalidation_mode=mode)
+        assert read_all(path, "pyc", occurrence) == read_all(path, "ast", occurrence)
+
+
+@needs_positions
+@pytest.mark.parametrize("mode", MODES)
+def test_pyc_no_parse(tmp_path, mode):
+    path = compiled(
+        tmp_path,
+        '"""Docstring"""\n'
+        "import os\n"
+        '__version__ = "0.1.0"\n'
+        "def f():\n"
+        "    return 42\n"
+        '__version__ = (\n    "1.2"\n    ".3"\n)\n',
+        mode,
+    )
+    value, counters = read_counting(path, engine="pyc")
+    assert value == "1.2.3"
+    assert counters["bytecode_hits"] == 1
+    assert counters["parses"] == 0
+    assert read_version(path, engine="pyc", occurrence="first") == "0.1.0"
+    assert read_version(path, variable="__doc__", engine="pyc") == "Docstring"
+
+
+@pytest.mark.parametrize(
+    "src",
+    [
+        'if True:\n    __version__ = "1.2.3"\n',
+        '__version__: str = "1.2.3"\n',
+        'x = 1; __version__ = "1.2.3"\n',
+        '__version__ = "1.2.3"\nif x:\n    __version__ = "3.2.1"\n',
+        '__version__ = "1.2.3" if x else "3.2.1"\n',
+        '__version__ = x and "1.2.3"\n',
+        '__version__ = "1.2.3"\nraise SystemExit\n__version__ = "3.2.1"\n',
+        '__version__ = "1.2.3"\nfrom os import sep as __version__\n',
+        'try:\n    __version__ = "1.2.3"\nexcept ImportError:\n    pass\n',
+    ],
+)
+def test_pyc_fallback(tmp_path, src):
+    path = compiled(tmp_path, src)
+    value, counters = read_counting(path, engine="pyc", default=None)
+    assert value == read_counting(path, default=None)[0]
+    assert counters["bytecode_hits"] == 0
+
+
+@needs_positions
+def test_pyc_many_names(tmp_path):
+    # Name indices above 255 are encoded with EXTENDED_ARG instructions.
+    names = "".join(f"name{i} = {i}\n" for i in range(300))
+    path = compiled(tmp_path, f'{names}__version__ = "1.2.3"\n')
+    value, counters = read_counting(path, engine="pyc")
+    assert value == "1.2.3"
+    assert counters["bytecode_hits"] == 1
+    assert read_version(path, variable="name299", engine="pyc") == 299
+
+
+@needs_positions
+def test_pyc_folded_constant(tmp_path):
+    path = compiled(tmp_path, '__version__ = "1.2" + ".3"\n')
+    with pytest.raises(ValueError, match="malformed node or string"):
+        read_version(path, engine="pyc")
+
+
+def test_pyc_stale(tmp_path):
+    path = compiled(tmp_path, '__version__ = "1.2.3"\n')
+    with open(path, "w") as fp:
+        fp.write('__version__ = "1.2.30"\n')
+    value, counters = read_counting(path, engine="pyc")
+    assert value == "1.2.30"
+    assert counters["bytecode_hits"] == 0
+    assert counters["parses"] == 1
+
+
+def test_pyc_missing(tmp_path):
+    path = tmp_path / "module.py"
+    path.write_text('__version__ = "1.2.3"\n')
+    assert read_version(str(path), engine="pyc") == "1.2.3"
@@ -1,7 +1,9 @@
+import io
 import os
+import re
 from os.path import dirname, join
 import pytest
-from read_version import read_version
+from read_version import ENGINES, read_variables, read_version
 
 DATA_DIR = join(dirname(__file__), "data")
 
@@ -11,9 +13,10 @@ def test_no_args():
         read_version()
 
 
+@pytest.mark.parametrize("engine", ENGINES)
 @pytest.mark.parametrize("fname", os.listdir(join(DATA_DIR, "valid")))
-def test_read_version(fname):
-    assert read_version("data", "valid", fname) == "1.2.3"
+def test_read_version(fname, engine):
+    assert read_version("data", "valid", fname, engine=engine) == "1.2.3"
 
 
 def test_read_version_absolute():
@@ -23,27 +26,34 @@ def test_read_version_absolute():
     )
 
 
+@pytest.mark.parametrize("engine", ENGINES)
 @pytest.mark.parametrize("fname", os.listdir(join(DATA_DIR, "valid")))
-def test_read_version_custom(fname):
-    assert read_version("data", "valid", fname, variable="__custom__") == 42
+def test_read_version_custom(fname, engine):
+    assert (
+        read_version("data", "valid", fname, variable="__custom__", engine=engine) == 42
+    )
 
 
+@pytest.mark.parametrize("engine", ENGINES)
 @pytest.mark.parametrize("fname", os.listdir(join(DATA_DIR, "missing")))
-def test_missing(fname):
+def test_missing(fname, engine):
     with pytest.raises(
         ValueError,
         match="No assignment to '__version__' found in file",
     ):
-        read_version("data", "missing", fname)
+        read_version("data", "missing", fname, engine=engine)
 
 
+@pytest.mark.parametrize("engine", ENGINES)
 @pytest.mark.parametrize("fname", os.listdir(join(DATA_DIR, "missing_custom")))
-def test_missing_custom(fname):
+def test_missing_custom(fname, engine):
     with pytest.raises(
         ValueError,
         match="No assignment to '__custom__' found in file",
     ):
-        read_version("data", "missing_custom", fname, variable="__custom__")
+        read_version(
+            "data", "missing_custom", fname, variable="__custom__", engine=engine
+        )
 
 
 def test_default_missing():
@@ -70,10 +80,27 @@ def test_default_not_missing():
     )
 
 
+@pytest.mark.parametrize("engine", ENGINES)
 @pytest.mark.parametrize("fname", os.listdir(join(DATA_DIR, "invalid")))
-def test_invalid(fname):
+def test_invalid(fname, engine):
     with pytest.raises((ValueError, TypeError)):
-        read_version("data", "invalid", fname)
+        read_version("data", "invalid", fname, engine=engine)
+
+
+@pytest.mark.parametrize("occurrence", ["first", "last"])
+@pytest.mark.parametrize("engine", ENGINES)
+def test_invalid_line_number(tmp_path, engine, occurrence):
+    # Errors from engines that parse statements separately report the same
+    # line numbers as parsing the whole file.
+    path = tmp_path / "foo.py"
+    path.write_bytes(b'"""Doc"""\r\n\r\nx = 1\r__version__ = [\n    "1", f()\n]\n')
+    with pytest.raises(ValueError) as expected:
+        read_version(str(path))
+    with pytest.raises(ValueError) as excinfo:
+        read_version(str(path), engine=engine, occurrence=occurrence)
+    assert re.sub(r" at 0x\w+", "", str(excinfo.value)) == re.sub(
+        r" at 0x\w+", "", str(expected.value)
+    )
 
 
 @pytest.mark.parametrize(
@@ -83,19 +110,25 @@ def test_invalid(fname):
         ("adjstrings.py", " This is a  docstring. "),
         ("twostrings.py", " This is a docstring. "),
         ("overridden.py", "This overrides the module docstring."),
+        ("prefixed.py", "This is a \\raw docstring."),
+        ("banner.py", "This docstring follows a license banner."),
     ],
 )
-def test_docstring(filename, expected):
-    s = read_version("data", "docstrings", filename, variable="__doc__")
+@pytest.mark.parametrize("engine", ENGINES)
+def test_docstring(filename, expected, engine):
+    s = read_version("data", "docstrings", filename, variable="__doc__", engine=engine)
     assert s == expected
 
 
-def test_no_docstring():
+@pytest.mark.parametrize("engine", ENGINES)
+def test_no_docstring(engine):
     with pytest.raises(
         ValueError,
         match="No assignment to '__doc__' found in file",
     ):
-        read_version("data", "docstrings", "nodoc.py", variable="__doc__")
+        read_version(
+            "data", "docstrings", "nodoc.py", variable="__doc__", engine=engine
+        )
 
 
 def test_no_docstring_default():
@@ -110,3 +143,160 @@ def test_docstring_default():
         "data", "docstrings", "onestring.py", variable="__doc__", default="default"
     )
     assert s == "\nThis is a docstring.\n"
+
+
+@pytest.mark.parametrize("fname", os.listdir(join(DATA_DIR, "valid")))
+def test_read_variables(fname):
+    assert read_variables(
+        "data", "valid", fname, variables=["__version__", "__custom__"]
+    ) == {"__version__": "1.2.3", "__custom__": 42}
+
+
+def test_read_variables_docstring():
+    assert read_variables(
+        "data",
+        "docstrings",
+        "overridden.py",
+        variables=["__doc__", "__version__"],
+        defaults={"__version__": "0.0.0"},
+    ) == {"__doc__": "This overrides the module docstring.", "__version__": "0.0.0"}
+
+
+def test_read_variables_missing():
+    with pytest.raises(
+        ValueError,
+        match="No assignment to '__custom__' found in file",
+    ):
+        read_variables(
+            "data",
+            "missing_custom",
+            "defaultvar.py",
+            variables=["__version__", "__custom__"],
+        )
+
+
+def test_read_variables_no_args():
+    with pytest.raises(ValueError, match="No filepath passed to read_variables()"):
+        read_variables(variables=["__version__"])
+
+
+def test_invalid_engine():
+    with pytest.raises(ValueError, match="Invalid engine: 'regex'"):
+        read_version("data", "valid", "simple.py", engine="regex")
+
+
+def test_read_version_base_dir():
+    assert read_version("valid", "simple.py", base_dir=DATA_DIR) == "1.2.3"
+
+
+def test_read_variables_base_dir():
+    assert read_variables(
+        "simple.py",
+        variables=["__version__", "__custom__"],
+        base_dir=join(DATA_DIR, "valid"),
+    ) == {"__version__": "1.2.3", "__custom__": 42}
+
+
+@pytest.mark.parametrize(
+    "fname",
+    sorted(
+        set(os.listdir(join(DATA_DIR, "valid")))
+        - {"overwrite.py", "overwrite_invalid.py"}
+    ),
+)
+def test_read_version_first(fname):
+    assert read_version("data", "valid", fname, occurrence="first") == "1.2.3"
+    assert (
+        read_version("data", "valid", fname, variable="__custom__", occurrence="first")
+        == 42
+    )
+
+
+def test_read_version_first_overwrite():
+    assert read_version("data", "valid", "overwrite.py", occurrence="first") == "42"
+    assert (
+        read_version("data", "invalid", "overwrite1.py", occurrence="first") == "1.2.3"
+    )
+    with pytest.raises(ValueError):
+        read_version("data", "valid", "overwrite_invalid.py", occurrence="first")
+
+
+def test_read_version_first_stops_early(tmp_path):
+    src = tmp_path / "foo.py"
+    src.write_text('__version__ = "1.2.3"\nThis is not Python.\n__version__ = (\n')
+    assert read_version(str(src), occurrence="first") == "1.2.3"
+    with pytest.raises(SyntaxError):
+        read_version(str(src))
+    with pytest.raises(SyntaxError):
+        read_version(str(src), variable="__custom__", occurrence="first")
+
+
+def test_read_version_first_bom():
+    src = b'\xef\xbb\xbf__version__ = "1.0"\n'
+    assert read_version(io.BytesIO(src), occurrence="first") == "1.0"
+    assert read_version(io.BytesIO(src)) == "1.0"
+
+
+def test_read_version_first_invalid_assignment():
+    src = b'x = 1\n__version__ = 1 +\n__version__ = "2"\n'
+    with pytest.raises(SyntaxError) as excinfo:
+        read_version(io.BytesIO(src), occurrence="first")
+    assert excinfo.value.lineno == 2
+    with pytest.raises(SyntaxError):
+        read_version(io.BytesIO(src))
+
+
+@pytest.mark.parametrize(
+    "src",
+    [
+        b'@__version__\ndef f():\n    pass\n__version__ = "1.0"\n',
+        b'if __version__:\n    pass\nelif x:\n    pass\n__version__ = "1.0"\n',
+        b'try:\n    pass\nexcept __version__:\n    pass\n__version__ = "1.0"\n',
+        b'match __version__:\n    case 1:\n        pass\n__version__ = "1.0"\n',
+    ],
+)
+def test_read_version_first_headers(src):
+    assert read_version(io.BytesIO(src), occurrence="first") == "1.0"
+
+
+@pytest.mark.parametrize("fname", os.listdir(join(DATA_DIR, "missing")))
+def test_missing_first(fname):
+    with pytest.raises(
+        ValueError,
+        match="No assignment to '__version__' found in file",
+    ):
+        read_version("data", "missing", fname, occurrence="first")
+
+
+@pytest.mark.parametrize(
+    "filename,expected",
+    [
+        ("onestring.py", "\nThis is a docstring.\n"),
+        ("adjstrings.py", " This is a  docstring. "),
+        ("twostrings.py", " This is a docstring. "),
+        ("overridden.py", " This is a module docstring. "),
+        ("prefixed.py", "This is a \\raw docstring."),
+        ("banner.py", "This docstring follows a license banner."),
+    ],
+)
+def test_docstring_first(filename, expected):
+    s = read_version(
+        "data", "docstrings", filename, variable="__doc__", occurrence="first"
+    )
+    assert s == expected
+
+
+def test_read_variables_first():
+    assert read_variables(
+        "data",
+        "valid",
+        "overwrite.py",
+        variables=["__version__", "__custom__", "__doc__"],
+        defaults={"__doc__": None},
+        occurrence="first",
+    ) == {"__version__": "42", "__custom__": 42, "__doc__": None}
+
+
+def test_invalid_occurrence():
+    with pytest.raises(ValueError, match="Invalid occurrence: 'middle'"):
+        read_version("data", "valid", "simple.py", occurrence="middle")
@@ -0,0 +1,60 @@
+import json
+from os.path import dirname, join
+import pytest
+from read_version import main
+
+PROJECT_DIR = join(dirname(__file__), "data", "projects")
+
+
+@pytest.mark.requires_toml
+@pytest.mark.parametrize("jobs", ["1", "2"])
+def test_scan(capsys, jobs):
+    assert main(["scan", "--jobs", jobs, PROJECT_DIR]) == 1
+    out, _ = capsys.readouterr()
+    records = {}
+    for line in out.splitlines():
+        rec = json.loads(line)
+        records[rec.pop("project")] = rec
+    assert "no-pyproject" not in records
+    assert records[join(PROJECT_DIR, "all-attribs")] == {
+        "fields": {
+            "version": "9001",
+            "author": "Joe Q. Author",
+            "author_email": "me@example.com",
+            "description": "Not a real package",
+            "keywords": ["test", "metadata", "setuptools"],
+            "license": "WTFPL",
+            "maintainer": "Manny Tainer",
+            "maintainer_email": "you@example.org",
+            "url": "https://example.net",
+        }
+    }
+    assert records[join(PROJECT_DIR, "epstring-dotted")] == {
+        "fields": {"version": "5.6.2.50"}
+    }
+    assert records[join(PROJECT_DIR, "unkfield")] == {
+        "fields": {"version": "1.0.8"},
+        "warnings": ["read_version: ignoring unknown field 'foobar'"],
+    }
+    assert records[join(PROJECT_DIR, "nottable")] == {
+        "warnings": ['read_version: "tool.read_version" is not a table; ignoring']
+    }
+    assert records[join(PROJECT_DIR, "missing")] == {
+        "error": "ValueError: No assignment to '__version__' found in file"
+    }
+    assert records[join(PROJECT_DIR, "setup-cfg-layout")] == {
+        "fields": {"version": "1.2.3"}
+    }
+    assert records[join(PROJECT_DIR, "badspec01")] == {
+        "error": "tool.read_version.version: Invalid specifier 'foobar:'"
+    }
+
+
+@pytest.mark.requires_toml
+def test_scan_ok(capsys):
+    assert main(["scan", join(PROJECT_DIR, "list-path")]) == 0
+    out, _ = capsys.readouterr()
+    assert json.loads(out) == {
+        "project": join(PROJECT_DIR, "list-path"),
+        "fields": {"version": "1.3.2.4"},
+    }
@@ -1,18 +1,16 @@
-from os.path import dirname, join
+import os
+from os.path import dirname, exists, join
+import shutil
 from subprocess import PIPE, Popen, check_output
+from types import SimpleNamespace
 import pytest
-
-try:
-    import toml  # noqa
-except ImportError:
-    has_toml = False
-else:
-    has_toml = True
+import read_version
+from read_version import _mentions_config, setuptools_finalizer
 
 PROJECT_DIR = join(dirname(__file__), "data", "projects")
 
 
-@pytest.mark.skipif(not has_toml, reason="Requires toml package")
+@pytest.mark.requires_toml
 @pytest.mark.parametrize(
     "project,option,value",
     [
@@ -55,6 +53,7 @@ PROJECT_DIR = join(dirname(__file__), "data", "projects")
         ("all-attribs-ep", "--maintainer", "Manny Tainer"),
         ("all-attribs-ep", "--maintainer-email", "you@example.org"),
         ("all-attribs-ep", "--url", "https://example.net"),
+        ("setup-cfg-layout", "--version", "1.2.3"),
     ],
 )
 def test_setuptools_finalizer_with_toml(project, option, value):
@@ -69,7 +68,7 @@ def test_setuptools_finalizer_with_toml(project, option, value):
     assert r == value
 
 
-@pytest.mark.skipif(not has_toml, reason="Requires toml package")
+@pytest.mark.requires_toml
 @pytest.mark.parametrize(
     "project,errmsg",
     [
@@ -101,7 +100,7 @@ def test_setuptools_finalizer_with_toml_error(project, errmsg):
     assert errmsg in err
 
 
-@pytest.mark.skipif(not has_toml, reason="Requires toml package")
+@pytest.mark.requires_toml
 def test_setuptools_finalizer_with_toml_not_table_warning():
     p = Popen(
         ["python", "setup.py", "--version"],
@@ -120,7 +119,7 @@ def test_setuptools_finalizer_with_toml_not_table_warning():
     assert 'read_version: "tool.read_version" is not a table; ignoring' in err
 
 
-@pytest.mark.skipif(not has_toml, reason="Requires toml package")
+@pytest.mark.requires_toml
 def test_setuptools_finalizer_with_toml_unknown_field_warning():
     p = Popen(
         ["python", "setup.py", "--version"],
@@ -139,7 +138,7 @@ def test_setuptools_finalizer_with_toml_unknown_field_warning():
     assert "read_version: ignoring unknown field 'foobar'" in err
 
 
-@pytest.mark.skipif(has_toml, reason="Requires toml package not installed")
+@pytest.mark.requires_no_toml
 @pytest.mark.parametrize(
     "project,option,value",
     [
@@ -200,3 +199,209 @@ def test_setuptools_finalizer_without_toml(project, option, value):
         r = r.decode()
     r = r.rstrip("\r\n")
     assert r == value
+
+
+@pytest.mark.requires_toml
+def test_setuptools_finalizer_disk_cache(tmp_path):
+    env = dict(os.environ, READ_VERSION_CACHE_DIR=str(tmp_path))
+    for _ in range(2):
+        r = check_output(
+            ["python", "setup.py", "--version", "--author"],
+            cwd=join(PROJECT_DIR, "all-attribs"),
+            env=env,
+        )
+        assert r.decode().splitlines() == ["9001", "Joe Q. Author"]
+    assert exists(join(str(tmp_path), "read_version-cache.sqlite3"))
+
+
+@pytest.mark.parametrize(
+    "data,mentioned",
+    [
+        (b'[build-system]\nrequires = ["setuptools"]\n', False),
+        (b'[build-system]\nrequires = ["read_version ~= 0.3.0"]\n', False),
+        (b'[build-system]\nrequires = ["read_version[toml]"]\n', False),
+        (b'[build-system]\nrequires = ["read_version==0.3.2"]\n', False),
+        (b'[tool.read_version]\nversion = "foo:__version__"\n', True),
+        (b'[tool.read_version.version]\npath = ["foo.py"]\n', True),
+        (b'[tool."read_version"]\nversion = "foo:__version__"\n', True),
+        (b'[tool]\nread_version = "foo:__version__"\n', True),
+        (b'[tool]\nread_version.version = "foo:__version__"\n', True),
+    ],
+)
+def test_mentions_config(data, mentioned):
+    assert _mentions_config(data) is mentioned
+
+
+@pytest.mark.requires_toml
+def test_setuptools_finalizer_memoized(monkeypatch, tmp_path):
+    project = tmp_path / "project"
+    shutil.copytree(join(PROJECT_DIR, "all-attribs"), str(project))
+    monkeypatch.chdir(project)
+    calls = []
+    real_read_variables = read_version._read_variables
+
+    def counting_read_variables(*args, **kwargs):
+        calls.append(args)
+        return real_read_variables(*args, **kwargs)
+
+    monkeypatch.setattr(read_version, "_read_variables", counting_read_variables)
+    for _ in range(3):
+        dist = SimpleNamespace(metadata=SimpleNamespace())
+        setuptools_finalizer(dist)
+        assert dist.metadata.version == "9001"
+        assert dist.metadata.keywords == ["test", "metadata", "setuptools"]
+        dist.metadata.keywords.append("mutated")
+    assert len(calls) == 1
+    src = project / "foobar.py"
+    src.write_text(src.read_text().replace("9001", "9002"))
+    dist = SimpleNamespace(metadata=SimpleNamespace())
+    setuptools_finalizer(dist)
+    assert dist.metadata.version == "9002"
+    assert dist.metadata.keywords == ["test", "metadata", "setuptools"]
+    assert len(calls) == 2
+    pyproject = project / "pyproject.toml"
+    pyproject.write_text(pyproject.read_text().split("[tool.read_version.author]")[0])
+    dist = SimpleNamespace(metadata=SimpleNamespace())
+    setuptools_finalizer(dist)
+    assert dist.metadata.version == "9002"
+    assert not hasattr(dist.metadata, "author")
+    assert len(calls) == 3
+
+
+def make_tree(root, files):
+    for relpath, text in files.items():
+        path = root / relpath
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text)
+
+
+@pytest.mark.requires_toml
+@pytest.mark.parametrize(
+    "attrs",
+    [
+        {"package_dir": {"": "src"}, "packages": ["foobar", "foobar.sub"]},
+        {"package_dir": {"": "src"}},
+        {},
+    ],
+)
+def test_setuptools_finalizer_src_layout(monkeypatch, tmp_path, attrs):
+    make_tree(
+        tmp_path,
+        {
+            "pyproject.toml": (
+                "[tool.read_version]\n"
+                'version = "foobar:__version__"\n'
+                'author = "foobar.sub.info:__author__"\n'
+            ),
+            "src/foobar/__init__.py": '__version__ = "1.2.3"\n',
+            "src/foobar/sub/__init__.py": "",
+            "src/foobar/sub/info.py": '__author__ = "Me"\n',
+        },
+    )
+    monkeypatch.chdir(tmp_path)
+    read_version._finalizer_memo.clear()
+    dist = SimpleNamespace(metadata=SimpleNamespace(), **attrs)
+    setuptools_finalizer(dist)
+    assert dist.metadata.version == "1.2.3"
+    assert dist.metadata.author == "Me"
+
+
+@pytest.mark.requires_toml
+@pytest.mark.parametrize(
+    "setuptools_cfg",
+    [
+        '[tool.setuptools]\npackage-dir = {"" = "lib"}\npackages = ["foobar"]\n',
+        '[tool.setuptools.packages.find]\nwhere = ["lib"]\n',
+    ],
+)
+def test_setuptools_finalizer_pyproject_layout(monkeypatch, tmp_path, setuptools_cfg):
+    make_tree(
+        tmp_path,
+        {
+            "pyproject.toml": (
+                '[tool.read_version]\nversion = "foobar:__version__"\n\n'
+                + setuptools_cfg
+            ),
+            "foobar/__init__.py": '__version__ = "0.0-stale"\n',
+            "lib/foobar/__init__.py": '__version__ = "1.2.3"\n',
+        },
+    )
+    monkeypatch.chdir(tmp_path)
+    read_version._finalizer_memo.clear()
+    dist = SimpleNamespace(metadata=SimpleNamespace(), package_dir=None, packages=None)
+    setuptools_finalizer(dist)
+    assert dist.metadata.version == "1.2.3"
+    # Layout settings passed to setup() take precedence.
+    dist = SimpleNamespace(metadata=SimpleNamespace(), package_dir={}, packages=None)
+    setuptools_finalizer(dist)
+    assert dist.metadata.version == "0.0-stale"
+
+
+def test_declared_layout(tmp_path):
+    assert read_version._declared_layout(str(tmp_path)) == (None, None)
+    (tmp_path / "setup.cfg").write_text(
+        "[options]\npackage_dir = =src, other = lib/other\npackages =\n    a\n    a.b\n"
+    )
+    assert read_version._declared_layout(str(tmp_path)) == (
+        {"": "src", "other": "lib/other"},
+        ["a", "a.b"],
+    )
+
+
+def test_module_index(monkeypatch, tmp_path):
+    make_tree(
+        tmp_path,
+        {
+            "top.py": "",
+            "pkg.py": "",
+            "pkg/__init__.py": "",
+            "pkg/mod.py": "",
+            "ns/inner/mod.py": "",
+            "lib/other/__init__.py": "",
+            "lib/other/mod.py": "",
+            "src/top.py": "",
+            "src/srconly.py": "",
+            "not-a-package/mod.py": "",
+        },
+    )
+    scans = []
+    real_scandir = os.scandir
+
+    def counting_scandir(path):
+        scans.append(path)
+        return real_scandir(path)
+
+    monkeypatch.setattr(os, "scandir", counting_scandir)
+    modules = read_version._ModuleIndex(str(tmp_path))
+    assert modules.resolve("top") == str(tmp_path / "top.py")
+    assert modules.resolve("pkg") == str(tmp_path / "pkg" / "__init__.py")
+    assert modules.resolve("pkg.__init__") == str(tmp_path / "pkg" / "__init__.py")
+    assert modules.resolve("pkg.mod") == str(tmp_path / "pkg" / "mod.py")
+    assert modules.resolve("ns.inner.mod") == str(tmp_path / "ns" / "inner" / "mod.py")
+    assert modules.resolve("srconly") == str(tmp_path / "src" / "srconly.py")
+    assert modules.resolve("missing.mod") == str(tmp_path / "missing" / "mod.py")
+    n = len(scans)
+    assert modules.resolve("pkg.mod") == str(tmp_path / "pkg" / "mod.py")
+    assert len(scans) == n
+    assert not any("not-a-package" in str(p) for p in scans)
+
+    # Only the directories for the requested top-level names are walked.
+    scans.clear()
+    modules = read_version._ModuleIndex(str(tmp_path))
+    assert modules.resolve("pkg.mod") == str(tmp_path / "pkg" / "mod.py")
+    assert scans == [str(tmp_path / "pkg")]
+    assert modules.resolve("top") == str(tmp_path / "top.py")
+    assert scans == [str(tmp_path / "pkg")]
+
+    modules = read_version._ModuleIndex(
+        str(tmp_path), package_dir={"other": "lib/other"}
+    )
+    assert modules.resolve("other") == str(tmp_path / "lib" / "other" / "__init__.py")
+    assert modules.resolve("other.mod") == str(tmp_path / "lib" / "other" / "mod.py")
+    assert modules.resolve("srconly") == str(tmp_path / "srconly.py")
+
+    modules = read_version._ModuleIndex(
+        str(tmp_path), package_dir={"": "src"}, packages=[]
+    )
+    assert modules.resolve("top") == str(tmp_path / "src" / "top.py")
+    assert modules.resolve("srconly") == str(tmp_path / "src" / "srconly.py")
@@ -0,0 +1,141 @@
+import os
+from os.path import dirname, join
+from queue import Empty, Queue
+import shutil
+import sys
+from threading import Event, Thread
+import pytest
+from read_version import watch_versions
+
+PROJECT_DIR = join(dirname(__file__), "data", "projects")
+
+METHODS = [
+    pytest.param(True, id="polling"),
+    pytest.param(
+        False,
+        id="inotify",
+        marks=pytest.mark.skipif(
+            not sys.platform.startswith("linux"), reason="Requires inotify"
+        ),
+    ),
+]
+
+
+class Watch:
+    def __init__(self, specs, project_root, force_polling):
+        self.updates = Queue()
+        self.errors = Queue()
+        self.stop_event = Event()
+        # With inotify, changes should be noticed long before the interval
+        # elapses.
+        interval = 0.05 if force_polling else 30
+        self.thread = Thread(
+            target=watch_versions,
+            args=(specs, self.updates.put),
+            kwargs={
+                "project_root": str(project_root),
+                "interval": interval,
+                "stop_event": self.stop_event,
+                "on_error": self.errors.put,
+                "force_polling": force_polling,
+            },
+        )
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *_exc):
+        self.stop_event.set()
+        self.thread.join(60)
+
+    def next_update(self):
+        return self.updates.get(timeout=5)
+
+    def no_update(self):
+        with pytest.raises(Empty):
+            self.updates.get(timeout=0.3)
+
+
+def write(path, text):
+    # Replace the file atomically so that the watcher never sees it partially
+    # written.
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(text)
+    os.replace(str(tmp), str(path))
+
+
+@pytest.fixture
+def project(tmp_path):
+    (tmp_path / "pkg").mkdir()
+    (tmp_path / "pkg" / "__init__.py").write_text(
+        '__version__ = "1.0"\n__author__ = "Me"\n'
+    )
+    return tmp_path
+
+
+@pytest.mark.parametrize("force_polling", METHODS)
+def test_watch_versions(project, force_polling):
+    init = project / "pkg" / "__init__.py"
+    specs = {
+        "version": "pkg.__init__:__version__",
+        "author": {"path": ["pkg", "__init__.py"], "variable": "__author__"},
+        "custom": {"path": ["pkg", "__init__.py"], "variable": "x", "default": 0},
+    }
+    with Watch(specs, project, force_polling) as w:
+        assert w.next_update() == {"version": "1.0", "author": "Me", "custom": 0}
+        # File timestamps may be too coarse to distinguish quick successive
+        # writes, so the size of the file is changed every time.
+        write(init, '__version__ = "1.10"\n__author__ = "Me"\n')
+        assert w.next_update() == {"version": "1.10", "author": "Me", "custom": 0}
+        write(init, '__version__ = "1.10"\n__author__ = "Me"\n# comment\n')
+        w.no_update()
+        write(init, '__version__ = "1.10"\n__author__ = "Me"\nx = (\n')
+        assert isinstance(w.errors.get(timeout=5), SyntaxError)
+        w.no_update()
+        write(init, '__version__ = "1.2"\n__author__ = "Me"\nx = 3\n')
+        assert w.next_update() == {"version": "1.2", "author": "Me", "custom": 3}
+    assert w.errors.empty()
+
+
+@pytest.mark.requires_toml
+@pytest.mark.parametrize("force_polling", METHODS)
+def test_watch_versions_pyproject(tmp_path, force_polling):
+    project = tmp_path / "project"
+    shutil.copytree(join(PROJECT_DIR, "list-path"), str(project))
+    pyproject = project / "pyproject.toml"
+    with Watch(None, project, force_polling) as w:
+        first = w.next_update()
+        assert list(first) == ["version"]
+        original = pyproject.read_text()
+        write(
+            pyproject,
+            original.replace(
+                'path = ["foobar", "__init__.py"]', 'path = "foobar/__init__.py"'
+            ),
+        )
+        assert str(w.errors.get(timeout=5)) == (
+            '"path" key of tool.read_version.version must be a list'
+        )
+        write(pyproject, original)
+        w.no_update()
+    assert w.errors.empty()
+
+
+@pytest.mark.requires_toml
+@pytest.mark.parametrize("force_polling", METHODS)
+def test_watch_versions_setup_cfg_layout(tmp_path, force_polling):
+    project = tmp_path / "project"
+    shutil.copytree(join(PROJECT_DIR, "setup-cfg-layout"), str(project))
+    setup_cfg = project / "setup.cfg"
+    with Watch(None, project, force_polling) as w:
+        assert w.next_update() == {"version": "1.2.3"}
+        # Dropping package_dir changes where the module is found.
+        write(setup_cfg, "[metadata]\nname = foobar\n")
+        assert w.next_update() == {"version": "0.0-stale"}
+    assert w.errors.empty()
+
+
+def test_watch_versions_invalid_specs(tmp_path):
+    with pytest.raises(ValueError, match="Invalid specifier 'foo'"):
+        watch_versions({"version": "foo"}, print, project_root=str(tmp_path))
@@ -0,0 +1,190 @@
+import os
+from os.path import dirname, join
+import shutil
+import stat
+import pytest
+from read_version import read_version, write_version, write_versions
+
+DATA_DIR = join(dirname(__file__), "data")
+
+
+@pytest.mark.parametrize("fname", os.listdir(join(DATA_DIR, "valid")))
+def test_write_version(tmp_path, fname):
+    path = str(tmp_path / fname)
+    shutil.copyfile(join(DATA_DIR, "valid", fname), path)
+    with open(path, "rb") as fp:
+        before = fp.read()
+    assert write_version(path, value="10.20.30") == "1.2.3"
+    assert read_version(path) == "10.20.30"
+    assert read_version(path, variable="__custom__") == 42
+    with open(path, "rb") as fp:
+        after = fp.read()
+    # Only the line with the old literal has changed.
+    removed = set(before.splitlines()) - set(after.splitlines())
+    added = set(after.splitlines()) - set(before.splitlines())
+    assert len(removed) == len(added) == 1
+    (line,) = added
+    assert line.replace(b'"10.20.30"', b"") in [
+        old.replace(lit, b"") for old in removed for lit in (b'"1.2.3"', b'"1.2" ".3"')
+    ]
+
+
+def test_write_version_encoding(tmp_path):
+    path = str(tmp_path / "latin1.py")
+    shutil.copyfile(join(DATA_DIR, "valid", "latin1.py"), path)
+    write_version(path, value="1.2.3é")
+    with open(path, "rb") as fp:
+        assert fp.read() == (
+            b"# coding: iso-8859-1\n"
+            b'nonascii = "\xab\xd0\xff\xdf\xbb"\n'
+            b'__version__ = "1.2.3\xe9"\n'
+            b"__custom__ = 42\n"
+        )
+    # Characters that the encoding cannot represent are escaped.
+    write_version(path, value="1.2.3☃")
+    with open(path, "rb") as fp:
+        assert b'__version__ = "1.2.3\\u2603"\n' in fp.read()
+    assert read_version(path) == "1.2.3☃"
+
+
+@pytest.mark.parametrize(
+    "src,value,expected",
+    [
+        (b"__version__ = '1.2.3'\n", "2.0", b"__version__ = '2.0'\n"),
+        (b'__version__ = "1.2.3"\n', "it's", b'__version__ = "it\'s"\n'),
+        (b'__version__ = "1.2.3"\n', 'say "hi"', b"__version__ = 'say \"hi\"'\n"),
+        (b'__version__ = "1.2.3"\n', (2, 0), b"__version__ = (2, 0)\n"),
+        (
+            b'__version__ = (\r\n    "1.2"\r\n    ".3"\r\n)\r\nx = 1\r\n',
+            "2.0",
+            b'__version__ = (\r\n    "2.0"\r\n)\r\nx = 1\r\n',
+        ),
+        (b'x = 1\r__version__ = "1.0"\r', "2.0", b'x = 1\r__version__ = "2.0"\r'),
+        (
+            b'"""a\rb"""\rx = (1,\r  2)\r__version__ = (\r    "1.0"  # c\r)\ry = 1',
+            "2.0",
+            b'"""a\rb"""\rx = (1,\r  2)\r__version__ = (\r    "2.0"  # c\r)\ry = 1',
+        ),
+        (
+            b'\xef\xbb\xbfx = "\xc3\xa9"; __version__ = "1.2.3"  # \xc3\xa9\n',
+            "2.0",
+            b'\xef\xbb\xbfx = "\xc3\xa9"; __version__ = "2.0"  # \xc3\xa9\n',
+        ),
+        (
+            b'"""Docstring"""\n__version__ = "1.2.3"\n',
+            "2.0",
+            b'"""Docstring"""\n__version__ = "2.0"\n',
+        ),
+        (
+            b'x = """a\nb"""\n__version__ = """\n1.2.3"""\ny = 1\n',
+            "2.0",
+            b'x = """a\nb"""\n__version__ = "2.0"\ny = 1\n',
+        ),
+        (
+            b"@dec\ndef f():\n    pass\na = __version__ = ('1.2.3')  # c\n",
+            "2.0",
+            b"@dec\ndef f():\n    pass\na = __version__ = ('2.0')  # c\n",
+        ),
+        (
+            b'try:\n    pass\nexcept E:\n    pass\nx = 1; __version__ = "1.2.3"\n',
+            "2.0",
+            b'try:\n    pass\nexcept E:\n    pass\nx = 1; __version__ = "2.0"\n',
+        ),
+        (
+            b"x, __version__ = [f(a=1), ((1, 2)),]\n",
+            (3, 4),
+            b"x, __version__ = [f(a=1), ((3, 4)),]\n",
+        ),
+    ],
+)
+def test_write_version_source(tmp_path, src, value, expected):
+    path = tmp_path / "module.py"
+    path.write_bytes(src)
+    write_version(str(path), value=value)
+    assert path.read_bytes() == expected
+    assert read_version(str(path)) == value
+
+
+def test_write_version_occurrence(tmp_path):
+    path = str(tmp_path / "overwrite.py")
+    shutil.copyfile(join(DATA_DIR, "valid", "overwrite.py"), path)
+    assert write_version(path, value="1.0", occurrence="first") == "42"
+    assert read_version(path, occurrence="first") == "1.0"
+    assert read_version(path) == "1.2.3"
+
+
+def test_write_version_docstring(tmp_path):
+    path = tmp_path / "module.py"
+    path.write_text('"""Old docstring"""\n__version__ = "1.2.3"\n')
+    assert write_version(str(path), value="New", variable="__doc__") == (
+        "Old docstring"
+    )
+    assert path.read_text() == '"New"\n__version__ = "1.2.3"\n'
+
+
+@pytest.mark.parametrize(
+    "src,value,match",
+    [
+        ("x = 1\n", "1.0", "No assignment to '__version__' found in file"),
+        ("__version__ = get_version()\n", "1.0", "malformed node or string"),
+        ("__version__, x = VERSION\n", "1.0", "not a tuple or list display"),
+        ("__version__, *x = 1, *y\n", "1.0", "not a tuple or list display"),
+        ("__version__, x = 1, 2, 3\n", "1.0", "too many values to unpack"),
+        ('__version__ = "1.2.3"\n', object(), "cannot be written as a literal"),
+        ('__version__ = "1.2.3"\n', float("nan"), "cannot be written as a literal"),
+    ],
+)
+def test_write_version_error(tmp_path, src, value, match):
+    path = tmp_path / "module.py"
+    path.write_text(src)
+    with pytest.raises(ValueError, match=match):
+        write_version(str(path), value=value)
+    assert path.read_text() == src
+
+
+def test_write_version_permissions_and_symlink(tmp_path):
+    target = tmp_path / "module.py"
+    target.write_text('__version__ = "1.2.3"\n')
+    os.chmod(str(target), 0o754)
+    link = tmp_path / "link.py"
+    link.symlink_to(target)
+    write_version(str(link), value="2.0")
+    assert link.is_symlink()
+    assert target.read_text() == '__version__ = "2.0"\n'
+    assert stat.S_IMODE(os.stat(str(target)).st_mode) == 0o754
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["link.py", "module.py"]
+
+
+def test_write_version_relative():
+    with pytest.raises(FileNotFoundError):
+        write_version("data", "nonexistent.py", value="1.0")
+    with pytest.raises(TypeError):
+        write_version(b'__version__ = "1.2.3"\n', value="1.0")
+
+
+def test_write_versions(tmp_path):
+    files = {}
+    for i in range(5):
+        path = tmp_path / f"module{i}.py"
+        path.write_text(f'__version__ = "1.{i}"\n')
+        files[str(path)] = f"2.{i}"
+    assert write_versions(files) == {p: f"1.{i}" for i, p in enumerate(files)}
+    for p, v in files.items():
+        assert read_version(p) == v
+    assert write_versions(
+        [("module0.py", "3.0"), ("module1.py", "3.1")], base_dir=str(tmp_path)
+    ) == {"module0.py": "2.0", "module1.py": "2.1"}
+    assert read_version(str(tmp_path / "module1.py")) == "3.1"
+
+
+def test_write_versions_all_or_nothing(tmp_path):
+    good = tmp_path / "good.py"
+    good.write_text('__version__ = "1.0"\n')
+    bad = tmp_path / "bad.py"
+    bad.write_text("__version__ = compute()\n")
+    with pytest.raises(ValueError, match="bad.py: malformed node or string"):
+        write_versions({str(good): "2.0", str(bad): "2.0"})
+    assert good.read_text() == '__version__ = "1.0"\n'
+    with pytest.raises(ValueError, match="file given more than once"):
+        write_versions([(str(good), "2.0"), (str(good), "3.0")])
+    assert good.read_text() == '__version__ = "1.0"\n'